@@ -0,0 +1,90 @@
+"""Benchmark the DuckDB and Polars assembly engines table by table.
+
+Ingests the input once, then times the assembly of each data-derived table
+under every engine on a fresh connection and reports the winner per table:
+
+    python benchmarks/bench_engines.py --input /data/synpuf --first 1 --last 2
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import typer
+
+from scdm_prepare.connection import open_connection
+from scdm_prepare.engines import ENGINES
+from scdm_prepare.ingest import discover_subsamples, ingest_all
+from scdm_prepare.schema import TABLES
+from scdm_prepare.transform import assemble_tables, build_crosswalks
+
+app = typer.Typer(add_completion=False)
+
+
+def time_table(temp_dir: Path, table_name: str, engine: str, workers: int, buckets: int) -> float:
+    """Return the seconds taken to assemble one table with one engine.
+
+    Crosswalks are built before the timer starts, so only assembly is measured.
+
+    Args:
+        temp_dir: Directory containing ingested parquet files
+        table_name: Table to assemble
+        engine: Assembly engine name
+        workers: Maximum number of slices assembled concurrently
+        buckets: Number of PatID-range buckets per subsample slice
+
+    Returns:
+        Wall-clock assembly time in seconds
+    """
+    con = open_connection()
+    try:
+        build_crosswalks(con, temp_dir)
+        start = time.perf_counter()
+        assemble_tables(
+            con, temp_dir, workers=workers, buckets=buckets, engine=engine, tables=[table_name]
+        )
+        return time.perf_counter() - start
+    finally:
+        con.close()
+
+
+@app.command()
+def main(
+    input_dir: Path = typer.Option(..., "--input", file_okay=False, exists=True),
+    first: int | None = typer.Option(None, "--first"),
+    last: int | None = typer.Option(None, "--last"),
+    file_ext: str = typer.Option(".sas7bdat", "--file-ext"),
+    workers: int = typer.Option(1, "--workers", min=1),
+    buckets: int = typer.Option(1, "--buckets", min=1),
+    repeat: int = typer.Option(3, "--repeat", min=1, help="Runs per table and engine; the best is kept."),
+) -> None:
+    """Report the fastest assembly engine for each table."""
+    subsamples = discover_subsamples(input_dir, first, last, file_ext)
+    with tempfile.TemporaryDirectory() as work_dir:
+        ingest_all(input_dir, subsamples, work_dir, file_ext)
+        temp_dir = Path(work_dir) / "_temp"
+
+        engines = list(ENGINES)
+        typer.echo(f"{'table':<12}" + "".join(f"{name:>10}" for name in engines) + "  winner")
+        for table_name in TABLES:
+            if table_name in ("provider", "facility"):
+                continue
+            if not list(temp_dir.glob(f"{table_name}_*.parquet")):
+                continue
+            timings = {
+                engine: min(
+                    time_table(temp_dir, table_name, engine, workers, buckets)
+                    for _ in range(repeat)
+                )
+                for engine in engines
+            }
+            winner = min(timings, key=timings.get)
+            typer.echo(
+                f"{table_name:<12}"
+                + "".join(f"{timings[name]:>9.2f}s" for name in engines)
+                + f"  {winner}"
+            )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,106 @@
+"""Benchmark parquet writer settings on the claims tables.
+
+Builds the claims tables once, then exports each under several parquet
+settings and reports file size, write throughput, and the latency of a
+PatID point lookup and of a code lookup (DX, PX or Rx) against the file:
+
+    python benchmarks/bench_parquet.py --input /data/synpuf --first 1 --last 2
+"""
+
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+import typer
+
+from scdm_prepare.connection import open_connection
+from scdm_prepare.export import Layout, export_table
+from scdm_prepare.ingest import discover_subsamples, ingest_all
+from scdm_prepare.schema import ParquetSettings
+from scdm_prepare.transform import assemble_tables, build_crosswalks
+
+app = typer.Typer(add_completion=False)
+
+# DuckDB's default rows per row group
+DUCKDB_ROW_GROUP_SIZE = 122_880
+
+# Code column each table is scanned by; encounter has none
+CODE_COLUMNS = {"diagnosis": "DX", "procedure": "PX", "dispensing": "Rx", "encounter": None}
+
+# Settings compared, by name, each overriding the table presets; DuckDB's
+# defaults are spelled out since an unset setting keeps the preset's value
+SETTINGS = {
+    "duckdb defaults": ParquetSettings(row_group_size=DUCKDB_ROW_GROUP_SIZE),
+    "table presets": ParquetSettings(),
+    "presets, zstd 19": ParquetSettings(compression_level=19),
+    "61k row groups": ParquetSettings(row_group_size=61_440),
+    "no dictionaries": ParquetSettings(dictionary_size_limit=0),
+}
+
+
+def lookup_ms(path: Path, column: str, values: list) -> float:
+    """Return the median milliseconds to count the rows matching one value of a column."""
+    con = duckdb.connect()
+    try:
+        timings = []
+        for value in values:
+            start = time.perf_counter()
+            con.execute(f"SELECT COUNT(*) FROM read_parquet('{path}') WHERE {column} = ?", [value]).fetchone()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000
+    finally:
+        con.close()
+
+
+@app.command()
+def main(
+    input_dir: Path = typer.Option(..., "--input", file_okay=False, exists=True),
+    first: int | None = typer.Option(None, "--first"),
+    last: int | None = typer.Option(None, "--last"),
+    file_ext: str = typer.Option(".sas7bdat", "--file-ext"),
+    lookups: int = typer.Option(25, "--lookups", min=1, help="Lookups per table and setting; the median is kept."),
+) -> None:
+    """Report size, write throughput and lookup latency per parquet setting."""
+    subsamples = discover_subsamples(input_dir, first, last, file_ext)
+    tables = [name for name in CODE_COLUMNS if (input_dir / f"{name}_{subsamples[0]}{file_ext}").exists()]
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        ingest_all(input_dir, subsamples, work_dir, file_ext)
+        con = open_connection()
+        build_crosswalks(con, work_dir / "_temp")
+        assemble_tables(con, work_dir / "_temp", tables=tables)
+
+        rng = random.Random(0)
+        typer.echo(
+            f"{'table':<11}{'settings':<25}{'MB':>8}{'write s':>9}{'MB/s':>8}"
+            f"{'PatID ms':>10}{'code ms':>9}"
+        )
+        for table_name in tables:
+            patids = [row[0] for row in con.execute(f"SELECT DISTINCT PatID FROM {table_name}").fetchall()]
+            patids = rng.sample(patids, min(lookups, len(patids)))
+            code_column = CODE_COLUMNS[table_name]
+            codes = []
+            if code_column:
+                codes = [row[0] for row in con.execute(f"SELECT DISTINCT {code_column} FROM {table_name}").fetchall()]
+                codes = rng.sample(codes, min(lookups, len(codes)))
+
+            for name, settings in SETTINGS.items():
+                out_dir = work_dir / "out" / name
+                start = time.perf_counter()
+                export_table(con, table_name, out_dir, "parquet", layout=Layout(parquet=settings))
+                seconds = time.perf_counter() - start
+                path = out_dir / f"{table_name}.parquet"
+                megabytes = path.stat().st_size / 1e6
+                code_ms = f"{lookup_ms(path, code_column, codes):>9.1f}" if code_column else f"{'-':>9}"
+                typer.echo(
+                    f"{table_name:<11}{name:<25}{megabytes:>8.1f}{seconds:>9.2f}{megabytes / seconds:>8.1f}"
+                    f"{lookup_ms(path, 'PatID', patids):>10.1f}{code_ms}"
+                )
+        con.close()
+
+
+if __name__ == "__main__":
+    app()
@@ -1,17 +1,32 @@
 """CLI entry point for scdm-prepare."""
 
+import datetime
+import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from pathlib import Path
 
-import duckdb
+import polars as pl
 import typer
 
-from scdm_prepare.ingest import discover_subsamples, ingest_all
+from scdm_prepare.cohort import read_patients, resolve_new_patids
+from scdm_prepare.connection import open_connection
+from scdm_prepare.export import APPEND_STAGING_DIR, COMPRESSIONS, Layout, commit_appends
+from scdm_prepare.ingest import discover_subsamples
+from scdm_prepare.manifest import (
+    build_filters,
+    build_manifest,
+    id_offsets,
+    manifest_filters,
+    read_manifest,
+    write_manifest,
+)
+from scdm_prepare.merge import merge_shards
+from scdm_prepare.pipeline import build_pipeline, run_dag, table_closure
 from scdm_prepare.progress import PipelineProgress
-from scdm_prepare.schema import TABLES
-from scdm_prepare.transform import assemble_tables, build_crosswalks
-from scdm_prepare.export import export_all
+from scdm_prepare.schema import TABLES, ParquetSettings
+from scdm_prepare.targets import export_target, parse_ranges
 
 app = typer.Typer(
     name="scdm-prepare",
@@ -22,7 +37,28 @@ app = typer.Typer(
 class OutputFormat(str, Enum):
     parquet = "parquet"
     csv = "csv"
+    txt = "txt"
     json = "json"
+    arrow = "arrow"
+    xpt = "xpt"
+    duckdb = "duckdb"
+    postgres = "postgres"
+
+
+class PartitionBy(str, Enum):
+    samplenum = "samplenum"
+    year = "year"
+
+
+class Compression(str, Enum):
+    gzip = "gzip"
+    zstd = "zstd"
+    lz4 = "lz4"
+
+
+class Engine(str, Enum):
+    duckdb = "duckdb"
+    polars = "polars"
 
 
 @app.command()
@@ -35,16 +71,21 @@ def main(
         file_okay=False,
         resolve_path=True,
     ),
-    output_dir: Path = typer.Option(
-        ...,
+    output_dir: Path | None = typer.Option(
+        None,
         "--output",
         help="Directory for output files. Created if it does not exist.",
         resolve_path=True,
     ),
-    fmt: OutputFormat | None = typer.Option(
+    fmt: str | None = typer.Option(
         None,
         "--format",
-        help="Output format.",
+        help=(
+            "Output format: parquet, csv, txt (tab-delimited), json, arrow (IPC), xpt (SAS "
+            "transport, version 8), duckdb (one scdm.duckdb database with indexes and "
+            "join views) or postgres (bulk-loaded into --postgres-dsn). "
+            "Several, comma-separated (e.g. parquet,txt), are written from one build."
+        ),
     ),
     first: int | None = typer.Option(
         None,
@@ -56,11 +97,181 @@ def main(
         "--last",
         help="Last subsample number to process. Omit to process through the highest detected.",
     ),
+    ranges: str | None = typer.Option(
+        None,
+        "--ranges",
+        help="Comma-separated subsample ranges (e.g. 1-5,1-10,1-20) built from one ingest "
+        "into OUTPUT/<first>-<last>.",
+    ),
+    tables: str | None = typer.Option(
+        None,
+        "--tables",
+        help="Comma-separated tables to build (e.g. dispensing,demographic). Omit for all 9.",
+    ),
+    sample_fraction: float | None = typer.Option(
+        None,
+        "--sample-fraction",
+        help="Keep a deterministic, hash-selected fraction (e.g. 0.01) of each subsample's patients.",
+    ),
+    start_date: datetime.datetime | None = typer.Option(
+        None,
+        "--start-date",
+        formats=["%Y-%m-%d"],
+        help="Drop claims dated before this day (YYYY-MM-DD); enrollment spans are clipped.",
+    ),
+    end_date: datetime.datetime | None = typer.Option(
+        None,
+        "--end-date",
+        formats=["%Y-%m-%d"],
+        help="Drop claims dated after this day (YYYY-MM-DD); enrollment spans are clipped.",
+    ),
+    patients_file: Path | None = typer.Option(
+        None,
+        "--patients",
+        help="CSV of patients to keep: columns samplenum,PatID (original IDs) or PatID "
+        "(new IDs of a full build). Other patients' rows are skipped at ingest.",
+        exists=True,
+        dir_okay=False,
+        resolve_path=True,
+    ),
+    append_to: Path | None = typer.Option(
+        None,
+        "--append-to",
+        help="Existing build to append new, higher-numbered subsamples to. Replaces --output.",
+        file_okay=False,
+        resolve_path=True,
+    ),
+    shard: bool = typer.Option(
+        False,
+        "--shard",
+        help="Build one shard (a subsample range) as parquet for a later --merge.",
+    ),
+    merge: list[Path] | None = typer.Option(
+        None,
+        "--merge",
+        help="Merge shard builds (repeat for each shard directory) into --output instead of building.",
+        exists=True,
+        file_okay=False,
+        resolve_path=True,
+    ),
+    part_rows: int | None = typer.Option(
+        None,
+        "--part-rows",
+        min=1,
+        help="Split each table into OUTPUT/<table>/part-NNNNN files of at most N rows.",
+    ),
+    part_size: str | None = typer.Option(
+        None,
+        "--part-size",
+        help="Split each table into part files of about this size (e.g. 256MB, 1GB).",
+    ),
+    partition_by: PartitionBy | None = typer.Option(
+        None,
+        "--partition-by",
+        help=(
+            "Hive-partition each table into OUTPUT/<table>/samplenum=N/ directories, or "
+            "the tables dated by ADate/RxDate into OUTPUT/<table>/year=YYYY/ directories."
+        ),
+    ),
+    keep_partition_column: bool = typer.Option(
+        False,
+        "--keep-partition-column",
+        help="Also keep the --partition-by column inside the partitioned files.",
+    ),
+    compression: Compression | None = typer.Option(
+        None,
+        "--compression",
+        help=(
+            "Compress text and json output (gzip, zstd), e.g. to <table>.csv.gz, in "
+            "blocks compressed in parallel; or arrow record batches (lz4, zstd)."
+        ),
+    ),
+    row_group_size: int | None = typer.Option(
+        None,
+        "--row-group-size",
+        min=1,
+        help="Rows per parquet row group (default: each table's preset).",
+    ),
+    compression_level: int | None = typer.Option(
+        None,
+        "--compression-level",
+        min=1,
+        max=22,
+        help="Parquet zstd level, 1 (fastest) to 22 (smallest, for archival).",
+    ),
+    dictionary_size_limit: int | None = typer.Option(
+        None,
+        "--dictionary-size-limit",
+        min=0,
+        help=(
+            "Most distinct values a parquet column chunk may dictionary-encode; "
+            "dictionary-encoded columns also get bloom filters. 0 disables both."
+        ),
+    ),
+    bloom_filter_fpp: float | None = typer.Option(
+        None,
+        "--bloom-filter-fpp",
+        help="False positive ratio of the parquet bloom filters.",
+    ),
+    postgres_dsn: str | None = typer.Option(
+        None,
+        "--postgres-dsn",
+        envvar="SCDM_POSTGRES_DSN",
+        help=(
+            "PostgreSQL connection string (e.g. postgresql://user@host/db) that --format "
+            "postgres loads, over --workers connections per table."
+        ),
+    ),
     clean_temp: bool = typer.Option(
         False,
         "--clean-temp",
         help="Remove leftover temp files and exit.",
     ),
+    db_path: Path | None = typer.Option(
+        None,
+        "--db-path",
+        help="DuckDB database file for working tables. Omit for an in-memory database.",
+        dir_okay=False,
+        resolve_path=True,
+    ),
+    spill_dir: Path | None = typer.Option(
+        None,
+        "--spill-dir",
+        help="Directory where DuckDB spills sorts and joins that exceed --memory-limit.",
+        file_okay=False,
+        resolve_path=True,
+    ),
+    memory_limit: str | None = typer.Option(
+        None,
+        "--memory-limit",
+        help="DuckDB memory limit (e.g. 4GB). With --spill-dir, the build stays within it.",
+    ),
+    workers: int = typer.Option(
+        1,
+        "--workers",
+        min=1,
+        help="Number of pipeline steps, and of table slices, run concurrently.",
+    ),
+    export_workers: int | None = typer.Option(
+        None,
+        "--export-workers",
+        min=1,
+        help="Maximum number of tables exported at once. Omit to allow --workers.",
+    ),
+    buckets: int = typer.Option(
+        1,
+        "--buckets",
+        min=1,
+        help=(
+            "Split each subsample into N PatID buckets to cut peak join and sort memory to about 1/N. "
+            "Each bucket rescans the ingested files (N-1 extra scans); export is not bucketed."
+        ),
+    ),
+    engine: Engine = typer.Option(
+        Engine.duckdb,
+        "--engine",
+        help="Engine that assembles the tables: DuckDB SQL or streaming Polars.",
+    ),
     file_ext: str = typer.Option(
         ".sas7bdat",
         "--file-ext",
@@ -69,6 +280,16 @@ def main(
     ),
 ) -> None:
     """Combine SynPUF subsamples into 9 standardised SCDM tables."""
+    # --append-to writes into the existing build
+    if output_dir is None:
+        output_dir = append_to
+    if output_dir is None:
+        typer.echo("Error: --output is required", err=True)
+        raise typer.Exit(code=1)
+    if append_to is not None and output_dir != append_to:
+        typer.echo("Error: --output and --append-to must name the same directory", err=True)
+        raise typer.Exit(code=1)
+
     temp_dir = output_dir / "_temp"
 
     # Handle --clean-temp
@@ -80,57 +301,501 @@ def main(
             typer.echo("No temp directory to clean.")
         raise typer.Exit()
 
+    if bloom_filter_fpp is not None and not 0 < bloom_filter_fpp < 1:
+        typer.echo("Error: --bloom-filter-fpp must be between 0 and 1", err=True)
+        raise typer.Exit(code=1)
+    try:
+        part_bytes = _parse_size(part_size) if part_size is not None else None
+        fmt = _parse_formats(fmt) if fmt is not None else None
+    except ValueError as e:
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(code=1)
+    layout = Layout(
+        part_rows,
+        part_bytes,
+        partition_by.value if partition_by is not None else None,
+        keep_partition_column,
+        workers,
+        ParquetSettings(row_group_size, compression_level, dictionary_size_limit, bloom_filter_fpp),
+        compression.value if compression is not None else None,
+        postgres_dsn,
+    )
+
+    # Handle --merge: shards are already built, so no input is read
+    if merge:
+        _check_format(fmt, layout)
+        if layout.partition_by == "samplenum":
+            typer.echo("Error: --partition-by samplenum cannot be combined with --merge", err=True)
+            raise typer.Exit(code=1)
+        _merge(merge, output_dir, fmt, db_path, spill_dir, memory_limit, layout)
+        raise typer.Exit()
+
+    # Shards are always single parquet files, the format --merge reads
+    if shard:
+        fmt = _shard_format(fmt, layout)
+
+    if sample_fraction is not None and not 0 < sample_fraction <= 1:
+        typer.echo("Error: --sample-fraction must be greater than 0 and at most 1", err=True)
+        raise typer.Exit(code=1)
+
+    start_day = start_date.date() if start_date is not None else None
+    end_day = end_date.date() if end_date is not None else None
+    if start_day is not None and end_day is not None and start_day > end_day:
+        typer.echo("Error: --start-date must not be after --end-date", err=True)
+        raise typer.Exit(code=1)
+
+    patients = None
+    if patients_file is not None:
+        if sample_fraction is not None or append_to is not None:
+            typer.echo(
+                "Error: --patients cannot be combined with --sample-fraction or --append-to",
+                err=True,
+            )
+            raise typer.Exit(code=1)
+        patients = _read_patient_list(patients_file, whole_build=not (ranges or shard))
+
     # Validate required arguments for normal operation
     if input_dir is None:
         typer.echo("Error: --input is required", err=True)
         raise typer.Exit(code=1)
-    if fmt is None:
-        typer.echo("Error: --format is required", err=True)
-        raise typer.Exit(code=1)
+
+    # Appending continues the earlier build's format, tables, filters, layout
+    # and ID numbering
+    previous = None
+    if append_to is not None:
+        previous = _read_previous(append_to)
+        fmt = _inherit_format(previous, fmt)
+        if tables is None:
+            tables = ",".join(previous["tables"])
+        sample_fraction, start_day, end_day = _inherit_filters(previous, sample_fraction, start_day, end_day)
+        layout = _inherit_layout(previous, layout)
+    _check_format(fmt, layout)
+
+    # --ranges replaces --first/--last with several targets
+    targets = []
+    if ranges:
+        if first is not None or last is not None or append_to is not None or shard:
+            typer.echo(
+                "Error: --ranges cannot be combined with --first/--last, --append-to or --shard",
+                err=True,
+            )
+            raise typer.Exit(code=1)
+        targets = _parse_targets(ranges, fmt)
 
     if not input_dir.is_dir():
         typer.echo(f"Error: Input directory does not exist: {input_dir}", err=True)
         raise typer.Exit(code=1)
 
+    table_names, input_tables, crosswalk_keys = _resolve_tables(tables, previous)
+
     output_dir.mkdir(parents=True, exist_ok=True)
 
     typer.echo(f"Input:  {input_dir}")
     typer.echo(f"Output: {output_dir}")
-    typer.echo(f"Format: {fmt.value}")
+    if previous is not None:
+        typer.echo(f"Appending to subsamples: {previous['subsamples']}")
+    typer.echo(f"Format: {fmt}")
     if first is not None:
         typer.echo(f"First subsample: {first}")
     if last is not None:
         typer.echo(f"Last subsample:  {last}")
+    if targets:
+        typer.echo(f"Ranges: {', '.join(f'{a}-{b}' for a, b in targets)}")
+    if sample_fraction is not None:
+        typer.echo(f"Sample fraction: {sample_fraction}")
+    if start_day is not None or end_day is not None:
+        typer.echo(f"Dates: {start_day or '...'} to {end_day or '...'}")
+    if patients_file is not None:
+        typer.echo(f"Patients: {patients_file}")
+    if tables:
+        typer.echo(f"Tables: {', '.join(table_names)}")
+        typer.echo(f"Inputs: {', '.join(input_tables)}")
+    if db_path is not None:
+        typer.echo(f"Database: {db_path}")
+    if spill_dir is not None:
+        typer.echo(f"Spill directory: {spill_dir}")
+    if engine is not Engine.duckdb:
+        typer.echo(f"Engine: {engine.value}")
 
+    filters = build_filters(sample_fraction, start_day, end_day)
     progress = PipelineProgress()
+    export_stats = []
 
     try:
-        # 1. Discover subsamples
-        subsamples = discover_subsamples(input_dir, first, last, file_ext)
+        # 1. Discover subsamples (for --ranges, the union of every target's)
+        if targets:
+            target_subsamples = {
+                (a, b): discover_subsamples(input_dir, a, b, file_ext, input_tables)
+                for a, b in targets
+            }
+            subsamples = sorted(set().union(*target_subsamples.values()))
+        else:
+            subsamples = discover_subsamples(input_dir, first, last, file_ext, input_tables)
         typer.echo(f"Found subsamples: {subsamples}")
+        if previous is not None and previous["subsamples"]:
+            if subsamples[0] <= max(previous["subsamples"]):
+                raise ValueError(
+                    f"Appended subsamples must all be after {max(previous['subsamples'])}"
+                )
+        if patients is not None and "samplenum" not in patients.columns:
+            patients = resolve_new_patids(input_dir, subsamples, patients["PatID"], file_ext)
+        if patients is not None:
+            typer.echo(f"Patients to keep: {patients.height}")
 
-        # 2. Ingest (with per-table progress)
-        with progress.ingestion_tracker(total_files=len(TABLES)) as tracker:
-            ingest_all(input_dir, subsamples, output_dir, file_ext, progress=tracker)
+        # An append stages every output until all tables are done; drop
+        # whatever a failed append left behind
+        if previous is not None:
+            shutil.rmtree(output_dir / APPEND_STAGING_DIR, ignore_errors=True)
 
-        # 3. Transform (with per-table progress)
-        con = duckdb.connect()
+        # 2-4. Ingest, build crosswalks, assemble and export as a dependency
+        # DAG: each step starts as soon as the steps it needs have finished
+        con = open_connection(db_path, spill_dir, memory_limit)
         try:
-            build_crosswalks(con, str(temp_dir))
-            with progress.transform_tracker(total_tables=len(TABLES)) as tracker:
-                assemble_tables(con, str(temp_dir), progress=tracker)
+            with (
+                progress.ingestion_tracker(total_files=len(input_tables)) as ingest_tracker,
+                progress.transform_tracker(total_tables=len(table_names)) as transform_tracker,
+                progress.export_tracker(
+                    total_tables=len(table_names) * max(len(targets), 1)
+                ) as export_tracker,
+                ThreadPoolExecutor(max_workers=workers) as slice_pool,
+            ):
+                nodes = build_pipeline(
+                    con,
+                    input_dir,
+                    subsamples,
+                    output_dir,
+                    fmt,
+                    file_ext,
+                    buckets=buckets,
+                    engine=engine.value,
+                    tables=table_names,
+                    id_offsets=id_offsets(previous) if previous is not None else None,
+                    append=previous is not None,
+                    write_outputs=not targets,
+                    sample_fraction=sample_fraction,
+                    patients=patients,
+                    start_date=start_day,
+                    end_date=end_day,
+                    slice_pool=slice_pool,
+                    export_stats=export_stats,
+                    layout=layout,
+                    ingest_progress=ingest_tracker,
+                    transform_progress=transform_tracker,
+                    export_progress=export_tracker,
+                )
+                run_dag(
+                    nodes,
+                    workers=workers,
+                    limits={"export": export_workers} if export_workers else None,
+                )
+
+                # Each range target is cut from the tables assembled over all targets
+                target_manifests = {
+                    target: export_target(
+                        con,
+                        *target,
+                        target_subsamples[target],
+                        table_names,
+                        crosswalk_keys,
+                        output_dir / f"{target[0]}-{target[1]}",
+                        fmt,
+                        progress=export_tracker,
+                        filters=filters,
+                        layout=layout,
+                    )
+                    for target in targets
+                }
 
-            # 4. Export (with per-table progress)
-            with progress.export_tracker(total_tables=len(TABLES)) as tracker:
-                export_all(con, list(TABLES.keys()), str(output_dir), fmt.value, progress=tracker)
+            if previous is not None:
+                commit_appends(con, output_dir, fmt, table_names, layout)
+
+            # Record what each output directory now holds, for later appends
+            if targets:
+                for (a, b), manifest in target_manifests.items():
+                    write_manifest(output_dir / f"{a}-{b}", manifest)
+            else:
+                write_manifest(
+                    output_dir,
+                    build_manifest(
+                        con,
+                        fmt,
+                        subsamples,
+                        table_names,
+                        crosswalk_keys,
+                        previous,
+                        filters,
+                        parts={
+                            stats.table_name: list(stats.parts)
+                            for stats in export_stats
+                            if stats.parts is not None
+                        },
+                        layout=layout.manifest_entry(),
+                    ),
+                )
         finally:
             con.close()
 
+        for stats in sorted(export_stats, key=lambda stats: -stats.rows):
+            typer.echo(f"Exported {stats.summary()}")
+
         # 5. Cleanup temp on success
         shutil.rmtree(temp_dir)
+        if db_path is not None:
+            db_path.unlink(missing_ok=True)
+            Path(f"{db_path}.wal").unlink(missing_ok=True)
         typer.echo("Done. Temp files cleaned up.")
 
     except Exception as e:
         typer.echo(f"Error: {e}", err=True)
         typer.echo(f"Temp files preserved at: {temp_dir}", err=True)
         raise typer.Exit(code=1)
+
+
+def _check_format(fmt: str | None, layout: Layout) -> None:
+    """Exit with an error if no format is given or the layout does not suit it."""
+    if fmt is None:
+        typer.echo("Error: --format is required", err=True)
+        raise typer.Exit(code=1)
+    _check_compression(fmt, layout)
+    _check_database_layout(fmt, layout)
+
+
+def _shard_format(fmt: str | None, layout: Layout) -> str:
+    """Return the format of a --shard build, which is always single parquet files as --merge reads."""
+    if fmt is not None and fmt != OutputFormat.parquet.value:
+        typer.echo("Error: --shard builds are always parquet", err=True)
+        raise typer.Exit(code=1)
+    if not layout.single_file:
+        typer.echo(
+            "Error: --part-rows, --part-size and --partition-by cannot be combined with --shard",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+    return OutputFormat.parquet.value
+
+
+def _read_patient_list(patients_file: Path, whole_build: bool) -> pl.DataFrame:
+    """Read a --patients file, exiting with an error if it cannot be used.
+
+    Args:
+        patients_file: CSV file of patients to keep
+        whole_build: False for --ranges and --shard builds, where new PatIDs
+            do not identify patients because they number only part of a build
+    """
+    try:
+        patients = read_patients(patients_file)
+    except ValueError as e:
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(code=1)
+    if "samplenum" not in patients.columns and not whole_build:
+        typer.echo(
+            "Error: --patients with new PatIDs cannot be combined with --ranges or --shard",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+    return patients
+
+
+def _read_previous(append_to: Path) -> dict:
+    """Read the manifest of the --append-to build, exiting with an error if it is unusable."""
+    try:
+        return read_manifest(append_to)
+    except ValueError as e:
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(code=1)
+
+
+def _inherit_format(previous: dict, fmt: str | None) -> str:
+    """Return the --append-to build's format, exiting if --format names another."""
+    if fmt is None:
+        fmt = previous["format"]
+    if fmt != previous["format"]:
+        typer.echo(f"Error: --append-to build is in {previous['format']} format", err=True)
+        raise typer.Exit(code=1)
+    return fmt
+
+
+def _inherit_filters(
+    previous: dict,
+    sample_fraction: float | None,
+    start_day: datetime.date | None,
+    end_day: datetime.date | None,
+) -> tuple[float | None, datetime.date | None, datetime.date | None]:
+    """Return the sample fraction and date window appended subsamples are filtered by.
+
+    Without filter options the --append-to build's filters are reused;
+    given ones must match them, so every subsample is filtered alike.
+    """
+    previous_filters = manifest_filters(previous)
+    if not build_filters(sample_fraction, start_day, end_day):
+        sample_fraction = previous_filters.get("sample_fraction")
+        window = previous_filters.get("date_window", {})
+        start_day = _parse_day(window.get("start"))
+        end_day = _parse_day(window.get("end"))
+    if build_filters(sample_fraction, start_day, end_day) != previous_filters:
+        typer.echo(
+            f"Error: --append-to build used different filters: {previous_filters or 'none'}",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+    return sample_fraction, start_day, end_day
+
+
+def _inherit_layout(previous: dict, layout: Layout) -> Layout:
+    """Return the layout appended tables are written in: the --append-to build's.
+
+    Without layout options the recorded layout is reused, keeping the
+    settings a manifest does not record; given ones must match it.
+    """
+    previous_layout = previous.get("layout", {})
+    if not layout.manifest_entry():
+        layout = Layout(
+            **previous_layout,
+            workers=layout.workers,
+            parquet=layout.parquet,
+            postgres_dsn=layout.postgres_dsn,
+        )
+    if layout.manifest_entry() != previous_layout:
+        typer.echo(
+            f"Error: --append-to build used a different layout: {previous_layout or 'single files'}",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+    return layout
+
+
+def _resolve_tables(
+    tables: str | None, previous: dict | None
+) -> tuple[list[str], list[str], list[str]]:
+    """Resolve --tables to the output tables and the inputs and crosswalks they need.
+
+    Exits with an error for an unknown table, or when appending a different
+    set of tables than the --append-to build holds.
+
+    Returns:
+        Output table names, input table names and crosswalk keys
+    """
+    if tables:
+        table_names = list(dict.fromkeys(name.strip() for name in tables.split(",") if name.strip()))
+    else:
+        table_names = list(TABLES)
+    try:
+        input_tables, crosswalk_keys = table_closure(table_names)
+    except ValueError as e:
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(code=1)
+    if previous is not None and set(table_names) != set(previous["tables"]):
+        typer.echo(
+            f"Error: --append-to build has tables: {', '.join(previous['tables'])}", err=True
+        )
+        raise typer.Exit(code=1)
+    return table_names, input_tables, crosswalk_keys
+
+
+def _parse_targets(ranges: str, fmt: str) -> list[tuple[int, int]]:
+    """Parse --ranges into (first, last) targets, exiting with an error if it is invalid."""
+    # Every target would load the same PostgreSQL tables
+    if OutputFormat.postgres.value in fmt.split(","):
+        typer.echo("Error: --format postgres cannot be combined with --ranges", err=True)
+        raise typer.Exit(code=1)
+    try:
+        return parse_ranges(ranges)
+    except ValueError as e:
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(code=1)
+
+
+def _parse_formats(value: str) -> str:
+    """Check a --format value and return it without spaces or repeats, e.g. "parquet,csv"."""
+    formats = list(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    choices = [choice.value for choice in OutputFormat]
+    unknown = [name for name in formats if name not in choices]
+    if unknown or not formats:
+        names = ", ".join(unknown) or repr(value)
+        raise ValueError(f"Unknown format {names}; choose from {', '.join(choices)}")
+    return ",".join(formats)
+
+
+def _check_compression(fmt: str, layout: Layout) -> None:
+    """Exit with an error if --compression does not suit the output formats."""
+    if layout.compression is None:
+        return
+    formats = fmt.split(",")
+    if not any(name in COMPRESSIONS for name in formats):
+        typer.echo(
+            "Error: --compression applies to text, json and arrow output; parquet is always zstd",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+    unsuited = [name for name in formats if name in COMPRESSIONS and layout.compression not in COMPRESSIONS[name]]
+    if unsuited:
+        typer.echo(
+            f"Error: --compression {layout.compression} does not apply to {', '.join(unsuited)} output",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+
+
+def _check_database_layout(fmt: str, layout: Layout) -> None:
+    """Exit with an error if database output lacks a DSN or is given a file layout."""
+    formats = fmt.split(",")
+    databases = (OutputFormat.duckdb.value, OutputFormat.postgres.value)
+    if OutputFormat.postgres.value in formats and layout.postgres_dsn is None:
+        typer.echo("Error: --format postgres needs --postgres-dsn (or SCDM_POSTGRES_DSN)", err=True)
+        raise typer.Exit(code=1)
+    if all(name in databases for name in formats) and not layout.single_file:
+        typer.echo(
+            f"Error: --part-rows, --part-size and --partition-by do not apply to {fmt} output",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+
+
+def _parse_size(value: str) -> int:
+    """Parse a size such as "256MB" or "1.5GB" (powers of 1000) into bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(B|KB|MB|GB|TB)?\s*", value, re.IGNORECASE)
+    if match is None or float(match.group(1)) <= 0:
+        raise ValueError(f"Invalid size: {value!r}")
+    units = {"B": 1, "KB": 10**3, "MB": 10**6, "GB": 10**9, "TB": 10**12}
+    return int(float(match.group(1)) * units[(match.group(2) or "B").upper()])
+
+
+def _parse_day(value: str | None) -> datetime.date | None:
+    """Parse an ISO date recorded in a manifest."""
+    return datetime.date.fromisoformat(value) if value is not None else None
+
+
+def _merge(
+    shard_dirs: list[Path],
+    output_dir: Path,
+    fmt: str,
+    db_path: Path | None,
+    spill_dir: Path | None,
+    memory_limit: str | None,
+    layout: Layout,
+) -> None:
+    """Merge shard builds into output_dir, exiting with an error on failure."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    typer.echo(f"Merging: {', '.join(str(shard_dir) for shard_dir in shard_dirs)}")
+    typer.echo(f"Output: {output_dir}")
+    typer.echo(f"Format: {fmt}")
+
+    progress = PipelineProgress()
+    try:
+        total_tables = len(read_manifest(shard_dirs[0])["tables"])
+        con = open_connection(db_path, spill_dir, memory_limit)
+        try:
+            with progress.export_tracker(total_tables=total_tables) as tracker:
+                manifest = merge_shards(
+                    con, shard_dirs, output_dir, fmt, progress=tracker, layout=layout
+                )
+            write_manifest(output_dir, manifest)
+        finally:
+            con.close()
+        if db_path is not None:
+            db_path.unlink(missing_ok=True)
+            Path(f"{db_path}.wal").unlink(missing_ok=True)
+        typer.echo(f"Done. Merged subsamples: {manifest['subsamples']}")
+    except Exception as e:
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(code=1)
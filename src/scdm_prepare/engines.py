@@ -0,0 +1,396 @@
+"""Assembly engines: compile a TableDef-driven plan to DuckDB SQL or a Polars LazyFrame."""
+
+import shutil
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import duckdb
+import polars as pl
+
+from scdm_prepare.schema import CROSSWALKS, TableDef
+
+
+@dataclass(frozen=True)
+class CrosswalkJoin:
+    """Join of a source ID column to its crosswalk."""
+
+    id_column: str
+    crosswalk_name: str
+    how: str
+
+
+@dataclass(frozen=True)
+class AssemblyPlan:
+    """Engine-independent plan for assembling one table, or one slice of it."""
+
+    target: str
+    columns: tuple[str, ...]
+    joins: tuple[CrosswalkJoin, ...]
+    sort_keys: tuple[str, ...]
+    source: str
+    samplenum: int | None = None
+    patid_range: tuple[int, int] | None = None
+    presorted: bool = False
+
+
+def build_plan(
+    table_def: TableDef,
+    temp_dir: Path | str,
+    target: str | None = None,
+    samplenum: int | None = None,
+    patid_range: tuple[int, int] | None = None,
+    presorted_file: Path | None = None,
+) -> AssemblyPlan:
+    """Build the assembly plan for a table or one of its slices.
+
+    Args:
+        table_def: Definition of the table to assemble
+        temp_dir: Directory containing ingested parquet files
+        target: Name of the table the plan produces (None = table_def.name)
+        samplenum: Restrict to a single subsample (None = all subsamples)
+        patid_range: Restrict to new PatIDs in this inclusive range (None = all)
+        presorted_file: The slice's single source file, already sorted by the
+            table's sort keys (None = read every file and sort by sort keys)
+
+    Returns:
+        AssemblyPlan ready to be run by any engine
+    """
+    joins = tuple(
+        CrosswalkJoin(id_col, _get_crosswalk_name(id_col), join_type.lower())
+        for id_col, join_type in table_def.crosswalk_ids.items()
+    )
+    if presorted_file is not None:
+        source = str(presorted_file)
+    else:
+        source = str(Path(temp_dir) / f"{table_def.name}_*.parquet")
+
+    return AssemblyPlan(
+        target=target or table_def.name,
+        columns=table_def.columns,
+        joins=joins,
+        sort_keys=table_def.sort_keys,
+        source=source,
+        samplenum=samplenum,
+        patid_range=patid_range,
+        presorted=presorted_file is not None,
+    )
+
+
+class DuckDBEngine:
+    """Assemble plans as DuckDB SQL, writing each result to a DuckDB table."""
+
+    name = "duckdb"
+
+    def prepare(self, con: duckdb.DuckDBPyConnection, temp_dir: Path) -> None:
+        """Nothing to prepare: crosswalks are already DuckDB tables."""
+
+    def compile(self, plan: AssemblyPlan) -> str:
+        """Compile a plan to a SELECT ... ORDER BY statement.
+
+        DuckDB's hash joins do not preserve input order, so a known-sorted
+        source still needs an ORDER BY after the crosswalk joins. For such a
+        source the multi-column sort on the table's keys is replaced by a sort
+        on the file's row number, a single integer key that restores the same order.
+
+        Args:
+            plan: Plan to compile
+
+        Returns:
+            SQL query producing the assembled, sorted table or slice
+        """
+        # Build the SELECT clause with proper column selections
+        select_parts = []
+        join_clauses = []
+        join_aliases = {}
+
+        # Track which alias to use for each crosswalk
+        alias_counter = {"b": ord("b")}
+        joined_columns = {join.id_column for join in plan.joins}
+
+        for col in plan.columns:
+            if col in joined_columns:
+                # This column comes from a crosswalk
+                crosswalk_name = _get_crosswalk_name(col)
+                alias = _get_or_create_alias(join_aliases, crosswalk_name, alias_counter)
+                select_parts.append(f"{alias}.{col}")
+            else:
+                # This column comes from the source data
+                select_parts.append(f"a.{col}")
+
+        select_clause = ", ".join(select_parts)
+
+        # Build JOIN clauses based on crosswalk_ids
+        for join in plan.joins:
+            id_col = join.id_column
+            alias = _get_or_create_alias(join_aliases, join.crosswalk_name, alias_counter)
+
+            # For source data, we need to determine the original column name
+            orig_col = f"a.{id_col}"
+
+            # Within a subsample slice, only that subsample's crosswalk rows can
+            # match, so keep the other subsamples out of the join's hash table
+            crosswalk_source = join.crosswalk_name
+            if plan.samplenum is not None:
+                crosswalk_source = (
+                    f"(SELECT * FROM {join.crosswalk_name} WHERE samplenum = {plan.samplenum})"
+                )
+
+            if join.how == "inner":
+                join_clauses.append(
+                    f"INNER JOIN {crosswalk_source} AS {alias}\n"
+                    f"  ON {orig_col} = {alias}.orig_{id_col} AND a.samplenum = {alias}.samplenum"
+                )
+            else:  # LEFT
+                join_clauses.append(
+                    f"LEFT JOIN {crosswalk_source} AS {alias}\n"
+                    f"  ON {orig_col} = {alias}.orig_{id_col} AND a.samplenum = {alias}.samplenum"
+                )
+
+        # Build FROM clause with glob pattern, or the single presorted file
+        if plan.presorted:
+            from_clause = f"read_parquet('{plan.source}', file_row_number = true) AS a"
+        else:
+            from_clause = f"read_parquet('{plan.source}') AS a"
+
+        # Restrict to one subsample (parquet statistics prune the other files)
+        # and optionally to one bucket of new PatIDs
+        where_parts = []
+        if plan.samplenum is not None:
+            where_parts.append(f"a.samplenum = {plan.samplenum}")
+        if plan.patid_range is not None:
+            patid_alias = join_aliases[_get_crosswalk_name("PatID")]
+            where_parts.append(
+                f"{patid_alias}.PatID BETWEEN {plan.patid_range[0]} AND {plan.patid_range[1]}"
+            )
+        where_clause = f"WHERE {' AND '.join(where_parts)}" if where_parts else ""
+
+        # Build ORDER BY clause
+        order_parts = []
+        for sort_key in plan.sort_keys:
+            if sort_key in joined_columns:
+                # Sort key comes from a crosswalk
+                crosswalk_name = _get_crosswalk_name(sort_key)
+                alias = join_aliases.get(crosswalk_name, "")
+                if alias:
+                    order_parts.append(f"{alias}.{sort_key}")
+                else:
+                    order_parts.append(f"{sort_key}")
+            else:
+                # Sort key comes from source data
+                order_parts.append(f"a.{sort_key}")
+
+        order_by_clause = ", ".join(order_parts)
+        if plan.presorted:
+            order_by_clause = "a.file_row_number"
+
+        return f"""
+        SELECT {select_clause}
+        FROM {from_clause}
+        {chr(10).join(join_clauses)}
+        {where_clause}
+        ORDER BY {order_by_clause}
+        """
+
+    def assemble(self, con: duckdb.DuckDBPyConnection, plan: AssemblyPlan) -> str:
+        """Run a plan on its own cursor into the DuckDB table plan.target.
+
+        Cursors share the database (and its memory limit) with ``con`` but can
+        run queries concurrently from separate threads.
+
+        Args:
+            con: DuckDB connection
+            plan: Plan to run
+
+        Returns:
+            SQL relation holding the result, in sort order
+        """
+        cursor = con.cursor()
+        try:
+            cursor.execute(f"CREATE OR REPLACE TABLE {plan.target} AS\n{self.compile(plan)}")
+        finally:
+            cursor.close()
+        return plan.target
+
+    def release(self, con: duckdb.DuckDBPyConnection, plan: AssemblyPlan) -> None:
+        """Drop the working table written by assemble()."""
+        con.execute(f"DROP TABLE IF EXISTS {plan.target}")
+
+
+class PolarsEngine:
+    """Assemble plans as Polars LazyFrames, streamed to parquet with sink_parquet.
+
+    Each crosswalk is copied out of DuckDB to parquet the first time a plan
+    joins it. Joins use ``maintain_order="left"``, so unlike DuckDB a
+    known-sorted source needs no sort at all.
+    """
+
+    name = "polars"
+
+    def __init__(self):
+        """Initialise the engine; the working directory is set by prepare()."""
+        self.work_dir: Path | None = None
+        self._exported: set[str] = set()
+        self._export_lock = threading.Lock()
+
+    def prepare(self, con: duckdb.DuckDBPyConnection, temp_dir: Path) -> None:
+        """Create an empty working directory under temp_dir.
+
+        Args:
+            con: DuckDB connection (unused; crosswalks are exported on first use)
+            temp_dir: Directory containing ingested parquet files
+        """
+        self.work_dir = Path(temp_dir) / "_polars"
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        self.work_dir.mkdir(parents=True)
+        self._exported.clear()
+
+    def _export_crosswalks(self, con: duckdb.DuckDBPyConnection, plan: AssemblyPlan) -> None:
+        """Write the crosswalks a plan joins to parquet, once per run.
+
+        Args:
+            con: DuckDB connection holding the crosswalk tables
+            plan: Plan about to be compiled
+        """
+        with self._export_lock:
+            for join in plan.joins:
+                name = join.crosswalk_name
+                if name in self._exported:
+                    continue
+                cursor = con.cursor()
+                try:
+                    cursor.execute(f"COPY {name} TO '{self.work_dir / name}.parquet' (FORMAT parquet)")
+                finally:
+                    cursor.close()
+                self._exported.add(name)
+
+    def compile(self, plan: AssemblyPlan) -> pl.LazyFrame:
+        """Compile a plan to a LazyFrame of scans, joins and a sort.
+
+        Args:
+            plan: Plan to compile
+
+        Returns:
+            LazyFrame producing the assembled, sorted table or slice
+        """
+        frame = pl.scan_parquet(plan.source).with_columns(pl.col("samplenum").cast(pl.Int64))
+        if plan.samplenum is not None:
+            frame = frame.filter(pl.col("samplenum") == plan.samplenum)
+
+        for join in plan.joins:
+            id_col = join.id_column
+            crosswalk = pl.scan_parquet(self.work_dir / f"{join.crosswalk_name}.parquet")
+            key_dtype = crosswalk.collect_schema()[f"orig_{id_col}"]
+            crosswalk = crosswalk.select(
+                pl.col(f"orig_{id_col}"),
+                pl.col("samplenum").cast(pl.Int64),
+                pl.col(id_col).alias(f"__new_{id_col}"),
+            )
+            if plan.samplenum is not None:
+                crosswalk = crosswalk.filter(pl.col("samplenum") == plan.samplenum)
+            frame = frame.with_columns(
+                pl.col(id_col).cast(key_dtype, strict=False).alias(f"__key_{id_col}")
+            ).join(
+                crosswalk,
+                left_on=[f"__key_{id_col}", "samplenum"],
+                right_on=[f"orig_{id_col}", "samplenum"],
+                how=join.how,
+                maintain_order="left",
+            )
+
+        if plan.patid_range is not None:
+            frame = frame.filter(pl.col("__new_PatID").is_between(*plan.patid_range))
+
+        joined_columns = {join.id_column for join in plan.joins}
+        frame = frame.select(
+            pl.col(f"__new_{col}").alias(col) if col in joined_columns else pl.col(col)
+            for col in plan.columns
+        )
+        if not plan.presorted:
+            frame = frame.sort(list(plan.sort_keys), nulls_last=True, maintain_order=True)
+        return frame
+
+    def assemble(self, con: duckdb.DuckDBPyConnection, plan: AssemblyPlan) -> str:
+        """Stream a plan to a parquet file with sink_parquet.
+
+        Args:
+            con: DuckDB connection holding the crosswalk tables
+            plan: Plan to run
+
+        Returns:
+            SQL relation reading the result, in sort order
+        """
+        self._export_crosswalks(con, plan)
+        output_path = self.work_dir / f"{plan.target}.parquet"
+        self.compile(plan).sink_parquet(output_path)
+        return f"read_parquet('{output_path}')"
+
+    def release(self, con: duckdb.DuckDBPyConnection, plan: AssemblyPlan) -> None:
+        """Delete the parquet file written by assemble()."""
+        (self.work_dir / f"{plan.target}.parquet").unlink(missing_ok=True)
+
+
+ENGINES = {
+    DuckDBEngine.name: DuckDBEngine,
+    PolarsEngine.name: PolarsEngine,
+}
+
+
+def get_engine(name: str) -> DuckDBEngine | PolarsEngine:
+    """Create an assembly engine by name.
+
+    Args:
+        name: Engine name ("duckdb" or "polars")
+
+    Returns:
+        New engine instance
+
+    Raises:
+        ValueError: If the engine name is not supported
+    """
+    engine_class = ENGINES.get(name)
+    if engine_class is None:
+        raise ValueError(f"Unsupported engine: {name}")
+    return engine_class()
+
+
+def _get_crosswalk_name(id_column: str) -> str:
+    """Map an ID column name to its corresponding crosswalk name.
+
+    Args:
+        id_column: Column name (e.g., "PatID", "EncounterID")
+
+    Returns:
+        Crosswalk table name (e.g., "patid_crosswalk", "encounterid_crosswalk")
+
+    Raises:
+        ValueError: If no crosswalk is defined for the given column
+    """
+    mapping = {cw.id_column: cw.crosswalk_name for cw in CROSSWALKS.values()}
+    crosswalk_name = mapping.get(id_column)
+    if crosswalk_name is None:
+        raise ValueError(f"no crosswalk defined for column: {id_column}")
+    return crosswalk_name
+
+
+def _get_or_create_alias(
+    join_aliases: dict[str, str], crosswalk_name: str, alias_counter: dict[str, int]
+) -> str:
+    """Get or create an alias for a crosswalk in JOIN clauses.
+
+    Args:
+        join_aliases: Dictionary mapping crosswalk names to aliases
+        crosswalk_name: Name of the crosswalk table
+        alias_counter: Counter for generating new aliases
+
+    Returns:
+        Single-character alias (b, c, d, etc.)
+    """
+    if crosswalk_name not in join_aliases:
+        # Create new alias
+        next_ord = alias_counter["b"]
+        alias = chr(next_ord)
+        join_aliases[crosswalk_name] = alias
+        alias_counter["b"] = next_ord + 1
+
+    return join_aliases[crosswalk_name]
@@ -1,10 +1,198 @@
-"""Export assembled SCDM tables from DuckDB to parquet, CSV, or NDJSON format."""
+"""Export assembled SCDM tables from DuckDB to parquet, Arrow IPC, CSV, tab-delimited text, NDJSON, SAS transport files, a DuckDB database, or PostgreSQL."""
 
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 
 import duckdb
+import pyarrow as pa
+import pyreadstat
 
 from scdm_prepare.progress import ProgressTracker
+from scdm_prepare.schema import CROSSWALKS, SORTED_BY_METADATA_KEY, TABLES, ParquetSettings
+from scdm_prepare.transform import output_id_columns
+from scdm_prepare.xport import write_xport, xport_variables
+
+_FILE_EXTENSIONS = {
+    "parquet": ".parquet",
+    "csv": ".csv",
+    "txt": ".txt",
+    "json": ".json",
+    "arrow": ".arrow",
+    "xpt": ".xpt",
+}
+
+# Formats that load a database rather than writing a file per table
+_DATABASE_FORMATS = ("duckdb", "postgres")
+
+# Field delimiters of the delimited text formats; txt matches SAS PROC EXPORT DBMS=TAB
+_DELIMITERS = {
+    "csv": ",",
+    "txt": "\t",
+}
+
+
+# Rows written to estimate the bytes per row of a size-bounded part
+_SIZE_SAMPLE_ROWS = 100_000
+
+# Hive partition directory value that readers take as NULL
+_HIVE_NULL = "__HIVE_DEFAULT_PARTITION__"
+
+# Suffixes of compressed csv and json files
+_COMPRESSION_EXTENSIONS = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+# Rows per independently compressed block (gzip member or zstd frame)
+_COMPRESSION_BLOCK_ROWS = 250_000
+
+# Compression codecs each format can use; parquet is always zstd
+COMPRESSIONS = {
+    "csv": ("gzip", "zstd"),
+    "txt": ("gzip", "zstd"),
+    "json": ("gzip", "zstd"),
+    "arrow": ("lz4", "zstd"),
+}
+
+# Formats compressed as a whole file, which gains a suffix such as .gz
+_COMPRESSED_TEXT = ("csv", "txt", "json")
+
+# Rows per Arrow IPC record batch
+_ARROW_BATCH_ROWS = 1_000_000
+
+# Rows per record batch streamed into a SAS transport file
+_XPORT_BATCH_ROWS = 250_000
+
+# The duckdb format writes every table into this one file of the output directory
+DATABASE_FILE = "scdm.duckdb"
+
+# Where append_table() writes, under the output directory, until commit_appends()
+APPEND_STAGING_DIR = Path("_temp") / "append"
+
+# Columns indexed in every table of a DuckDB database that has them
+_INDEXED_COLUMNS = ("PatID", "EncounterID")
+
+# Views of a DuckDB database: name -> (table, table joined to its rows by EncounterID)
+_JOIN_VIEWS = {
+    "encounter_diagnosis": ("diagnosis", "encounter"),
+    "encounter_procedure": ("procedure", "encounter"),
+}
+
+# Serialises attaching output databases to a connection shared by export threads
+_ATTACH_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Layout:
+    """How each table's rows are split across output files and written.
+
+    By default a table is one file, ``<table>.<ext>``. With ``part_rows`` or
+    ``part_bytes`` it is instead a directory of part files,
+    ``<table>/part-00000.<ext>``, ..., holding consecutive runs of the
+    table's rows, so concatenating the parts in name order gives the table
+    in its sort order. With ``partition_by="samplenum"`` the directory is
+    hive-partitioned, ``<table>/samplenum=N/part.<ext>`` (or part-NNNNN
+    files when also split), so readers can prune subsamples. With
+    ``partition_by="year"`` the tables dated by one service date (ADate or
+    RxDate) are partitioned by its year, ``<table>/year=YYYY/part-NNNNN.<ext>``,
+    so date-range queries read only their years; other tables keep the
+    unpartitioned layout. ``parquet`` overrides the tables' parquet writer
+    presets, and ``compression`` compresses text and json files, e.g. to
+    ``<table>.csv.gz``, or the record batches of Arrow IPC files. The
+    postgres format loads each table over ``workers`` connections into the
+    database at ``postgres_dsn``.
+    """
+
+    # Most rows in one part file
+    part_rows: int | None = None
+    # Approximate largest size of one part file, estimated from a sample
+    part_bytes: int | None = None
+    # Hive partition column: "samplenum", "year", or None for no partitions
+    partition_by: str | None = None
+    # Also keep the partition column inside the files
+    keep_partition_column: bool = False
+    # Number of part files written at once
+    workers: int = 1
+    # Parquet writer settings that override each table's preset
+    parquet: ParquetSettings = ParquetSettings()
+    # Compression of text and json files ("gzip" or "zstd") or of Arrow
+    # IPC files ("lz4" or "zstd"), or None; see COMPRESSIONS
+    compression: str | None = None
+    # Connection string of the database the postgres format loads; never
+    # recorded in manifests, as it may hold a password
+    postgres_dsn: str | None = field(default=None, repr=False)
+
+    @property
+    def split(self) -> bool:
+        return self.part_rows is not None or self.part_bytes is not None
+
+    @property
+    def single_file(self) -> bool:
+        return not self.split and self.partition_by is None
+
+    def for_table(self, table_name: str) -> "Layout":
+        """The layout of one table: year partitions only apply to dated tables."""
+        if self.partition_by == "year" and service_date_column(table_name) is None:
+            return replace(self, partition_by=None, keep_partition_column=False)
+        return self
+
+    def manifest_entry(self) -> dict:
+        """Describe the layout for a build manifest; empty for single files."""
+        entry = {
+            "part_rows": self.part_rows,
+            "part_bytes": self.part_bytes,
+            "partition_by": self.partition_by,
+            "keep_partition_column": self.keep_partition_column,
+            "compression": self.compression,
+        }
+        return {key: value for key, value in entry.items() if value}
+
+
+def service_date_column(table_name: str) -> str | None:
+    """The one date column a table's rows are dated by, or None if there isn't one.
+
+    Tables with an event date (ADate, RxDate) have one; enrollment spans two
+    dates and the remaining tables are undated.
+    """
+    date_columns = TABLES[table_name].date_columns if table_name in TABLES else ()
+    return date_columns[0] if len(date_columns) == 1 else None
+
+
+@dataclass(frozen=True)
+class ExportStats:
+    """Rows, bytes and wall time of one table's export."""
+
+    table_name: str
+    rows: int
+    bytes: int
+    seconds: float
+    # Part descriptions from export_table(), for split or partitioned layouts
+    parts: tuple[dict, ...] | None = None
+
+    @property
+    def rows_per_second(self) -> float:
+        """Rows written per second, or 0 if no time was measured."""
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        """Megabytes written per second, or 0 if no time was measured."""
+        return self.bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        """One-line throughput report, e.g. for the CLI."""
+        return (
+            f"{self.table_name}: {self.rows:,} rows, {self.bytes / 1e6:,.1f} MB in "
+            f"{self.seconds:.1f}s ({self.rows_per_second:,.0f} rows/s, "
+            f"{self.megabytes_per_second:,.1f} MB/s)"
+        )
 
 
 def export_table(
@@ -12,63 +200,1010 @@ def export_table(
     table_name: str,
     output_dir: str | Path,
     fmt: str,
-) -> None:
-    """Export a single DuckDB table to the specified format.
+    source: str | None = None,
+    layout: Layout | None = None,
+    partitions: list[tuple[int, str, int, int]] | None = None,
+) -> list[dict] | None:
+    """Export a single DuckDB table to the specified format or formats.
+
+    With several formats, e.g. ``"parquet,csv"``, every format is written at
+    once on its own cursor (see _fan_out()), next to each other: the files
+    differ only in their extension.
 
     Args:
         con: DuckDB connection
         table_name: Name of the table to export
         output_dir: Output directory path
-        fmt: Output format ("parquet", "csv", or "json")
+        fmt: Output format ("parquet", "arrow", "csv", "txt", "json", "xpt",
+            "duckdb", or "postgres"), or several separated by commas
+        source: Relation to export under the table's name (None = the table itself)
+        layout: How to split the table across files (None = one file); the
+            duckdb format always writes one table of DATABASE_FILE, and the
+            postgres format one table of the database at its postgres_dsn
+        partitions: Subsample partitions of ``source`` for a samplenum
+            layout (None = samplenum_partitions() of the table)
+
+    Returns:
+        Descriptions of the part files for a split or partitioned layout
+        (see _export_parts()), otherwise None
 
     Raises:
         ValueError: If format is not supported
     """
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
+    formats = split_formats(fmt)
+
+    if layout is not None:
+        layout = layout.for_table(table_name)
+    if layout is not None and not layout.single_file:
+        table_dir = output_dir / table_name
+        if table_dir.exists():
+            shutil.rmtree(table_dir)
+
+    def write(con: duckdb.DuckDBPyConnection, fmt: str) -> list[dict] | None:
+        if fmt == "duckdb":
+            _export_database(con, table_name, output_dir, source)
+            return None
+        if fmt == "postgres":
+            _export_postgres(con, table_name, source, layout)
+            return None
+        if layout is not None and not layout.single_file:
+            table_dir = output_dir / table_name
+            if layout.partition_by is not None:
+                return _export_partitions(
+                    con, table_name, table_dir, fmt, source or table_name, layout, partitions
+                )
+            return _export_parts(con, table_name, table_dir, fmt, source or table_name, layout)
+        output_path = output_dir / f"{table_name}{_extension(fmt, layout)}"
+        _export_file(con, table_name, output_path, fmt, source, layout=layout)
+        return None
+
+    if len(formats) == 1:
+        return write(con, formats[0])
+    return _fan_out(con, formats, write)
+
+
+def split_formats(fmt: str) -> list[str]:
+    """Split a format, or several separated by commas, into a list of formats.
+
+    Raises:
+        ValueError: If a format is not supported
+    """
+    formats = list(dict.fromkeys(name.strip() for name in fmt.split(",") if name.strip()))
+    unsupported = [name for name in formats if name not in _FILE_EXTENSIONS and name not in _DATABASE_FORMATS]
+    if unsupported or not formats:
+        raise ValueError(f"Unsupported format: {fmt}")
+    return formats
+
+
+def _fan_out(
+    con: duckdb.DuckDBPyConnection,
+    formats: list[str],
+    write: Callable[[duckdb.DuckDBPyConnection, str], list[dict] | None],
+) -> list[dict] | None:
+    """Write one table in several formats at once, each on its own cursor.
+
+    The writers run concurrently over the same assembled table, so its
+    blocks are read once into DuckDB's buffer pool and shared by all of them,
+    instead of the whole build being run again for each format.
+
+    Args:
+        con: DuckDB connection
+        formats: Formats to write
+        write: Writes the table in one format on the given cursor, returning
+            its part descriptions or None
+
+    Returns:
+        The part descriptions of every format, each with its format added,
+        or None if the table was written as single files
+    """
+
+    def write_on_cursor(fmt: str) -> list[dict] | None:
+        cursor = con.cursor()
+        try:
+            return write(cursor, fmt)
+        finally:
+            cursor.close()
+
+    with ThreadPoolExecutor(max_workers=len(formats)) as pool:
+        results = list(pool.map(write_on_cursor, formats))
+    if all(parts is None for parts in results):
+        return None
+    return [{**part, "format": fmt} for fmt, parts in zip(formats, results) for part in parts or []]
 
+
+def _export_file(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    output_path: Path,
+    fmt: str,
+    source: str | None = None,
+    header: bool = True,
+    layout: Layout | None = None,
+) -> None:
+    """Write one relation to one file in the given format and layout's settings."""
     if fmt == "parquet":
-        _export_parquet(con, table_name, output_dir)
-    elif fmt == "csv":
-        _export_csv(con, table_name, output_dir)
-    elif fmt == "json":
-        _export_ndjson(con, table_name, output_dir)
+        _export_parquet(con, table_name, output_path, source, layout.parquet if layout else None)
+    elif fmt == "arrow":
+        _export_arrow(con, table_name, output_path, source, layout.compression if layout else None)
+    elif fmt == "xpt":
+        _export_xport(con, table_name, output_path, source)
+    elif layout is not None and layout.compression is not None:
+        _export_compressed(con, table_name, output_path, fmt, source, header, layout)
+    elif fmt in _DELIMITERS:
+        _export_csv(con, table_name, output_path, header=header, source=source, delimiter=_DELIMITERS[fmt])
     else:
-        raise ValueError(f"Unsupported format: {fmt}")
+        _export_ndjson(con, table_name, output_path, source)
 
 
-def _export_parquet(
+def _extension(fmt: str, layout: Layout | None = None) -> str:
+    """File extension of one output file, e.g. ``.csv`` or ``.csv.gz``."""
+    if fmt in _COMPRESSED_TEXT and layout is not None and layout.compression is not None:
+        return _FILE_EXTENSIONS[fmt] + _COMPRESSION_EXTENSIONS[layout.compression]
+    return _FILE_EXTENSIONS[fmt]
+
+
+def _attach_database(con: duckdb.DuckDBPyConnection, output_dir: Path, append: bool = False) -> str:
+    """Attach the DuckDB database of an output directory, returning its catalog name.
+
+    Attached databases belong to the whole DuckDB instance, so every cursor
+    of the connection writes into the same file. The first export to attach
+    it starts the file afresh. An append attaches a copy of the existing
+    file in the APPEND_STAGING_DIR instead, for commit_appends() to swap in.
+
+    Raises:
+        ValueError: If appending and there is no database to append to
+    """
+    existing = Path(output_dir).resolve() / DATABASE_FILE
+    path = Path(output_dir).resolve() / APPEND_STAGING_DIR / DATABASE_FILE if append else existing
+    alias = f"scdm_{hashlib.sha1(str(path).encode()).hexdigest()[:12]}"
+    with _ATTACH_LOCK:
+        attached = con.execute(
+            "SELECT COUNT(*) FROM duckdb_databases() WHERE database_name = ?", [alias]
+        ).fetchone()[0]
+        if not attached:
+            if append and not existing.exists():
+                raise ValueError(f"No existing output to append to: {existing}")
+            if append:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(existing, path)
+            else:
+                path.unlink(missing_ok=True)
+                Path(f"{path}.wal").unlink(missing_ok=True)
+            con.execute(f"ATTACH '{path}' AS {alias}")
+    return alias
+
+
+def _export_database(
     con: duckdb.DuckDBPyConnection,
     table_name: str,
     output_dir: Path,
+    source: str | None = None,
+    append: bool = False,
+) -> None:
+    """Copy a relation into a table of the output directory's DuckDB database.
+
+    The rows are copied on the pipeline's own connection, in their sort
+    order, so the table's zonemaps also prune range scans on its sort keys.
+    PatID and EncounterID are indexed once the table is loaded, which is
+    cheaper than maintaining the indexes row by row; an append inserts into
+    the indexed table instead.
+    """
+    alias = _attach_database(con, output_dir, append)
+    if append:
+        con.execute(f"INSERT INTO {alias}.{table_name} SELECT * FROM {source or table_name}")
+        return
+    con.execute(f"CREATE OR REPLACE TABLE {alias}.{table_name} AS SELECT * FROM {source or table_name}")
+    _index_database_table(con, alias, table_name)
+
+
+def _index_database_table(con: duckdb.DuckDBPyConnection, alias: str, table_name: str) -> None:
+    """Index the _INDEXED_COLUMNS of one table of an attached database."""
+    columns = [row[0] for row in con.execute(f"DESCRIBE {alias}.{table_name}").fetchall()]
+    for column in _INDEXED_COLUMNS:
+        if column in columns:
+            con.execute(
+                f"CREATE INDEX IF NOT EXISTS {table_name}_{column.lower()} ON {alias}.{table_name} ({column})"
+            )
+
+
+def finish_database(
+    con: duckdb.DuckDBPyConnection,
+    output_dir: str | Path,
+    crosswalks: dict[str, str] | None = None,
+    append: bool = False,
+) -> None:
+    """Complete the DuckDB database of an output directory and detach it.
+
+    Called once every table has been exported in the duckdb format: copies
+    the crosswalks (indexed like the tables), creates the _JOIN_VIEWS whose
+    tables are present, and detaches the database so the file is
+    checkpointed and ready for analysts to open. Views are created from
+    inside the database, so they refer to its tables by their bare names
+    and work wherever the file is opened.
+
+    Args:
+        con: DuckDB connection the tables were exported on
+        output_dir: Output directory holding DATABASE_FILE
+        crosswalks: Relation holding each crosswalk, by crosswalk table name
+            (None = no crosswalks)
+        append: Insert the crosswalk rows into the crosswalks of an earlier
+            build instead of replacing them
+
+    Raises:
+        ValueError: If appending and there is no database to append to
+    """
+    alias = _attach_database(con, Path(output_dir), append)
+    for crosswalk_name, source in (crosswalks or {}).items():
+        if append:
+            con.execute(f"INSERT INTO {alias}.{crosswalk_name} SELECT * FROM {source}")
+        else:
+            con.execute(f"CREATE OR REPLACE TABLE {alias}.{crosswalk_name} AS SELECT * FROM {source}")
+            _index_database_table(con, alias, crosswalk_name)
+
+    tables = {
+        row[0]
+        for row in con.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE database_name = ?", [alias]
+        ).fetchall()
+    }
+    cursor = con.cursor()
+    try:
+        cursor.execute(f"USE {alias}")
+        for view, (table_name, joined) in _JOIN_VIEWS.items():
+            if table_name in tables and joined in tables:
+                cursor.execute(f"CREATE OR REPLACE VIEW {view} AS {_join_view_sql(table_name, joined)}")
+    finally:
+        cursor.close()
+    con.execute(f"DETACH {alias}")
+
+
+def _join_view_sql(table_name: str, joined: str) -> str:
+    """Query of a join view: every row of a table with its encounter's other columns.
+
+    A left join keeps rows whose EncounterID is missing or unmatched.
+    """
+    extra = [column for column in TABLES[joined].columns if column not in TABLES[table_name].columns]
+    columns = ", ".join(["t.*"] + [f"j.{column}" for column in extra])
+    return f"SELECT {columns} FROM {table_name} t LEFT JOIN {joined} j ON t.EncounterID = j.EncounterID"
+
+
+def _attach_postgres(con: duckdb.DuckDBPyConnection, dsn: str) -> str:
+    """Attach a PostgreSQL database with DuckDB's postgres extension, returning its catalog name."""
+    alias = f"scdm_pg_{hashlib.sha1(dsn.encode()).hexdigest()[:12]}"
+    with _ATTACH_LOCK:
+        attached = con.execute(
+            "SELECT COUNT(*) FROM duckdb_databases() WHERE database_name = ?", [alias]
+        ).fetchone()[0]
+        if not attached:
+            con.execute(f"ATTACH {_sql_string(dsn)} AS {alias} (TYPE postgres)")
+    return alias
+
+
+def _export_postgres(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    source: str | None = None,
+    layout: Layout | None = None,
+    append: bool = False,
+) -> None:
+    """Bulk-load a relation into a PostgreSQL table.
+
+    The postgres extension sends inserted rows with the binary COPY
+    protocol, and every DuckDB transaction holds its own PostgreSQL
+    connection, so the rows are cut into one range of the table's first
+    sort key per worker of the layout (_key_runs()) and each run is loaded
+    on its own cursor, in parallel. Each run selects its rows with a WHERE
+    condition, so it depends on neither the scan order of the relation nor
+    the other runs. The table is replaced, loaded without indexes, and then
+    PatID and EncounterID are indexed and the table analysed. Each run
+    commits on its own, so a failed load leaves a partial table that the
+    next export replaces. An append loads a staging table beside the
+    indexed one, whose rows commit_appends() moves across.
+
+    Raises:
+        ValueError: If the layout has no postgres_dsn
+    """
+    if layout is None or layout.postgres_dsn is None:
+        raise ValueError("The postgres format needs a connection string (postgres_dsn)")
+    alias = _attach_postgres(con, layout.postgres_dsn)
+    relation = source or table_name
+    target = f"{alias}.{_postgres_staging_table(table_name) if append else table_name}"
+    con.execute(f"DROP TABLE IF EXISTS {target}")
+    con.execute(f"CREATE TABLE {target} AS SELECT * FROM {relation} LIMIT 0")
+
+    def load_run(condition: str) -> None:
+        cursor = con.cursor()
+        try:
+            cursor.execute(f"INSERT INTO {target} SELECT * FROM {relation} WHERE {condition}")
+        finally:
+            cursor.close()
+
+    with ThreadPoolExecutor(max_workers=layout.workers) as pool:
+        list(pool.map(load_run, _key_runs(con, table_name, relation, layout.workers)))
+
+    if not append:
+        columns = [row[0] for row in con.execute(f"DESCRIBE {relation}").fetchall()]
+        for statement in _postgres_index_statements(table_name, columns):
+            con.execute(f"CALL postgres_execute('{alias}', {_sql_string(statement)})")
+
+
+def _key_runs(con: duckdb.DuckDBPyConnection, table_name: str, relation: str, runs: int) -> list[str]:
+    """WHERE conditions cutting a relation into about ``runs`` ranges of its first sort key.
+
+    The bounds are quantiles of the key, so the runs hold similar numbers
+    of rows; rows whose key is NULL form a run of their own. A relation
+    that is not an SCDM table, or is loaded in one run, is not cut.
+    """
+    if runs <= 1 or table_name not in TABLES:
+        return ["TRUE"]
+    key = TABLES[table_name].sort_keys[0]
+    fractions = [index / runs for index in range(1, runs)]
+    quantiles = con.execute(f"SELECT quantile_disc({key}, {fractions}) FROM {relation}").fetchone()[0]
+    bounds = sorted({int(bound) for bound in quantiles or [] if bound is not None})
+    if not bounds:
+        return ["TRUE"]
+    conditions = [f"{key} < {bounds[0]}"]
+    conditions += [f"{key} >= {low} AND {key} < {high}" for low, high in zip(bounds, bounds[1:])]
+    return conditions + [f"{key} >= {bounds[-1]}", f"{key} IS NULL"]
+
+
+def _postgres_index_statements(table_name: str, columns: list[str]) -> list[str]:
+    """PostgreSQL statements indexing a loaded table's _INDEXED_COLUMNS and analysing it.
+
+    These are raw PostgreSQL SQL, so the mixed-case column names are quoted.
+    """
+    statements = [
+        f'CREATE INDEX {table_name}_{column.lower()} ON "{table_name}" ("{column}")'
+        for column in _INDEXED_COLUMNS
+        if column in columns
+    ]
+    return statements + [f'ANALYZE "{table_name}"']
+
+
+def _postgres_staging_table(table_name: str) -> str:
+    """Name of the PostgreSQL table that stages a table's appended rows."""
+    return f"{table_name}_staged"
+
+
+def _postgres_commit_sql(table_names: list[str]) -> str:
+    """PostgreSQL statements moving every staged table's rows into its table.
+
+    PostgreSQL runs several statements sent at once in one transaction, so
+    either every table takes its appended rows or none does.
+    """
+    statements = []
+    for table_name in table_names:
+        staged = _postgres_staging_table(table_name)
+        statements += [f'INSERT INTO "{table_name}" SELECT * FROM "{staged}"', f'DROP TABLE "{staged}"']
+    return "; ".join(statements)
+
+
+def _sql_string(value: str) -> str:
+    """Quote a value as an SQL string literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _export_compressed(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    output_path: Path,
+    fmt: str,
+    source: str | None,
+    header: bool,
+    layout: Layout,
 ) -> None:
-    """Export table to parquet format with zstd compression."""
-    output_path = output_dir / f"{table_name}.parquet"
+    """Write a relation as gzip or zstd compressed delimited text or NDJSON.
+
+    A single compressed stream keeps one core busy, so the rows are cut into
+    blocks that are compressed concurrently on separate cursors, each as a
+    complete gzip member or zstd frame, and the blocks are concatenated in
+    order. gzip and zstd readers decompress such multi-member files as one
+    stream, so the output reads like a file compressed in one go.
+
+    Args:
+        con: DuckDB connection
+        table_name: Name of the table being exported
+        output_path: File to write
+        fmt: Output format ("csv", "txt", or "json")
+        source: Relation to export (None = the table itself)
+        header: Write a csv header row at the start of the file
+        layout: Layout with compression set; its workers compress blocks
+    """
+    source = source or table_name
+    total = con.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+    offsets = range(0, max(total, 1), _COMPRESSION_BLOCK_ROWS)
+    options = f"COMPRESSION {layout.compression}"
+
+    def write_block(index: int, offset: int) -> Path:
+        cursor = con.cursor()
+        try:
+            path = output_path.with_name(f"_{output_path.name}.block-{index:05d}")
+            block = f"(SELECT * FROM {source} LIMIT {_COMPRESSION_BLOCK_ROWS} OFFSET {offset})"
+            if fmt in _DELIMITERS:
+                copy_format = (
+                    f"FORMAT csv, DELIMITER '{_DELIMITERS[fmt]}', "
+                    f"HEADER {str(header and index == 0).lower()}"
+                )
+            else:
+                copy_format = "FORMAT json"
+            cursor.execute(f"COPY {block} TO '{path}' ({copy_format}, {options})")
+            return path
+        finally:
+            cursor.close()
+
+    with ThreadPoolExecutor(max_workers=layout.workers) as pool:
+        blocks = list(pool.map(write_block, range(len(offsets)), offsets))
+    try:
+        with open(output_path, "wb") as target:
+            for block in blocks:
+                with open(block, "rb") as compressed:
+                    shutil.copyfileobj(compressed, target)
+    finally:
+        for block in blocks:
+            block.unlink(missing_ok=True)
+
+
+def _export_parts(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    part_dir: Path,
+    fmt: str,
+    source: str,
+    layout: Layout,
+    first_index: int = 0,
+) -> list[dict]:
+    """Write a relation as consecutive, size-bounded part files.
+
+    Each part is a LIMIT/OFFSET run of the relation, which DuckDB scans in
+    insertion order, so the parts keep the table's global sort order. Parts
+    are written concurrently on separate cursors. A relation with no rows
+    still gets one empty part, so readers see its columns.
+
+    Args:
+        con: DuckDB connection
+        table_name: Name of the table being exported
+        part_dir: Directory for the part files
+        fmt: Output format ("parquet", "csv", "txt", or "json")
+        source: Relation holding the rows
+        layout: Split layout with part_rows and/or part_bytes
+        first_index: Number of the first part file, to continue after
+            existing parts when appending
+
+    Returns:
+        Per part, in order: file name, rows, bytes, and the sort keys of its
+        first and last rows (the part's key range; None when empty)
+    """
+    part_dir.mkdir(parents=True, exist_ok=True)
+    ext = _extension(fmt, layout)
+    total = con.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+    rows_per_part = _rows_per_part(con, table_name, part_dir, fmt, source, layout, total)
+    runs = [(offset, min(rows_per_part, total - offset)) for offset in range(0, total, rows_per_part)]
+
+    def write_part(index: int, offset: int, count: int) -> dict:
+        cursor = con.cursor()
+        try:
+            name = f"part-{first_index + index:05d}{ext}"
+            run = f"(SELECT * FROM {source} LIMIT {count} OFFSET {offset})"
+            _export_file(
+                cursor, table_name, part_dir / name, fmt, source=run, layout=replace(layout, workers=1)
+            )
+            return _describe_part(cursor, table_name, source, part_dir / name, offset, count)
+        finally:
+            cursor.close()
+
+    with ThreadPoolExecutor(max_workers=layout.workers) as pool:
+        futures = [
+            pool.submit(write_part, index, offset, count)
+            for index, (offset, count) in enumerate(runs or [(0, 0)])
+        ]
+        return [future.result() for future in futures]
+
+
+def _describe_part(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    source: str,
+    path: Path,
+    offset: int,
+    count: int,
+) -> dict:
+    """Describe a written part: its rows, size and sort-key range in ``source``."""
+    sort_keys = ", ".join(TABLES[table_name].sort_keys) if table_name in TABLES else "*"
+    key_range = [None, None]
+    if count:
+        for end, row in enumerate((offset, offset + count - 1)):
+            values = con.execute(f"SELECT {sort_keys} FROM {source} LIMIT 1 OFFSET {row}").fetchone()
+            key_range[end] = [_json_value(value) for value in values]
+    return {
+        "file": path.name,
+        "rows": count,
+        "bytes": path.stat().st_size,
+        "first": key_range[0],
+        "last": key_range[1],
+    }
+
+
+def samplenum_partitions(
+    con: duckdb.DuckDBPyConnection, table_name: str
+) -> list[tuple[int, str, int, int]]:
+    """Find the rows of each subsample in an assembled table.
+
+    Assembled tables carry no samplenum column, but crosswalk IDs are
+    numbered in samplenum order, so each subsample's rows are those whose
+    PatID (or, for provider and facility, own ID) falls in that subsample's
+    block of the crosswalk.
+
+    Args:
+        con: DuckDB connection holding the crosswalks
+        table_name: Name of the output table
+
+    Returns:
+        (samplenum, key column, first ID, last ID) per subsample, in order
+    """
+    id_columns = output_id_columns(table_name)
+    key_column = "PatID" if "PatID" in id_columns else next(iter(id_columns))
+    crosswalk_def = CROSSWALKS[id_columns[key_column]]
+    bounds = con.execute(f"""
+        SELECT samplenum, MIN({crosswalk_def.id_column}), MAX({crosswalk_def.id_column})
+        FROM {crosswalk_def.crosswalk_name}
+        GROUP BY samplenum
+        ORDER BY samplenum
+    """).fetchall()
+    return [(samplenum, key_column, first, last) for samplenum, first, last in bounds]
+
+
+def year_partitions(
+    con: duckdb.DuckDBPyConnection, table_name: str, source: str | None = None
+) -> list[tuple[int | None, str]]:
+    """Find the service years of a dated table's rows.
+
+    Args:
+        con: DuckDB connection
+        table_name: Name of a table with a service_date_column()
+        source: Relation holding the rows (None = the table itself)
+
+    Returns:
+        (year, WHERE condition) per year present, in order, followed by
+        (None, condition) for rows without a date if there are any
+    """
+    column = service_date_column(table_name)
+    years = con.execute(f"""
+        SELECT DISTINCT year({column}) AS service_year
+        FROM {source or table_name}
+        ORDER BY service_year NULLS LAST
+    """).fetchall()
+    return [
+        (year, f"year({column}) = {year}" if year is not None else f"{column} IS NULL")
+        for (year,) in years
+    ]
+
+
+def _export_partitions(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    table_dir: Path,
+    fmt: str,
+    source: str,
+    layout: Layout,
+    partitions: list[tuple[int, str, int, int]] | None = None,
+    existing_dir: Path | None = None,
+) -> list[dict]:
+    """Write a relation as hive partitions, ``samplenum=N/part.<ext>`` or ``year=YYYY/``.
+
+    Each partition selects its rows with a WHERE condition, which keeps
+    them in the relation's sort order. Partitions are written concurrently
+    on separate cursors. Within one, a split layout writes part-NNNNN files
+    in turn instead of a single part. Year partitions always hold part-NNNNN
+    files, numbered after any already in the partition, because an append
+    adds rows to the years an earlier build wrote; rows without a date go
+    to ``year=__HIVE_DEFAULT_PARTITION__``, which readers take as NULL.
+
+    Args:
+        con: DuckDB connection
+        table_name: Name of the table being exported
+        table_dir: Directory for the partitions
+        fmt: Output format ("parquet", "csv", "txt", or "json")
+        source: Relation holding the rows
+        layout: Layout with partition_by set
+        partitions: (samplenum, key column, first ID, last ID) per partition
+            of a samplenum layout (None = samplenum_partitions() of the table)
+        existing_dir: Directory holding the partitions of an earlier build,
+            whose part files new ones are numbered after (None = table_dir)
+
+    Returns:
+        Part descriptions as from _export_parts(), with each file named
+        relative to ``table_dir`` and its partition value added
+    """
+    ext = _extension(fmt, layout)
+    if layout.partition_by == "year":
+        column = service_date_column(table_name)
+        selections = year_partitions(con, table_name, source)
+        partition_column = f"year({column})"
+    else:
+        if partitions is None:
+            partitions = samplenum_partitions(con, table_name)
+        selections = [
+            (samplenum, f"{key_column} BETWEEN {first} AND {last}")
+            for samplenum, key_column, first, last in partitions
+        ]
+        partition_column = None
+
+    def write_partition(value: int | None, condition: str) -> list[dict]:
+        partition = f"{layout.partition_by}={_HIVE_NULL if value is None else value}"
+        extra = ""
+        if layout.keep_partition_column:
+            extra = f", {partition_column or value} AS {layout.partition_by}"
+        relation = f"(SELECT *{extra} FROM {source} WHERE {condition})"
+        partition_dir = table_dir / partition
+        cursor = con.cursor()
+        try:
+            if layout.split or layout.partition_by == "year":
+                first_index = len(list(((existing_dir or table_dir) / partition).glob(f"part-*{ext}")))
+                parts = _export_parts(
+                    cursor, table_name, partition_dir, fmt, relation, replace(layout, workers=1), first_index
+                )
+            else:
+                path = partition_dir / f"part{ext}"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                _export_file(
+                    cursor, table_name, path, fmt, source=relation, layout=replace(layout, workers=1)
+                )
+                count = cursor.execute(f"SELECT COUNT(*) FROM {relation}").fetchone()[0]
+                parts = [_describe_part(cursor, table_name, relation, path, 0, count)]
+        finally:
+            cursor.close()
+        return [
+            {**part, "file": f"{partition}/{part['file']}", layout.partition_by: value}
+            for part in parts
+        ]
+
+    with ThreadPoolExecutor(max_workers=layout.workers) as pool:
+        futures = [pool.submit(write_partition, *selection) for selection in selections]
+        return [part for future in futures for part in future.result()]
+
+
+def _rows_per_part(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    part_dir: Path,
+    fmt: str,
+    source: str,
+    layout: Layout,
+    total: int,
+) -> int:
+    """Rows per part file: part_rows, capped by an estimate from part_bytes.
+
+    The bytes per row are measured by writing the relation's first rows to
+    a sample file in the same format, so part_bytes is approximate.
+    """
+    rows_per_part = layout.part_rows or max(total, 1)
+    if layout.part_bytes is not None and total:
+        sample_rows = min(total, _SIZE_SAMPLE_ROWS)
+        sample_path = part_dir / f"_sample{_extension(fmt, layout)}"
+        try:
+            _export_file(
+                con,
+                table_name,
+                sample_path,
+                fmt,
+                source=f"(SELECT * FROM {source} LIMIT {sample_rows})",
+                layout=replace(layout, workers=1),
+            )
+            bytes_per_row = sample_path.stat().st_size / sample_rows
+        finally:
+            sample_path.unlink(missing_ok=True)
+        rows_per_part = min(rows_per_part, max(1, int(layout.part_bytes / bytes_per_row)))
+    return rows_per_part
+
+
+def _json_value(value: object) -> object:
+    """Return a sort-key value as JSON: numbers and strings as-is, others as text."""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def append_table(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    output_dir: str | Path,
+    fmt: str,
+    layout: Layout | None = None,
+) -> list[dict] | None:
+    """Stage a DuckDB table appended to the files an earlier export_table() wrote.
+
+    Nothing in the output directory changes until commit_appends(), so a
+    build that fails part-way leaves the earlier build as it was. Each file
+    is instead written under APPEND_STAGING_DIR as it will be once both
+    builds' rows are in it: the existing rows, streamed from the old file,
+    followed by the new ones. A DuckDB database is copied there and takes
+    the rows with an INSERT, which keeps its indexes up to date; a
+    PostgreSQL table gets a staging table beside it. Split and partitioned
+    layouts need no rewriting: the new rows sort after the old ones, so they
+    are staged as further part files, as new subsample partitions, or as
+    further part files of each year partition. Several formats are appended
+    to at once, as in export_table().
+
+    Args:
+        con: DuckDB connection
+        table_name: Name of the table holding the rows to append
+        output_dir: Output directory of the earlier build
+        fmt: Output format or formats of the earlier build
+        layout: Layout of the earlier build (None = one file per table)
+
+    Returns:
+        Descriptions of the new part files for a split or partitioned layout,
+        named as they will be once committed, otherwise None
+
+    Raises:
+        ValueError: If format is not supported or there is no file to append to
+    """
+    output_dir = Path(output_dir)
+    formats = split_formats(fmt)
+    if layout is not None:
+        layout = layout.for_table(table_name)
+    if len(formats) == 1:
+        return _append_format(con, table_name, output_dir, formats[0], layout)
+    return _fan_out(
+        con, formats, lambda cursor, fmt: _append_format(cursor, table_name, output_dir, fmt, layout)
+    )
+
+
+def _append_format(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    output_dir: Path,
+    fmt: str,
+    layout: Layout | None,
+) -> list[dict] | None:
+    """Stage a table appended to the earlier export in one format; see append_table()."""
+    if fmt == "duckdb":
+        _export_database(con, table_name, output_dir, append=True)
+        return None
+    if fmt == "postgres":
+        _export_postgres(con, table_name, layout=layout, append=True)
+        return None
+    staging_dir = output_dir / APPEND_STAGING_DIR
+    if layout is not None and layout.partition_by is not None:
+        table_dir = output_dir / table_name
+        if not table_dir.is_dir():
+            raise ValueError(f"No existing output to append to: {table_dir}")
+        return _export_partitions(
+            con, table_name, staging_dir / table_name, fmt, table_name, layout, existing_dir=table_dir
+        )
+    if layout is not None and layout.split:
+        part_dir = output_dir / table_name
+        existing_parts = sorted(part_dir.glob(f"part-*{_extension(fmt, layout)}"))
+        if not existing_parts:
+            raise ValueError(f"No existing output to append to: {part_dir}")
+        return _export_parts(
+            con,
+            table_name,
+            staging_dir / table_name,
+            fmt,
+            table_name,
+            layout,
+            first_index=len(existing_parts),
+        )
+
+    existing = output_dir / f"{table_name}{_extension(fmt, layout)}"
+    if not existing.exists():
+        raise ValueError(f"No existing output to append to: {existing}")
+
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    staged = staging_dir / existing.name
+    if fmt == "arrow":
+        with pa.memory_map(str(existing)) as mapped:
+            earlier = pa.ipc.open_file(mapped)
+            new_rows = con.execute(f"SELECT * FROM {table_name}").to_arrow_reader(_ARROW_BATCH_ROWS)
+            batches = (earlier.get_batch(i) for i in range(earlier.num_record_batches))
+            _write_arrow(
+                staged, earlier.schema, [batches, new_rows], layout.compression if layout else None
+            )
+    elif fmt == "xpt":
+        _append_xport(con, table_name, existing, staged)
+    elif fmt == "parquet":
+        # DuckDB streams the old file's rows and then the table's, in order
+        combined = f"(SELECT * FROM read_parquet('{existing}') UNION ALL SELECT * FROM {table_name})"
+        _export_parquet(
+            con, table_name, staged, source=combined, parquet=layout.parquet if layout else None
+        )
+    else:
+        # A compressed file takes the new rows as further gzip members
+        # or zstd frames
+        new_rows_path = staging_dir / f"_{existing.name}"
+        try:
+            _export_file(con, table_name, new_rows_path, fmt, header=False, layout=layout)
+            shutil.copyfile(existing, staged)
+            with open(new_rows_path, "rb") as new_rows, open(staged, "ab") as target:
+                shutil.copyfileobj(new_rows, target)
+        finally:
+            new_rows_path.unlink(missing_ok=True)
+    return None
+
+
+def commit_appends(
+    con: duckdb.DuckDBPyConnection,
+    output_dir: str | Path,
+    fmt: str,
+    table_names: list[str],
+    layout: Layout | None = None,
+) -> None:
+    """Swap every output append_table() staged into the output directory.
+
+    Called once every table has been appended. Staged files replace the
+    earlier build's files, or join them as new part files, by renaming,
+    and the rows of every staged PostgreSQL table move to their table in a
+    single transaction.
+
+    Args:
+        con: DuckDB connection the tables were appended on
+        output_dir: Output directory of the earlier build
+        fmt: Output format or formats of the earlier build
+        table_names: Tables that were appended
+        layout: Layout of the earlier build (None = one file per table)
+    """
+    output_dir = Path(output_dir)
+    if "postgres" in split_formats(fmt):
+        alias = _attach_postgres(con, layout.postgres_dsn)
+        con.execute(f"CALL postgres_execute('{alias}', {_sql_string(_postgres_commit_sql(table_names))})")
+
+    staging_dir = output_dir / APPEND_STAGING_DIR
+    if not staging_dir.is_dir():
+        return
+    for staged in sorted(path for path in staging_dir.rglob("*") if path.is_file()):
+        target = output_dir / staged.relative_to(staging_dir)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged, target)
+    shutil.rmtree(staging_dir)
+
+
+def _export_parquet(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    output_path: Path,
+    source: str | None = None,
+    parquet: ParquetSettings | None = None,
+) -> None:
+    """Export table to parquet format with zstd compression.
+
+    SCDM tables are assembled in sort-key order, so their sort keys are
+    declared in the file's key-value metadata for downstream engines.
+    ``source`` names a different relation to write under the table's name.
+    The table's parquet preset applies, with ``parquet`` overriding it.
+    """
+    kv_metadata = ""
+    settings = ParquetSettings()
+    if table_name in TABLES:
+        sorted_by = ",".join(TABLES[table_name].sort_keys)
+        kv_metadata = f", KV_METADATA {{'{SORTED_BY_METADATA_KEY}': '{sorted_by}'}}"
+        settings = TABLES[table_name].parquet
     con.execute(f"""
-        COPY {table_name}
+        COPY {source or table_name}
         TO '{output_path}'
-        (FORMAT parquet, COMPRESSION zstd)
+        (FORMAT parquet, COMPRESSION zstd{_parquet_options(settings.override(parquet))}{kv_metadata})
     """)
 
 
+def _export_arrow(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    output_path: Path,
+    source: str | None = None,
+    compression: str | None = None,
+) -> None:
+    """Export table to an Arrow IPC file, for memory-mapped reading.
+
+    Uncompressed files can be read in place with ``pyarrow.memory_map``,
+    without decoding, and their pages are shared by every process that
+    maps them; LZ4 or zstd record batches trade that for smaller files. As
+    in parquet, the sort keys are declared in the schema metadata.
+    """
+    reader = con.execute(f"SELECT * FROM {source or table_name}").to_arrow_reader(_ARROW_BATCH_ROWS)
+    schema = reader.schema
+    if table_name in TABLES:
+        sorted_by = ",".join(TABLES[table_name].sort_keys)
+        schema = schema.with_metadata({SORTED_BY_METADATA_KEY: sorted_by})
+    _write_arrow(output_path, schema, [reader], compression)
+
+
+def _write_arrow(path: Path, schema: pa.Schema, batch_sources: list, compression: str | None) -> None:
+    """Write record batches from each source in turn to an Arrow IPC file."""
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+        for batches in batch_sources:
+            for batch in batches:
+                writer.write_batch(batch)
+
+
+def _export_xport(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    output_path: Path,
+    source: str | None = None,
+) -> None:
+    """Export table to a SAS transport (XPORT) file for SAS-based tools.
+
+    Rows are streamed from DuckDB in Arrow record batches, so the table is
+    never held in memory whole. Like assign_max_varlength.sas, each
+    character variable is as long as its longest value, or 1 if it has none.
+    """
+    relation = source or table_name
+    schema = con.execute(f"SELECT * FROM {relation} LIMIT 0").to_arrow_table().schema
+    variables = xport_variables(schema, _char_lengths(con, relation, schema))
+    reader = con.execute(f"SELECT * FROM {relation}").to_arrow_reader(_XPORT_BATCH_ROWS)
+    write_xport(output_path, table_name, variables, [reader])
+
+
+def _append_xport(con: duckdb.DuckDBPyConnection, table_name: str, existing: Path, staged: Path) -> None:
+    """Write an earlier SAS transport file's observations and then a table's rows to a new file.
+
+    Character variables take the longer of their two lengths, which is the
+    length assign_max_varlength.sas would give them over all the rows.
+    """
+    schema = con.execute(f"SELECT * FROM {table_name} LIMIT 0").to_arrow_table().schema
+    lengths = _char_lengths(con, table_name, schema)
+    _, metadata = pyreadstat.read_xport(str(existing), metadataonly=True, output_format="polars")
+    for name in lengths:
+        lengths[name] = max(lengths[name], metadata.variable_storage_width[name])
+    earlier = (
+        batch
+        for chunk, _ in pyreadstat.read_file_in_chunks(
+            pyreadstat.read_xport, str(existing), chunksize=_XPORT_BATCH_ROWS, output_format="polars"
+        )
+        for batch in chunk.to_arrow().to_batches()
+    )
+    new_rows = con.execute(f"SELECT * FROM {table_name}").to_arrow_reader(_XPORT_BATCH_ROWS)
+    write_xport(staged, table_name, xport_variables(schema, lengths), [earlier, new_rows])
+
+
+def _char_lengths(con: duckdb.DuckDBPyConnection, relation: str, schema: pa.Schema) -> dict[str, int]:
+    """Bytes in the longest value of each string column of a relation, at least 1."""
+    names = [
+        field.name
+        for field in schema
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type) or pa.types.is_string_view(field.type)
+    ]
+    if not names:
+        return {}
+    maxima = ", ".join(f'GREATEST(MAX(strlen("{name}")), 1)' for name in names)
+    return dict(zip(names, con.execute(f"SELECT {maxima} FROM {relation}").fetchone()))
+
+
+def _parquet_options(settings: ParquetSettings) -> str:
+    """Render parquet writer settings as extra COPY options."""
+    options = {
+        "ROW_GROUP_SIZE": settings.row_group_size,
+        "COMPRESSION_LEVEL": settings.compression_level,
+        "DICTIONARY_SIZE_LIMIT": settings.dictionary_size_limit,
+        "BLOOM_FILTER_FALSE_POSITIVE_RATIO": settings.bloom_filter_fpp,
+    }
+    return "".join(f", {name} {value}" for name, value in options.items() if value is not None)
+
+
 def _export_csv(
     con: duckdb.DuckDBPyConnection,
     table_name: str,
-    output_dir: Path,
+    output_path: Path,
+    header: bool = True,
+    source: str | None = None,
+    delimiter: str = ",",
 ) -> None:
-    """Export table to CSV format with headers."""
-    output_path = output_dir / f"{table_name}.csv"
+    """Export table to delimited text, with headers unless ``header`` is False."""
     con.execute(f"""
-        COPY {table_name}
+        COPY {source or table_name}
         TO '{output_path}'
-        (FORMAT csv, HEADER true)
+        (FORMAT csv, DELIMITER '{delimiter}', HEADER {str(header).lower()})
     """)
 
 
 def _export_ndjson(
     con: duckdb.DuckDBPyConnection,
     table_name: str,
-    output_dir: Path,
+    output_path: Path,
+    source: str | None = None,
 ) -> None:
     """Export table to NDJSON format using DuckDB COPY TO.
 
@@ -78,35 +1213,112 @@ def _export_ndjson(
     Args:
         con: DuckDB connection
         table_name: Name of the table to export
-        output_dir: Output directory path
+        output_path: File to write
+        source: Relation to export under the table's name (None = the table itself)
     """
-    output_path = output_dir / f"{table_name}.json"
     con.execute(f"""
-        COPY {table_name}
+        COPY {source or table_name}
         TO '{output_path}'
         (FORMAT json)
     """)
 
 
+def timed_export(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    output_dir: str | Path,
+    fmt: str,
+    append: bool = False,
+    layout: Layout | None = None,
+) -> ExportStats:
+    """Export (or append) one table and measure its throughput.
+
+    Args:
+        con: DuckDB connection
+        table_name: Name of the table to export
+        output_dir: Output directory path
+        fmt: Output format, or several separated by commas
+        append: Stage an append to the existing output with append_table()
+        layout: How to split the table across files (None = one file)
+
+    Returns:
+        Rows exported, bytes written in all formats, elapsed seconds, and any
+        part files; bytes loaded into a database are not counted
+    """
+    file_names = [
+        f"{table_name}{_extension(name, layout)}"
+        for name in split_formats(fmt)
+        if name not in _DATABASE_FORMATS
+    ]
+    output_dir = Path(output_dir)
+    # An append stages the whole file, earlier rows included
+    written_dir = output_dir / APPEND_STAGING_DIR if append else output_dir
+    size_before = sum(
+        (output_dir / name).stat().st_size for name in file_names if append and (output_dir / name).exists()
+    )
+
+    started = time.perf_counter()
+    write = append_table if append else export_table
+    parts = write(con, table_name, output_dir, fmt, layout=layout)
+    seconds = time.perf_counter() - started
+
+    rows = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+    if parts is not None:
+        return ExportStats(table_name, rows, sum(part["bytes"] for part in parts), seconds, tuple(parts))
+    size_after = sum((written_dir / name).stat().st_size for name in file_names)
+    return ExportStats(table_name, rows, size_after - size_before, seconds)
+
+
 def export_all(
     con: duckdb.DuckDBPyConnection,
     table_names: list[str],
     output_dir: str | Path,
     fmt: str,
     progress: ProgressTracker | None = None,
-) -> None:
+    workers: int = 1,
+    layout: Layout | None = None,
+) -> list[ExportStats]:
     """Export multiple tables to the specified format.
 
+    Up to ``workers`` tables are exported at once, each COPY on its own
+    cursor, so with several workers the tables must be catalog tables rather
+    than registered relations. Tables start largest first, so the longest
+    export is not left until the end with the small tables already done.
+
     Args:
         con: DuckDB connection
         table_names: List of table names to export
         output_dir: Output directory path
-        fmt: Output format ("parquet", "csv", or "json")
+        fmt: Output format, or several separated by commas
         progress: Optional progress tracker with update_description() and advance()
+        workers: Maximum number of tables exported at once (default: 1)
+        layout: How to split each table across files (None = one file each)
+
+    Returns:
+        Throughput of each table's export, largest table first
     """
-    for table_name in table_names:
-        if progress:
-            progress.update_description(f"Exporting {table_name}")
-        export_table(con, table_name, output_dir, fmt)
+    sizes = {
+        table_name: con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        for table_name in table_names
+    }
+    largest_first = sorted(table_names, key=lambda table_name: -sizes[table_name])
+
+    def export_on_cursor(table_name: str) -> ExportStats:
+        # Cursors see catalog tables but not relations registered on con, so
+        # a single worker exports on con itself
+        if workers == 1:
+            stats = timed_export(con, table_name, output_dir, fmt, layout=layout)
+        else:
+            cursor = con.cursor()
+            try:
+                stats = timed_export(cursor, table_name, output_dir, fmt, layout=layout)
+            finally:
+                cursor.close()
         if progress:
+            progress.update_description(f"Exported {table_name}")
             progress.advance()
+        return stats
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(export_on_cursor, table_name) for table_name in largest_first]
+        return [future.result() for future in futures]
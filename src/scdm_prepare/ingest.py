@@ -1,11 +1,14 @@
+import datetime
+import hashlib
 import re
 from pathlib import Path
 
 import polars as pl
+import pyarrow.parquet as pq
 import pyreadstat
 
 from scdm_prepare.progress import ProgressTracker
-from scdm_prepare.schema import TABLES
+from scdm_prepare.schema import CROSSWALKS, SORTED_BY_METADATA_KEY, TABLES
 
 
 def source_file_path(
@@ -34,18 +37,20 @@ def discover_subsamples(
     first: int | None = None,
     last: int | None = None,
     file_ext: str = ".sas7bdat",
+    tables: list[str] | None = None,
 ) -> list[int]:
     """Discover subsample numbers from source files in input directory.
 
     Scans input_dir for files matching *_{N}{file_ext} pattern, extracts
     subsample numbers, applies first/last filtering, and validates that
-    all 9 table types exist for each subsample in range.
+    all required table types (by default all 9) exist for each subsample in range.
 
     Args:
         input_dir: Directory containing source files
         first: First subsample number to process (None = lowest detected)
         last: Last subsample number to process (None = highest detected)
         file_ext: File extension to match (default: ".sas7bdat")
+        tables: Table types that must exist for each subsample (None = all 9)
 
     Returns:
         List of validated subsample numbers in ascending order
@@ -86,8 +91,8 @@ def discover_subsamples(
     missing_files = []
 
     for samplenum in range(start, end + 1):
-        # Get all 9 table types from schema
-        all_table_types = set(TABLES.keys())
+        # Get the required table types (all 9 from schema by default)
+        all_table_types = set(tables if tables is not None else TABLES.keys())
 
         # Check what we have for this subsample
         have_tables = found_files.get(samplenum, set())
@@ -117,11 +122,16 @@ def ingest_table(
     output_dir: Path | str,
     file_ext: str = ".sas7bdat",
     chunk_size: int = 10000,
+    sample_fraction: float | None = None,
+    patients: pl.DataFrame | None = None,
+    start_date: datetime.date | None = None,
+    end_date: datetime.date | None = None,
 ) -> None:
     """Read source file in chunks and write temp parquet with samplenum column.
 
     For SAS7BDAT files: uses pyreadstat chunked reading which auto-converts
-    SAS date columns to Python datetime.date. For parquet test files: reads
+    SAS date columns to Python datetime.date, writing each chunk to the temp
+    parquet file as it is read. For parquet test files: reads
     entire file at once (no chunking needed for small test files).
 
     Args:
@@ -131,6 +141,13 @@ def ingest_table(
         output_dir: Directory where temp parquet files will be written
         file_ext: File extension (default: ".sas7bdat")
         chunk_size: Chunk size for SAS7BDAT reading (default: 10000)
+        sample_fraction: Keep only this fraction of each subsample's patients,
+            chosen by sample_patients() (None = keep every row)
+        patients: Original (samplenum, PatID) pairs to keep, as strings (None =
+            keep every patient)
+        start_date: Drop rows dated before this day (None = no lower bound)
+        end_date: Drop rows dated after this day (None = no upper bound).
+            See within_dates() for the columns the window applies to.
 
     Raises:
         ValueError: If source file not found or if writing fails
@@ -139,6 +156,10 @@ def ingest_table(
     output_dir = Path(output_dir)
     temp_dir = output_dir / "_temp"
     temp_dir.mkdir(parents=True, exist_ok=True)
+    # build_crosswalk() prefers full ID files over ingested ones, so none may
+    # survive from an earlier patient-list build
+    for stale_path in (temp_dir / "ids").glob(f"{table_name}_*.parquet"):
+        stale_path.unlink()
 
     for samplenum in subsamples:
         source_path = source_file_path(input_dir, table_name, samplenum, file_ext)
@@ -146,14 +167,54 @@ def ingest_table(
         if not source_path.exists():
             raise ValueError(f"Source file not found: {source_path}")
 
+        output_path = temp_dir / f"{table_name}_{samplenum}.parquet"
+        sort_keys = list(TABLES[table_name].sort_keys)
+        id_path = crosswalk_id_path(temp_dir, table_name, samplenum)
+
+        # A patient list or sample keeps some patients' rows; see
+        # _ingest_patients() for how the rows of the others are skipped
+        sampled = sample_fraction is not None and sample_fraction < 1
+        if (patients is not None or sampled) and "PatID" in TABLES[table_name].columns:
+            patids = None
+            if patients is not None:
+                patids = patients.filter(pl.col("samplenum") == samplenum)["PatID"]
+            _ingest_patients(
+                source_path,
+                output_path,
+                id_path,
+                table_name,
+                samplenum,
+                patids,
+                file_ext,
+                chunk_size,
+                start_date,
+                end_date,
+                sample_fraction,
+            )
+            continue
+
         # Read based on file extension
         if file_ext == ".parquet":
-            # For parquet: read entire file and inject samplenum
-            df = pl.read_parquet(str(source_path))
+            # For parquet: read entire file and inject samplenum, pushing the
+            # date window down into the scan
+            df = within_dates(
+                pl.scan_parquet(str(source_path)), table_name, start_date, end_date
+            ).collect()
             df = df.with_columns(pl.lit(samplenum).alias("samplenum"))
+            table = df.to_arrow()
+            sorted_so_far = _is_sorted_after(df, sort_keys, None)
+            pq.write_table(
+                table.replace_schema_metadata(
+                    _sorted_by_metadata(table.schema.metadata, sort_keys, sorted_so_far)
+                ),
+                str(output_path),
+            )
         else:
-            # For SAS7BDAT: read in chunks with error handling
-            chunks = []
+            # For SAS7BDAT: stream chunks straight to the temp parquet file so
+            # peak memory is one chunk, not the whole source file
+            writer = None
+            sorted_so_far = True
+            last_row = None
             try:
                 for chunk_df in pyreadstat.read_file_in_chunks(
                     pyreadstat.read_sas7bdat, str(source_path), chunksize=chunk_size
@@ -161,22 +222,312 @@ def ingest_table(
                     # chunk_df is a pandas DataFrame
                     # Convert to polars and inject samplenum
                     chunk_pl = pl.from_pandas(chunk_df)
+                    chunk_pl = within_dates(chunk_pl, table_name, start_date, end_date)
                     chunk_pl = chunk_pl.with_columns(pl.lit(samplenum).alias("samplenum"))
-                    chunks.append(chunk_pl)
+                    # SAS datasets are usually stored sorted; track whether this
+                    # one is, carrying the last row across chunk boundaries
+                    sorted_so_far = sorted_so_far and _is_sorted_after(chunk_pl, sort_keys, last_row)
+                    if chunk_pl.height:
+                        last_row = chunk_pl.tail(1)
+                    chunk_arrow = chunk_pl.to_arrow()
+                    if writer is None:
+                        writer = pq.ParquetWriter(str(output_path), chunk_arrow.schema)
+                    writer.write_table(chunk_arrow.cast(writer.schema))
+                if writer is not None:
+                    writer.add_key_value_metadata(_sorted_by_metadata(None, sort_keys, sorted_so_far))
             except Exception as e:
                 raise RuntimeError(f"Failed to read {source_path}: {e}") from e
+            finally:
+                if writer is not None:
+                    writer.close()
 
-            # Concatenate all chunks
-            if chunks:
-                df = pl.concat(chunks)
-            else:
+            if writer is None:
                 # Empty file - create empty dataframe with correct schema
                 df = pl.DataFrame({col: [] for col in TABLES[table_name].columns})
                 df = df.with_columns(pl.lit(samplenum).alias("samplenum"))
+                df.write_parquet(str(output_path))
 
-        # Write to temp parquet
-        output_path = temp_dir / f"{table_name}_{samplenum}.parquet"
-        df.write_parquet(str(output_path))
+
+def crosswalk_id_path(temp_dir: Path | str, table_name: str, samplenum: int) -> Path:
+    """Return where a patient-list ingest keeps a crosswalk source's full ID column.
+
+    Crosswalks number every original ID, so when ingest keeps only some
+    patients' rows, the ID column of each crosswalk source table is written
+    here in full and build_crosswalk() reads it instead of the filtered file.
+    """
+    return Path(temp_dir) / "ids" / f"{table_name}_{samplenum}.parquet"
+
+
+def read_columns(source_path: Path | str, columns: list[str], file_ext: str) -> pl.DataFrame:
+    """Read only some columns of a source file, for every row.
+
+    Args:
+        source_path: Source file (SAS7BDAT, or parquet for tests)
+        columns: Columns to decode
+        file_ext: File extension of the source file
+
+    Returns:
+        DataFrame of the requested columns
+    """
+    if file_ext == ".parquet":
+        return pl.read_parquet(str(source_path), columns=columns)
+    df, _ = pyreadstat.read_sas7bdat(str(source_path), usecols=columns)
+    return pl.from_pandas(df)
+
+
+def _ingest_patients(
+    source_path: Path,
+    output_path: Path,
+    id_path: Path,
+    table_name: str,
+    samplenum: int,
+    patids: pl.Series | None,
+    file_ext: str,
+    chunk_size: int,
+    start_date: datetime.date | None = None,
+    end_date: datetime.date | None = None,
+    sample_fraction: float | None = None,
+) -> None:
+    """Ingest the rows of some patients, decoding only the IDs of the rest.
+
+    The patients are a patient list or, without one, the sample that
+    sample_patients() picks from the PatID column. The PatID column (and,
+    for a patient list, the table's crosswalk ID column if it is a
+    crosswalk source) is read for every row. Every other column is decoded
+    only for matching rows: parquet sources are scanned with the PatID
+    filter pushed down, and SAS sources are read in runs of rows around the
+    matches, which are contiguous because SAS datasets are stored sorted by
+    PatID.
+
+    Args:
+        source_path: Source file of one subsample
+        output_path: Temp parquet file for the patients' rows
+        id_path: Temp parquet file for the full crosswalk ID column
+        table_name: Name of the table
+        samplenum: Subsample number
+        patids: Original PatIDs to keep, as strings (None = keep the sample)
+        file_ext: File extension of the source file
+        chunk_size: Largest gap between matching SAS rows read as one run
+        start_date: First day of the date window (None = no lower bound)
+        end_date: Last day of the date window (None = no upper bound)
+        sample_fraction: Fraction of patients to keep when there is no
+            patient list
+    """
+    # A sampled build numbers only the sampled IDs, so only a patient list
+    # keeps the full crosswalk ID columns
+    crosswalk_columns = [
+        crosswalk_def.id_column
+        for crosswalk_def in CROSSWALKS.values()
+        if patids is not None and table_name in crosswalk_def.source_tables
+    ]
+    date_columns = list(TABLES[table_name].date_columns)
+    id_columns = list(dict.fromkeys(["PatID"] + crosswalk_columns + date_columns))
+    ids = read_columns(source_path, id_columns, file_ext)
+
+    if crosswalk_columns:
+        # Number the same IDs as a build of every patient in the date window
+        id_path.parent.mkdir(exist_ok=True)
+        within_dates(ids, table_name, start_date, end_date).select(crosswalk_columns).with_columns(
+            pl.lit(samplenum).alias("samplenum")
+        ).write_parquet(str(id_path))
+
+    if patids is not None:
+        keep = patids.cast(ids["PatID"].dtype, strict=False).implode()
+    else:
+        sampled = sample_patients(ids["PatID"], samplenum, sample_fraction)
+        keep = ids["PatID"].filter(sampled).unique().implode()
+    if file_ext == ".parquet":
+        scan = pl.scan_parquet(str(source_path)).filter(pl.col("PatID").is_in(keep))
+        df = within_dates(scan, table_name, start_date, end_date).collect()
+    else:
+        mask = ids["PatID"].is_in(keep)
+        runs = []
+        for start, stop in _row_runs(mask, chunk_size):
+            run_df, _ = pyreadstat.read_sas7bdat(
+                str(source_path), row_offset=start, row_limit=stop - start
+            )
+            runs.append(pl.from_pandas(run_df).filter(mask.slice(start, stop - start)))
+        if not runs:
+            # No matches: keep the source's column types with an empty frame
+            empty_df, _ = pyreadstat.read_sas7bdat(str(source_path), row_limit=1)
+            runs.append(pl.from_pandas(empty_df).head(0))
+        df = within_dates(pl.concat(runs, how="vertical_relaxed"), table_name, start_date, end_date)
+
+    df = df.with_columns(pl.lit(samplenum).alias("samplenum"))
+    sort_keys = list(TABLES[table_name].sort_keys)
+    table = df.to_arrow()
+    pq.write_table(
+        table.replace_schema_metadata(
+            _sorted_by_metadata(
+                table.schema.metadata, sort_keys, _is_sorted_after(df, sort_keys, None)
+            )
+        ),
+        str(output_path),
+    )
+
+
+def _row_runs(mask: pl.Series, max_gap: int) -> list[tuple[int, int]]:
+    """Group the True positions of a mask into [start, stop) row runs.
+
+    Matches separated by fewer than ``max_gap`` rows share a run, so a
+    scattered patient list does not turn into one read per row.
+
+    Args:
+        mask: Boolean mask over the rows of a file
+        max_gap: Gap, in rows, below which neighbouring runs are merged
+
+    Returns:
+        Row runs in file order
+    """
+    runs = []
+    for index in mask.arg_true().to_list():
+        if runs and index - runs[-1][1] < max_gap:
+            runs[-1][1] = index + 1
+        else:
+            runs.append([index, index + 1])
+    return [(start, stop) for start, stop in runs]
+
+
+def within_dates(
+    frame: pl.DataFrame | pl.LazyFrame,
+    table_name: str,
+    start_date: datetime.date | None,
+    end_date: datetime.date | None,
+) -> pl.DataFrame | pl.LazyFrame:
+    """Restrict a table's rows to a date window on its declared date columns.
+
+    A table with one date column keeps the rows dated inside the window. A
+    table with a (start, end) span, such as enrollment, keeps the spans that
+    overlap the window and clips them to it. Rows with a NULL date in a
+    bound column are dropped; tables without date columns are unchanged.
+
+    Args:
+        frame: Rows of the table, eager or lazy
+        table_name: Name of the table in TABLES
+        start_date: First day of the window (None = no lower bound)
+        end_date: Last day of the window (None = no upper bound)
+
+    Returns:
+        The filtered rows, of the same kind as ``frame``
+    """
+    date_columns = TABLES[table_name].date_columns
+    if not date_columns or (start_date is None and end_date is None):
+        return frame
+
+    schema = frame.collect_schema()
+    first, last = date_columns[0], date_columns[-1]
+    keep = pl.lit(True)
+    if start_date is not None:
+        keep = keep & (pl.col(last).cast(pl.Date) >= start_date)
+    if end_date is not None:
+        keep = keep & (pl.col(first).cast(pl.Date) <= end_date)
+    frame = frame.filter(keep)
+
+    if len(date_columns) == 2:
+        clipped = []
+        if start_date is not None:
+            clipped.append(
+                pl.when(pl.col(first).cast(pl.Date) < start_date)
+                .then(pl.lit(start_date).cast(schema[first]))
+                .otherwise(pl.col(first))
+                .alias(first)
+            )
+        if end_date is not None:
+            clipped.append(
+                pl.when(pl.col(last).cast(pl.Date) > end_date)
+                .then(pl.lit(end_date).cast(schema[last]))
+                .otherwise(pl.col(last))
+                .alias(last)
+            )
+        frame = frame.with_columns(clipped)
+    return frame
+
+
+def sample_patients(patids: pl.Series, samplenum: int, fraction: float) -> pl.Series:
+    """Return a mask selecting a deterministic fraction of a subsample's patients.
+
+    Each (samplenum, PatID) pair is kept when a BLAKE2 hash of it, read as a
+    fraction of 2**64, is below ``fraction``. The choice depends only on the
+    pair, so every table of a subsample keeps the same patients and repeated
+    builds keep the same subset.
+
+    Args:
+        patids: Original PatID values
+        samplenum: Subsample the PatIDs come from
+        fraction: Fraction of patients to keep, in (0, 1]
+
+    Returns:
+        Boolean mask, True for rows whose patient is in the sample
+    """
+    threshold = int(fraction * 2**64)
+    kept = [
+        patid
+        for patid in patids.drop_nulls().unique().to_list()
+        if _patient_hash(samplenum, patid) < threshold
+    ]
+    return patids.is_in(pl.Series(kept, dtype=patids.dtype).implode())
+
+
+def _patient_hash(samplenum: int, patid: object) -> int:
+    """Hash a (samplenum, PatID) pair to a 64-bit integer, stable across runs."""
+    digest = hashlib.blake2b(f"{samplenum}:{_canonical_patid(patid)}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _canonical_patid(patid: object) -> str:
+    """Spell a PatID the same whichever type its source stored it as.
+
+    SAS numeric PatIDs are read as floats, parquet ones as integers, and
+    text ones as strings, so 123.0, 123 and " 123" all become "123".
+    """
+    if isinstance(patid, float) and patid.is_integer():
+        return str(int(patid))
+    return str(patid).strip()
+
+
+def _is_sorted_after(
+    df: pl.DataFrame, sort_keys: list[str], previous: pl.DataFrame | None
+) -> bool:
+    """Check that rows are in ascending sort_keys order, NULLs last.
+
+    This is a single linear pass comparing each row with the one before it,
+    so it is cheap enough to run on every chunk during ingest.
+
+    Args:
+        df: Rows to check
+        sort_keys: Columns defining the expected order
+        previous: Last row of the preceding chunk, if any
+
+    Returns:
+        True if ``previous`` followed by ``df`` is sorted by sort_keys
+    """
+    if not sort_keys or any(key not in df.columns for key in sort_keys):
+        return False
+    keys = df.select(sort_keys)
+    if previous is not None:
+        keys = pl.concat([previous.select(sort_keys), keys], how="vertical_relaxed")
+    if keys.height < 2:
+        return True
+
+    # Walk the keys from last to first: a row is out of order if it is less
+    # than its predecessor on a key and equal on every key before it
+    out_of_order = pl.lit(False)
+    for key in reversed(sort_keys):
+        current, prior = pl.col(key), pl.col(key).shift(1)
+        less = (current < prior).fill_null(False) | (current.is_not_null() & prior.is_null())
+        out_of_order = less | (current.eq_missing(prior) & out_of_order)
+
+    return not keys.select(out_of_order.slice(1).any()).item()
+
+
+def _sorted_by_metadata(
+    metadata: dict | None, sort_keys: list[str], is_sorted: bool
+) -> dict:
+    """Return parquet key-value metadata recording the sort order, if any."""
+    metadata = dict(metadata or {})
+    if is_sorted:
+        metadata[SORTED_BY_METADATA_KEY] = ",".join(sort_keys)
+    return metadata
 
 
 def ingest_all(
@@ -186,6 +537,10 @@ def ingest_all(
     file_ext: str = ".sas7bdat",
     chunk_size: int = 10000,
     progress: ProgressTracker | None = None,
+    sample_fraction: float | None = None,
+    patients: pl.DataFrame | None = None,
+    start_date: datetime.date | None = None,
+    end_date: datetime.date | None = None,
 ) -> None:
     """Ingest all 9 table types for given subsamples to temp parquet.
 
@@ -196,10 +551,25 @@ def ingest_all(
         file_ext: File extension (default: ".sas7bdat")
         chunk_size: Chunk size for SAS7BDAT reading (default: 10000)
         progress: Optional progress tracker with update_description() and advance()
+        sample_fraction: Keep only this fraction of each subsample's patients
+        patients: Original (samplenum, PatID) pairs to keep (None = all patients)
+        start_date: Drop rows dated before this day (None = no lower bound)
+        end_date: Drop rows dated after this day (None = no upper bound)
     """
     for table_name in TABLES.keys():
         if progress:
             progress.update_description(f"Ingesting {table_name}")
-        ingest_table(input_dir, table_name, subsamples, output_dir, file_ext, chunk_size)
+        ingest_table(
+            input_dir,
+            table_name,
+            subsamples,
+            output_dir,
+            file_ext,
+            chunk_size,
+            sample_fraction,
+            patients,
+            start_date,
+            end_date,
+        )
         if progress:
             progress.advance()
@@ -0,0 +1,152 @@
+"""Build manifests recording what an SCDM output directory contains."""
+
+import datetime
+import json
+from pathlib import Path
+
+import duckdb
+
+from scdm_prepare.schema import CROSSWALKS
+
+MANIFEST_FILE = "manifest.json"
+
+# Manifest keys of the row filters a build applied, present only when used
+FILTER_KEYS = ("sample_fraction", "date_window")
+
+
+def build_manifest(
+    con: duckdb.DuckDBPyConnection,
+    fmt: str,
+    subsamples: list[int],
+    tables: list[str],
+    crosswalk_keys: list[str],
+    previous: dict | None = None,
+    filters: dict | None = None,
+    parts: dict[str, list[dict]] | None = None,
+    layout: dict | None = None,
+) -> dict:
+    """Describe a finished build from the tables and crosswalks in DuckDB.
+
+    The manifest records the largest new ID assigned by each crosswalk. New
+    IDs are numbered in samplenum order, so a later build of higher-numbered
+    subsamples can continue numbering from these maxima and append to the
+    outputs with the same result as a full rebuild.
+
+    Args:
+        con: DuckDB connection holding the assembled tables and crosswalks
+        fmt: Output format of the build
+        subsamples: Subsample numbers processed by this run
+        tables: Output tables written by this run
+        crosswalk_keys: Keys of the crosswalks built by this run
+        previous: Manifest of the build this run appended to (None = new build)
+        filters: Row filters of the build from build_filters(), recorded so
+            that appends and merges filter the same way (None = no filters)
+        parts: Part files this run wrote, per table, for split layouts; they
+            follow the earlier build's parts when appending
+        layout: Split layout of the build from Layout.manifest_entry()
+
+    Returns:
+        Manifest dictionary, ready for write_manifest()
+    """
+    previous = previous or {"subsamples": [], "tables": {}, "crosswalks": {}}
+
+    table_entries = {}
+    for table_name in tables:
+        rows = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        rows += previous["tables"].get(table_name, {}).get("rows", 0)
+        table_entries[table_name] = {"rows": rows}
+        if parts and table_name in parts:
+            previous_parts = previous["tables"].get(table_name, {}).get("parts", [])
+            table_entries[table_name]["parts"] = previous_parts + list(parts[table_name])
+
+    crosswalk_entries = {}
+    for key in crosswalk_keys:
+        crosswalk_def = CROSSWALKS[key]
+        previous_max = previous["crosswalks"].get(key, {}).get("max_id", 0)
+        max_id = con.execute(
+            f"SELECT MAX({crosswalk_def.id_column}) FROM {crosswalk_def.crosswalk_name}"
+        ).fetchone()[0]
+        crosswalk_entries[key] = {"max_id": max(max_id or 0, previous_max)}
+
+    manifest = {
+        "format": fmt,
+        "subsamples": sorted(set(previous["subsamples"]) | set(subsamples)),
+        "tables": table_entries,
+        "crosswalks": crosswalk_entries,
+    }
+    manifest.update(filters or {})
+    if layout:
+        manifest["layout"] = layout
+    return manifest
+
+
+def build_filters(
+    sample_fraction: float | None = None,
+    start_date: datetime.date | None = None,
+    end_date: datetime.date | None = None,
+) -> dict:
+    """Describe the row filters of a build for its manifest.
+
+    Args:
+        sample_fraction: Fraction of patients kept (None = all)
+        start_date: First day of the date window (None = no lower bound)
+        end_date: Last day of the date window (None = no upper bound)
+
+    Returns:
+        Manifest entries for the filters in use, empty if there are none
+    """
+    filters = {}
+    if sample_fraction is not None:
+        filters["sample_fraction"] = sample_fraction
+    if start_date is not None or end_date is not None:
+        filters["date_window"] = {
+            "start": start_date.isoformat() if start_date else None,
+            "end": end_date.isoformat() if end_date else None,
+        }
+    return filters
+
+
+def manifest_filters(manifest: dict) -> dict:
+    """Return the row filters recorded in a manifest, as from build_filters()."""
+    return {key: manifest[key] for key in FILTER_KEYS if key in manifest}
+
+
+def write_manifest(output_dir: Path | str, manifest: dict) -> None:
+    """Write a manifest to the output directory.
+
+    Args:
+        output_dir: Output directory of the build
+        manifest: Manifest from build_manifest()
+    """
+    path = Path(output_dir) / MANIFEST_FILE
+    path.write_text(json.dumps(manifest, indent=2) + "\n")
+
+
+def read_manifest(output_dir: Path | str) -> dict:
+    """Read the manifest of an earlier build.
+
+    Args:
+        output_dir: Output directory of the build
+
+    Returns:
+        Manifest dictionary
+
+    Raises:
+        ValueError: If the directory has no manifest
+    """
+    path = Path(output_dir) / MANIFEST_FILE
+    if not path.exists():
+        raise ValueError(f"No build manifest found: {path}")
+    return json.loads(path.read_text())
+
+
+def id_offsets(manifest: dict) -> dict[str, int]:
+    """Return the new-ID offset for each crosswalk recorded in a manifest.
+
+    Args:
+        manifest: Manifest of the build being appended to
+
+    Returns:
+        Mapping of crosswalk key to the largest new ID already assigned
+    """
+    return {key: entry["max_id"] for key, entry in manifest["crosswalks"].items()}
@@ -0,0 +1,148 @@
+"""Merge shard builds of disjoint subsample ranges into one SCDM build."""
+
+from pathlib import Path
+
+import duckdb
+
+from scdm_prepare.export import Layout, export_table, finish_database, split_formats
+from scdm_prepare.manifest import manifest_filters, read_manifest
+from scdm_prepare.progress import ProgressTracker
+from scdm_prepare.transform import output_id_columns
+
+
+def read_shards(shard_dirs: list[Path | str]) -> list[tuple[Path, dict]]:
+    """Read and validate the manifests of shard builds.
+
+    Args:
+        shard_dirs: Output directories of parquet builds, in any order
+
+    Returns:
+        (shard directory, manifest) pairs in subsample order
+
+    Raises:
+        ValueError: If a shard has no manifest, is not parquet, has no
+            subsamples, overlaps another shard, or builds different tables
+            or with different row filters
+    """
+    shards = []
+    for shard_dir in shard_dirs:
+        manifest = read_manifest(shard_dir)
+        if manifest["format"] != "parquet":
+            raise ValueError(f"Shard is not a parquet build: {shard_dir}")
+        if not manifest["subsamples"]:
+            raise ValueError(f"Shard has no subsamples: {shard_dir}")
+        shards.append((Path(shard_dir), manifest))
+    shards.sort(key=lambda shard: shard[1]["subsamples"][0])
+
+    for (previous_dir, previous), (shard_dir, manifest) in zip(shards, shards[1:]):
+        if manifest["subsamples"][0] <= previous["subsamples"][-1]:
+            raise ValueError(f"Shards overlap: {previous_dir} and {shard_dir}")
+        if set(manifest["tables"]) != set(previous["tables"]):
+            raise ValueError(f"Shards build different tables: {previous_dir} and {shard_dir}")
+        if manifest_filters(manifest) != manifest_filters(previous):
+            raise ValueError(f"Shards use different filters: {previous_dir} and {shard_dir}")
+    return shards
+
+
+def shard_offsets(shards: list[tuple[Path, dict]]) -> list[dict[str, int]]:
+    """Compute each shard's new-ID offsets as prefix sums of earlier maxima.
+
+    Every shard numbers its IDs from 1. Crosswalk IDs are numbered in
+    samplenum order, so a single build over all shards would number each
+    shard's IDs after every ID of the shards before it.
+
+    Args:
+        shards: (shard directory, manifest) pairs in subsample order
+
+    Returns:
+        Per shard, a mapping of crosswalk key to the offset for its IDs
+    """
+    offsets = []
+    running = {}
+    for _, manifest in shards:
+        offsets.append(dict(running))
+        for key, entry in manifest["crosswalks"].items():
+            running[key] = running.get(key, 0) + entry["max_id"]
+    return offsets
+
+
+def merge_shards(
+    con: duckdb.DuckDBPyConnection,
+    shard_dirs: list[Path | str],
+    output_dir: Path | str,
+    fmt: str,
+    progress: ProgressTracker | None = None,
+    layout: Layout | None = None,
+) -> dict:
+    """Merge shard builds into outputs identical to a single build.
+
+    Each table is rebuilt in DuckDB from the shards' parquet files in
+    subsample order, with every crosswalked ID column shifted by the shard's
+    offset, and then exported. No joins or sorts are needed: each shard is
+    already sorted and every shifted ID is larger than the previous shard's.
+
+    Args:
+        con: DuckDB connection
+        shard_dirs: Output directories of the shard builds, in any order
+        output_dir: Output directory for the merged build
+        fmt: Output format, or several separated by commas (e.g. "parquet,csv")
+        progress: Optional progress tracker with update_description() and advance()
+        layout: How to split each merged table across files (None = one file each)
+
+    Returns:
+        Manifest of the merged build
+
+    Raises:
+        ValueError: If the shards cannot be merged
+    """
+    shards = read_shards(shard_dirs)
+    offsets = shard_offsets(shards)
+    tables = list(shards[0][1]["tables"])
+    parts = {}
+
+    for table_name in tables:
+        if progress:
+            progress.update_description(f"Merging {table_name}")
+        id_columns = output_id_columns(table_name)
+        for index, ((shard_dir, _), shard_offset) in enumerate(zip(shards, offsets)):
+            shifts = [
+                f"{column} + {shard_offset[key]} AS {column}"
+                for column, key in id_columns.items()
+                if shard_offset.get(key)
+            ]
+            replace = f" REPLACE ({', '.join(shifts)})" if shifts else ""
+            select = f"SELECT *{replace} FROM read_parquet('{shard_dir / table_name}.parquet')"
+            if index == 0:
+                con.execute(f"CREATE OR REPLACE TABLE {table_name} AS {select}")
+            else:
+                con.execute(f"INSERT INTO {table_name} {select}")
+        table_parts = export_table(con, table_name, output_dir, fmt, layout=layout)
+        if table_parts is not None:
+            parts[table_name] = table_parts
+        con.execute(f"DROP TABLE {table_name}")
+        if progress:
+            progress.advance()
+
+    # Shards keep no crosswalks, so a merged database has only the tables and views
+    if "duckdb" in split_formats(fmt):
+        finish_database(con, output_dir)
+
+    crosswalk_maxima = {}
+    for _, manifest in shards:
+        for key, entry in manifest["crosswalks"].items():
+            crosswalk_maxima[key] = crosswalk_maxima.get(key, 0) + entry["max_id"]
+    merged = {
+        "format": fmt,
+        "subsamples": [samplenum for _, manifest in shards for samplenum in manifest["subsamples"]],
+        "tables": {
+            table_name: {"rows": sum(manifest["tables"][table_name]["rows"] for _, manifest in shards)}
+            for table_name in tables
+        },
+        "crosswalks": {key: {"max_id": max_id} for key, max_id in crosswalk_maxima.items()},
+    }
+    for table_name, table_parts in parts.items():
+        merged["tables"][table_name]["parts"] = table_parts
+    merged.update(manifest_filters(shards[0][1]))
+    if layout is not None and not layout.single_file:
+        merged["layout"] = layout.manifest_entry()
+    return merged
@@ -0,0 +1,360 @@
+"""Dependency-driven scheduling of the ingest, crosswalk, assemble and export stages."""
+
+import datetime
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+import duckdb
+import polars as pl
+
+from scdm_prepare.engines import get_engine
+from scdm_prepare.export import ExportStats, Layout, finish_database, split_formats, timed_export
+from scdm_prepare.ingest import ingest_table, source_file_path
+from scdm_prepare.progress import ProgressTracker
+from scdm_prepare.schema import CROSSWALKS, TABLES
+from scdm_prepare.transform import (
+    SYNTHESISED_TABLES,
+    assemble_table,
+    build_crosswalk,
+    synthesise_table,
+)
+
+
+@dataclass(frozen=True)
+class Node:
+    """One step of the pipeline and the steps it must wait for."""
+
+    name: str
+    run: Callable[[], None]
+    depends_on: tuple[str, ...] = ()
+    # Breaks priority ties: heavier nodes start first
+    weight: int = 0
+    # Nodes in the same group share that group's limit in run_dag()
+    group: str | None = None
+
+
+def run_dag(nodes: list[Node], workers: int = 1, limits: dict[str, int] | None = None) -> None:
+    """Run nodes concurrently, each as soon as all of its dependencies finish.
+
+    When several nodes are ready at once, the one with the most transitive
+    dependents starts first, so steps on the critical path (such as ingesting
+    demographic, which gates the PatID crosswalk) are not held up behind
+    leaves; among equals, the heaviest starts first. If a node fails, no
+    further nodes are started; nodes already running finish before the error
+    is raised.
+
+    Args:
+        nodes: Nodes to run; names must be unique
+        workers: Maximum number of nodes running at once (default: 1)
+        limits: Maximum number of nodes of a group running at once (None = no
+            limit beyond ``workers``)
+
+    Raises:
+        ValueError: If a dependency is unknown or the dependencies form a cycle
+    """
+    by_name = {node.name: node for node in nodes}
+    dependents = {name: [] for name in by_name}
+    for node in nodes:
+        for dependency in node.depends_on:
+            if dependency not in by_name:
+                raise ValueError(f"{node.name} depends on unknown node: {dependency}")
+            dependents[dependency].append(node.name)
+
+    downstream = _downstream_counts(dependents)
+    priority = {name: (downstream[name], by_name[name].weight) for name in by_name}
+    limits = limits or {}
+    group_running = dict.fromkeys(limits, 0)
+    waiting_on = {node.name: set(node.depends_on) for node in nodes}
+    ready = [name for name, dependencies in waiting_on.items() if not dependencies]
+    finished = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        while ready or running:
+            ready.sort(key=lambda name: priority[name], reverse=True)
+            for name in list(ready):
+                if len(running) == workers:
+                    break
+                group = by_name[name].group
+                if group in limits:
+                    if group_running[group] == limits[group]:
+                        continue
+                    group_running[group] += 1
+                ready.remove(name)
+                running[pool.submit(by_name[name].run)] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                future.result()
+                if by_name[name].group in limits:
+                    group_running[by_name[name].group] -= 1
+                finished += 1
+                for dependent in dependents[name]:
+                    waiting_on[dependent].discard(name)
+                    if not waiting_on[dependent]:
+                        ready.append(dependent)
+
+    if finished != len(nodes):
+        raise ValueError("pipeline dependencies form a cycle")
+
+
+def _downstream_counts(dependents: dict[str, list[str]]) -> dict[str, int]:
+    """Count the nodes that transitively depend on each node.
+
+    Args:
+        dependents: Mapping of node name to the names of its direct dependents
+
+    Returns:
+        Mapping of node name to its number of transitive dependents
+    """
+    counts = {}
+    for name in dependents:
+        seen = set()
+        stack = list(dependents[name])
+        while stack:
+            dependent = stack.pop()
+            if dependent not in seen:
+                seen.add(dependent)
+                stack.extend(dependents[dependent])
+        counts[name] = len(seen)
+    return counts
+
+
+def table_closure(tables: list[str]) -> tuple[list[str], list[str]]:
+    """Find the source tables and crosswalks needed to build some output tables.
+
+    A data-derived table needs its own source files and the crosswalks in its
+    crosswalk_ids; a synthesised table needs only its crosswalk; and every
+    crosswalk needs its source tables. For example, diagnosis needs the
+    demographic, encounter, provider and diagnosis sources.
+
+    Args:
+        tables: Output tables to build
+
+    Returns:
+        (source tables to ingest, keys of crosswalks to build), each in
+        TABLES/CROSSWALKS order
+
+    Raises:
+        ValueError: If a table name is not in TABLES
+    """
+    unknown = [name for name in tables if name not in TABLES]
+    if unknown:
+        raise ValueError(f"Unknown tables: {', '.join(unknown)}")
+
+    crosswalk_by_column = {cw.id_column: key for key, cw in CROSSWALKS.items()}
+    inputs = set()
+    crosswalks = set()
+    for table_name in tables:
+        if table_name in SYNTHESISED_TABLES:
+            crosswalks.add(SYNTHESISED_TABLES[table_name])
+        else:
+            inputs.add(table_name)
+            crosswalks.update(crosswalk_by_column[col] for col in TABLES[table_name].crosswalk_ids)
+    for key in crosswalks:
+        inputs.update(CROSSWALKS[key].source_tables)
+
+    return (
+        [name for name in TABLES if name in inputs],
+        [key for key in CROSSWALKS if key in crosswalks],
+    )
+
+
+def build_pipeline(
+    con: duckdb.DuckDBPyConnection,
+    input_dir: Path | str,
+    subsamples: list[int],
+    output_dir: Path | str,
+    fmt: str,
+    file_ext: str = ".sas7bdat",
+    buckets: int = 1,
+    engine: str = "duckdb",
+    tables: list[str] | None = None,
+    id_offsets: dict[str, int] | None = None,
+    append: bool = False,
+    write_outputs: bool = True,
+    sample_fraction: float | None = None,
+    patients: pl.DataFrame | None = None,
+    start_date: datetime.date | None = None,
+    end_date: datetime.date | None = None,
+    slice_pool: Executor | None = None,
+    export_stats: list[ExportStats] | None = None,
+    layout: Layout | None = None,
+    ingest_progress: ProgressTracker | None = None,
+    transform_progress: ProgressTracker | None = None,
+    export_progress: ProgressTracker | None = None,
+) -> list[Node]:
+    """Express a full build as a DAG of per-table and per-crosswalk nodes.
+
+    - ``ingest:<table>`` has no dependencies.
+    - ``crosswalk:<key>`` waits for the ingest of its source tables.
+    - ``assemble:<table>`` waits for the table's ingest and the crosswalks in
+      its crosswalk_ids; provider and facility wait only for their crosswalk.
+    - ``export:<table>`` waits for the table's assembly.
+    - ``export:database``, for the duckdb format, waits for every export and
+      then adds the crosswalks and views to the database (finish_database()).
+
+    Each node runs on its own DuckDB cursor, so nodes can run concurrently
+    against the same database. With ``tables``, only those tables are
+    assembled and exported, and only the inputs and crosswalks in their
+    table_closure() are built. With ``append``, crosswalk numbering starts
+    after ``id_offsets`` and each export stages an append to the earlier
+    build's outputs, which commit_appends() swaps in once every node is done.
+
+    Args:
+        con: DuckDB connection
+        input_dir: Directory containing source files
+        subsamples: List of subsample numbers to process
+        output_dir: Output directory; ingested files go to its _temp subdirectory
+        fmt: Output format, or several separated by commas (e.g. "parquet,csv")
+        file_ext: File extension of the source files (default: ".sas7bdat")
+        buckets: Number of PatID-range buckets per subsample slice (default: 1)
+        engine: Assembly engine name, "duckdb" or "polars" (default: "duckdb")
+        tables: Output tables to build (None = all)
+        id_offsets: Largest new ID already assigned, per crosswalk key (None = none)
+        append: Stage appends to the existing outputs instead of writing new ones
+        write_outputs: Add export nodes (False = leave assembled tables in DuckDB)
+        sample_fraction: Ingest only this fraction of each subsample's patients (None = all)
+        patients: Original (samplenum, PatID) pairs to ingest (None = all patients)
+        start_date: Ingest only rows dated on or after this day (None = no lower bound)
+        end_date: Ingest only rows dated on or before this day (None = no upper bound)
+        slice_pool: Executor for table slices (None = each table runs its slices in turn)
+        export_stats: List that each export node appends its ExportStats to
+        layout: How to split each output table across files (None = one file each)
+        ingest_progress: Optional progress tracker for the ingest nodes
+        transform_progress: Optional progress tracker for the assemble nodes
+        export_progress: Optional progress tracker for the export nodes
+
+    Returns:
+        Nodes ready for run_dag()
+
+    Raises:
+        ValueError: If a table name is not in TABLES
+    """
+    outputs = [name for name in TABLES if tables is None or name in tables]
+    inputs, crosswalk_keys = table_closure(tables if tables is not None else outputs)
+    temp_dir = Path(output_dir) / "_temp"
+    assembly_engine = get_engine(engine)
+    assembly_engine.prepare(con, temp_dir)
+    crosswalk_by_column = {cw.id_column: key for key, cw in CROSSWALKS.items()}
+
+    def on_cursor(step: Callable[[duckdb.DuckDBPyConnection], None]) -> None:
+        cursor = con.cursor()
+        try:
+            step(cursor)
+        finally:
+            cursor.close()
+
+    def ingest(table_name: str) -> None:
+        ingest_table(
+            input_dir,
+            table_name,
+            subsamples,
+            output_dir,
+            file_ext,
+            sample_fraction=sample_fraction,
+            patients=patients,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        _report(ingest_progress, f"Ingesting {table_name}")
+
+    def crosswalk(crosswalk_key: str) -> None:
+        offset = (id_offsets or {}).get(crosswalk_key, 0)
+        on_cursor(lambda cursor: build_crosswalk(cursor, temp_dir, crosswalk_key, offset))
+
+    def assemble(table_name: str) -> None:
+        if table_name in SYNTHESISED_TABLES:
+            on_cursor(lambda cursor: synthesise_table(cursor, table_name))
+        else:
+            on_cursor(
+                lambda cursor: assemble_table(
+                    cursor, temp_dir, table_name, assembly_engine, buckets, slice_pool
+                )
+            )
+        _report(transform_progress, f"Transforming {table_name}")
+
+    def export(table_name: str) -> None:
+        stats = []
+        on_cursor(
+            lambda cursor: stats.append(
+                timed_export(cursor, table_name, output_dir, fmt, append, layout)
+            )
+        )
+        if export_stats is not None:
+            export_stats.extend(stats)
+        _report(export_progress, f"Exporting {table_name}")
+
+    def finish() -> None:
+        names = [CROSSWALKS[key].crosswalk_name for key in crosswalk_keys]
+        crosswalks = {name: name for name in names}
+        on_cursor(lambda cursor: finish_database(cursor, output_dir, crosswalks, append))
+
+    nodes = []
+    for table_name in inputs:
+        nodes.append(Node(f"ingest:{table_name}", lambda t=table_name: ingest(t)))
+
+    for key in crosswalk_keys:
+        crosswalk_def = CROSSWALKS[key]
+        nodes.append(
+            Node(
+                f"crosswalk:{key}",
+                lambda k=key: crosswalk(k),
+                tuple(f"ingest:{source}" for source in crosswalk_def.source_tables),
+            )
+        )
+
+    for table_name in outputs:
+        table_def = TABLES[table_name]
+        if table_name in SYNTHESISED_TABLES:
+            depends_on = (f"crosswalk:{SYNTHESISED_TABLES[table_name]}",)
+        else:
+            depends_on = (f"ingest:{table_name}",) + tuple(
+                f"crosswalk:{crosswalk_by_column[id_col]}" for id_col in table_def.crosswalk_ids
+            )
+        nodes.append(Node(f"assemble:{table_name}", lambda t=table_name: assemble(t), depends_on))
+        if write_outputs:
+            # Exports are leaves; the largest inputs start first so the
+            # longest export is not queued behind the small ones
+            nodes.append(
+                Node(
+                    f"export:{table_name}",
+                    lambda t=table_name: export(t),
+                    (f"assemble:{table_name}",),
+                    weight=_input_bytes(input_dir, table_name, subsamples, file_ext),
+                    group="export",
+                )
+            )
+
+    if write_outputs and "duckdb" in split_formats(fmt):
+        nodes.append(
+            Node(
+                "export:database",
+                finish,
+                tuple(f"export:{table_name}" for table_name in outputs)
+                + tuple(f"crosswalk:{key}" for key in crosswalk_keys),
+            )
+        )
+
+    return nodes
+
+
+def _input_bytes(input_dir: Path | str, table_name: str, subsamples: list[int], file_ext: str) -> int:
+    """Total size of a table's source files; 0 for tables synthesised from crosswalks."""
+    if table_name in SYNTHESISED_TABLES:
+        return 0
+    return sum(
+        path.stat().st_size
+        for samplenum in subsamples
+        if (path := source_file_path(input_dir, table_name, samplenum, file_ext)).exists()
+    )
+
+
+def _report(progress: ProgressTracker | None, description: str) -> None:
+    """Report a finished node to a progress tracker, if there is one."""
+    if progress:
+        progress.update_description(description)
+        progress.advance()
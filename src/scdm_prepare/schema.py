@@ -10,6 +10,48 @@ class CrosswalkDef:
     crosswalk_name: str
 
 
+@dataclass(frozen=True)
+class ParquetSettings:
+    """Parquet writer settings; None leaves a setting at DuckDB's default.
+
+    DuckDB writes a bloom filter for every dictionary-encoded column chunk,
+    so raising the dictionary size limit is also how ID and code columns
+    get bloom filters for point lookups.
+    """
+
+    # Rows per row group, the unit readers skip by min/max statistics
+    row_group_size: int | None = None
+    # zstd level, 1 (fastest) to 22 (smallest)
+    compression_level: int | None = None
+    # Most distinct values a column chunk may dictionary-encode (0 = no dictionaries)
+    dictionary_size_limit: int | None = None
+    # False positive ratio of the bloom filters
+    bloom_filter_fpp: float | None = None
+
+    def override(self, other: "ParquetSettings | None") -> "ParquetSettings":
+        """Return these settings with the ones ``other`` sets replaced."""
+        if other is None:
+            return self
+        return ParquetSettings(
+            **{
+                name: value if value is not None else getattr(self, name)
+                for name, value in vars(other).items()
+            }
+        )
+
+
+# Claims tables are read by PatID point lookups and code scans. Twice
+# DuckDB's default row group size lets the default dictionary limit, which
+# scales with it, cover a row group's distinct codes, so DX/PX/Rx get bloom
+# filters; files are smaller and code lookups faster, while sorted PatIDs
+# still prune by min/max (see benchmarks/bench_parquet.py). PatID gets a
+# bloom filter only while a row group's patients fit the dictionary limit,
+# which holds at claims densities of several rows per patient. EncounterID
+# is unique per row, so it never fits and gets no bloom filter, and DuckDB
+# writes no page index; neither has a setting here
+_CLAIMS_PARQUET = ParquetSettings(row_group_size=245_760)
+
+
 @dataclass(frozen=True)
 class TableDef:
     """Definition of a SCDM table schema."""
@@ -18,6 +60,11 @@ class TableDef:
     columns: tuple[str, ...]
     sort_keys: tuple[str, ...]
     crosswalk_ids: dict[str, str]
+    # Columns a --start-date/--end-date window applies to: one event date,
+    # or a (start, end) span that is clipped to the window
+    date_columns: tuple[str, ...] = ()
+    # Parquet writer preset, overridden by the export options
+    parquet: ParquetSettings = ParquetSettings()
 
 
 TABLES = {
@@ -35,6 +82,7 @@ TABLES = {
         ),
         sort_keys=("PatID", "Enr_Start", "Enr_End", "MedCov", "DrugCov", "Chart"),
         crosswalk_ids={"PatID": "inner"},
+        date_columns=("Enr_Start", "Enr_End"),
     ),
     "demographic": TableDef(
         name="demographic",
@@ -57,6 +105,8 @@ TABLES = {
         columns=("PatID", "ProviderID", "RxDate", "Rx", "Rx_CodeType", "RxSup", "RxAmt"),
         sort_keys=("PatID", "RxDate"),
         crosswalk_ids={"PatID": "inner"},
+        date_columns=("RxDate",),
+        parquet=_CLAIMS_PARQUET,
     ),
     "encounter": TableDef(
         name="encounter",
@@ -75,6 +125,8 @@ TABLES = {
         ),
         sort_keys=("PatID", "ADate"),
         crosswalk_ids={"PatID": "inner", "EncounterID": "left", "FacilityID": "left"},
+        date_columns=("ADate",),
+        parquet=_CLAIMS_PARQUET,
     ),
     "diagnosis": TableDef(
         name="diagnosis",
@@ -92,6 +144,8 @@ TABLES = {
         ),
         sort_keys=("PatID", "ADate"),
         crosswalk_ids={"PatID": "inner", "EncounterID": "left", "ProviderID": "left"},
+        date_columns=("ADate",),
+        parquet=_CLAIMS_PARQUET,
     ),
     "procedure": TableDef(
         name="procedure",
@@ -107,6 +161,8 @@ TABLES = {
         ),
         sort_keys=("PatID", "ADate"),
         crosswalk_ids={"PatID": "inner", "EncounterID": "left", "ProviderID": "left"},
+        date_columns=("ADate",),
+        parquet=_CLAIMS_PARQUET,
     ),
     "death": TableDef(
         name="death",
@@ -152,3 +208,6 @@ CROSSWALKS = {
 }
 
 SOURCE_FILE_EXTENSION = ".sas7bdat"
+
+# Parquet key-value metadata key naming the columns a file is sorted by
+SORTED_BY_METADATA_KEY = "scdm_prepare.sorted_by"
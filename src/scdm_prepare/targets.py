@@ -0,0 +1,158 @@
+"""Derive several subsample-range targets from one assembled build."""
+
+import re
+from pathlib import Path
+
+import duckdb
+
+from scdm_prepare.export import Layout, export_table, finish_database, samplenum_partitions, split_formats
+from scdm_prepare.progress import ProgressTracker
+from scdm_prepare.schema import CROSSWALKS
+from scdm_prepare.transform import output_id_columns
+
+
+def parse_ranges(spec: str) -> list[tuple[int, int]]:
+    """Parse a comma-separated list of subsample ranges such as "1-5,1-10,1-20".
+
+    A single number N is the range N-N.
+
+    Args:
+        spec: Range specification
+
+    Returns:
+        (first, last) pairs in the order given, without duplicates
+
+    Raises:
+        ValueError: If a range is malformed or runs backwards
+    """
+    ranges = []
+    for part in spec.split(","):
+        match = re.fullmatch(r"\s*(\d+)\s*(?:-\s*(\d+)\s*)?", part)
+        if match is None:
+            raise ValueError(f"Invalid subsample range: {part.strip()!r}")
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        if first > last:
+            raise ValueError(f"Invalid subsample range: {first}-{last}")
+        if (first, last) not in ranges:
+            ranges.append((first, last))
+    return ranges
+
+
+def export_target(
+    con: duckdb.DuckDBPyConnection,
+    first: int,
+    last: int,
+    subsamples: list[int],
+    tables: list[str],
+    crosswalk_keys: list[str],
+    output_dir: Path | str,
+    fmt: str,
+    progress: ProgressTracker | None = None,
+    filters: dict | None = None,
+    layout: Layout | None = None,
+) -> dict:
+    """Export one subsample range from tables assembled over a wider range.
+
+    Crosswalk IDs are numbered in samplenum order, so the IDs of subsamples
+    ``first``..``last`` form one contiguous block in every crosswalk, and a
+    build of just that range would number the same block from 1. Each table
+    is therefore derived by keeping the rows whose PatID (or, for provider
+    and facility, own ID) falls in the range's block and shifting every ID
+    column down by the number of IDs assigned to earlier subsamples. The
+    assembled tables are already sorted, so no joins or sorts are repeated.
+    A target in the duckdb format also gets the range's crosswalks, shifted
+    the same way.
+
+    Args:
+        con: DuckDB connection holding the assembled tables and crosswalks
+        first: First subsample of the target
+        last: Last subsample of the target
+        subsamples: Subsample numbers in the target
+        tables: Output tables to export
+        crosswalk_keys: Keys of the crosswalks the tables use
+        output_dir: Output directory for the target
+        fmt: Output format, or several separated by commas (e.g. "parquet,csv")
+        progress: Optional progress tracker with update_description() and advance()
+        filters: Row filters of the build from build_filters() (None = none)
+        layout: How to split each table across files (None = one file each)
+
+    Returns:
+        Manifest of the target, identical to that of a build of just this range
+    """
+    offsets = {}
+    counts = {}
+    for key in crosswalk_keys:
+        crosswalk_name = CROSSWALKS[key].crosswalk_name
+        offsets[key], counts[key] = con.execute(f"""
+            SELECT
+                COUNT(*) FILTER (WHERE samplenum < {first}),
+                COUNT(*) FILTER (WHERE samplenum BETWEEN {first} AND {last})
+            FROM {crosswalk_name}
+        """).fetchone()
+
+    table_entries = {}
+    for table_name in tables:
+        if progress:
+            progress.update_description(f"Exporting {table_name} ({first}-{last})")
+        id_columns = output_id_columns(table_name)
+        key_column = "PatID" if "PatID" in id_columns else next(iter(id_columns))
+        key = id_columns[key_column]
+        shifts = [
+            f"{column} - {offsets[column_key]} AS {column}"
+            for column, column_key in id_columns.items()
+            if offsets[column_key]
+        ]
+        replace = f" REPLACE ({', '.join(shifts)})" if shifts else ""
+
+        # Subsample partitions of the view are the table's, shifted like its IDs
+        partitions = None
+        if layout is not None and layout.partition_by == "samplenum":
+            partitions = [
+                (samplenum, column, low - offsets[key], high - offsets[key])
+                for samplenum, column, low, high in samplenum_partitions(con, table_name)
+                if first <= samplenum <= last
+            ]
+
+        view = f"_target_{table_name}"
+        con.execute(f"""
+            CREATE OR REPLACE VIEW {view} AS
+            SELECT *{replace}
+            FROM {table_name}
+            WHERE {key_column} BETWEEN {offsets[key] + 1} AND {offsets[key] + counts[key]}
+        """)
+        try:
+            parts = export_table(
+                con, table_name, output_dir, fmt, source=view, layout=layout, partitions=partitions
+            )
+            rows = con.execute(f"SELECT COUNT(*) FROM {view}").fetchone()[0]
+        finally:
+            con.execute(f"DROP VIEW {view}")
+        table_entries[table_name] = {"rows": rows}
+        if parts is not None:
+            table_entries[table_name]["parts"] = parts
+        if progress:
+            progress.advance()
+
+    if "duckdb" in split_formats(fmt):
+        crosswalks = {}
+        for key in crosswalk_keys:
+            crosswalk_def = CROSSWALKS[key]
+            id_column = crosswalk_def.id_column
+            crosswalks[crosswalk_def.crosswalk_name] = f"""(
+                SELECT * REPLACE ({id_column} - {offsets[key]} AS {id_column})
+                FROM {crosswalk_def.crosswalk_name}
+                WHERE samplenum BETWEEN {first} AND {last}
+            )"""
+        finish_database(con, output_dir, crosswalks)
+
+    manifest = {
+        "format": fmt,
+        "subsamples": list(subsamples),
+        "tables": table_entries,
+        "crosswalks": {key: {"max_id": counts[key]} for key in crosswalk_keys},
+    }
+    manifest.update(filters or {})
+    if layout is not None and not layout.single_file:
+        manifest["layout"] = layout.manifest_entry()
+    return manifest
@@ -1,16 +1,59 @@
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
 from pathlib import Path
 
 import duckdb
 import polars as pl
+import pyarrow.parquet as pq
 
+from scdm_prepare.engines import AssemblyPlan, DuckDBEngine, PolarsEngine, build_plan, get_engine
 from scdm_prepare.progress import ProgressTracker
-from scdm_prepare.schema import CROSSWALKS, TABLES
+from scdm_prepare.schema import CROSSWALKS, SORTED_BY_METADATA_KEY, TABLES, TableDef
+
+# Tables built from a crosswalk rather than from their own source files,
+# mapped to the key of that crosswalk in CROSSWALKS
+SYNTHESISED_TABLES = {
+    "provider": "providerid",
+    "facility": "facilityid",
+}
+
+
+def output_id_columns(table_name: str) -> dict[str, str]:
+    """Map each new-ID column of an output table to its crosswalk key.
+
+    Args:
+        table_name: Name of the output table
+
+    Returns:
+        Mapping of column name to key in CROSSWALKS, e.g. {"PatID": "patid"}
+    """
+    if table_name in SYNTHESISED_TABLES:
+        key = SYNTHESISED_TABLES[table_name]
+        return {CROSSWALKS[key].id_column: key}
+    crosswalk_by_column = {cw.id_column: key for key, cw in CROSSWALKS.items()}
+    return {column: crosswalk_by_column[column] for column in TABLES[table_name].crosswalk_ids}
 
 
 def build_crosswalks(con: duckdb.DuckDBPyConnection, temp_dir: Path | str) -> None:
     """Build crosswalk tables for PatID, EncounterID, ProviderID, and FacilityID.
 
-    For each crosswalk defined in CROSSWALKS:
+    Calls build_crosswalk() for each crosswalk defined in CROSSWALKS.
+
+    Args:
+        con: DuckDB connection
+        temp_dir: Directory containing ingested parquet files (output of Phase 2)
+    """
+    for crosswalk_key in CROSSWALKS:
+        build_crosswalk(con, temp_dir, crosswalk_key)
+
+
+def build_crosswalk(
+    con: duckdb.DuckDBPyConnection,
+    temp_dir: Path | str,
+    crosswalk_key: str,
+    id_offset: int = 0,
+) -> None:
+    """Build one crosswalk table from its source table's ingested files.
+
     1. Extract distinct (original_id, samplenum) pairs from source table(s)
     2. Filter out NULL original IDs
     3. Assign sequential new IDs via ROW_NUMBER() ordered by samplenum and original_id
@@ -22,38 +65,45 @@ def build_crosswalks(con: duckdb.DuckDBPyConnection, temp_dir: Path | str) -> No
     Same original ID in different subsamples gets different ROW_NUMBER values
     because samplenum is part of the DISTINCT key.
 
+    When appending subsamples to an earlier build, ``id_offset`` is the
+    largest ID that build assigned, so numbering continues where it stopped.
+
     Args:
         con: DuckDB connection
         temp_dir: Directory containing ingested parquet files (output of Phase 2)
+        crosswalk_key: Key of the crosswalk in CROSSWALKS (e.g., "patid")
+        id_offset: Added to every new ID (default: 0, numbering from 1)
     """
     temp_dir = Path(temp_dir)
+    crosswalk_def = CROSSWALKS[crosswalk_key]
+    id_column = crosswalk_def.id_column
+    source_tables = crosswalk_def.source_tables
+    table_name = crosswalk_def.crosswalk_name
+
+    # Build glob pattern for source table parquet files, preferring the full
+    # ID columns that a patient-list ingest keeps beside its filtered rows
+    source_table = source_tables[0]
+    glob_pattern = str(temp_dir / f"{source_table}_*.parquet")
+    if list((temp_dir / "ids").glob(f"{source_table}_*.parquet")):
+        glob_pattern = str(temp_dir / "ids" / f"{source_table}_*.parquet")
+
+    # Build SQL to extract distinct IDs, filter NULLs, and assign sequential IDs
+    sql = f"""
+    CREATE OR REPLACE TABLE {table_name} AS
+    SELECT
+        orig_{id_column},
+        samplenum,
+        ROW_NUMBER() OVER (ORDER BY samplenum, orig_{id_column}) + {id_offset} AS {id_column}
+    FROM (
+        SELECT DISTINCT
+            {id_column} AS orig_{id_column},
+            samplenum
+        FROM read_parquet('{glob_pattern}')
+        WHERE {id_column} IS NOT NULL
+    )
+    """
 
-    for crosswalk_name, crosswalk_def in CROSSWALKS.items():
-        id_column = crosswalk_def.id_column
-        source_tables = crosswalk_def.source_tables
-        table_name = crosswalk_def.crosswalk_name
-
-        # Build glob pattern for source table parquet files
-        source_table = source_tables[0]
-        glob_pattern = str(temp_dir / f"{source_table}_*.parquet")
-
-        # Build SQL to extract distinct IDs, filter NULLs, and assign sequential IDs
-        sql = f"""
-        CREATE OR REPLACE TABLE {table_name} AS
-        SELECT
-            orig_{id_column},
-            samplenum,
-            ROW_NUMBER() OVER (ORDER BY samplenum, orig_{id_column}) AS {id_column}
-        FROM (
-            SELECT DISTINCT
-                {id_column} AS orig_{id_column},
-                samplenum
-            FROM read_parquet('{glob_pattern}')
-            WHERE {id_column} IS NOT NULL
-        )
-        """
-
-        con.execute(sql)
+    con.execute(sql)
 
 
 def get_crosswalk(
@@ -78,7 +128,15 @@ def get_crosswalk(
     return con.sql(f"SELECT * FROM {crosswalk_name}").pl()
 
 
-def assemble_tables(con: duckdb.DuckDBPyConnection, temp_dir: Path | str, progress: ProgressTracker | None = None) -> None:
+def assemble_tables(
+    con: duckdb.DuckDBPyConnection,
+    temp_dir: Path | str,
+    progress: ProgressTracker | None = None,
+    workers: int = 1,
+    buckets: int = 1,
+    engine: str = "duckdb",
+    tables: list[str] | None = None,
+) -> None:
     """Assemble all 9 SCDM output tables from ingested data and crosswalks.
 
     For each of the 7 data-derived tables (enrollment, demographic, dispensing,
@@ -88,6 +146,31 @@ def assemble_tables(con: duckdb.DuckDBPyConnection, temp_dir: Path | str, progre
     3. LEFT JOIN other crosswalks as needed (EncounterID, ProviderID, FacilityID)
     4. ORDER BY the table's sort keys
 
+    Each step is described by an engine-independent AssemblyPlan, which
+    ``engine`` compiles either to DuckDB SQL or to a streaming Polars
+    LazyFrame (see scdm_prepare.engines). Either way the assembled table ends
+    up in DuckDB for export.
+
+    Crosswalk IDs are numbered in (samplenum, original ID) order, so every new
+    PatID in subsample k is smaller than every new PatID in subsample k+1.
+    Tables sorted by PatID first are therefore assembled one subsample slice
+    at a time: each slice is sorted independently and the slices are appended
+    in samplenum order, giving the same result as one global ORDER BY.
+
+    With ``buckets`` > 1, each subsample slice is further split into that many
+    contiguous ranges of new PatID. Every crosswalk join is local to a
+    patient and subsample, so buckets are assembled and sorted independently
+    and concatenate in order; the peak memory of each join and sort scales
+    with 1/``buckets``. That is all buckets bound: the PatID range filters
+    the crosswalked PatID, not the ingested files' row groups, so every
+    bucket rescans its subsample's whole ingested files (N buckets cost N-1
+    extra scans), and the assembled table is still exported in one pass.
+
+    The tables only depend on the crosswalks, never on each other, so slices
+    of all tables are scheduled together, biggest table first, with up to
+    ``workers`` running at once on separate DuckDB cursors. The cursors share
+    one database and therefore one memory limit.
+
     Also synthesises Provider and Facility tables by calling synthesise_tables()
     internally, which derives them from the providerid_crosswalk and facilityid_crosswalk.
 
@@ -95,96 +178,63 @@ def assemble_tables(con: duckdb.DuckDBPyConnection, temp_dir: Path | str, progre
         con: DuckDB connection
         temp_dir: Directory containing ingested parquet files
         progress: Optional progress tracker with update_description() and advance()
+        workers: Maximum number of slices assembled concurrently (default: 1)
+        buckets: Number of PatID-range buckets per subsample slice (default: 1)
+        engine: Assembly engine name, "duckdb" or "polars" (default: "duckdb")
+        tables: Data-derived tables to assemble (None = all)
+
+    Raises:
+        ValueError: If the engine name is not supported
     """
     temp_dir = Path(temp_dir)
+    assembly_engine = get_engine(engine)
 
     # Define data-derived tables (exclude provider and facility which are synthesised)
     data_derived_tables = {
         name: table_def
         for name, table_def in TABLES.items()
-        if name not in ("provider", "facility")
+        if name not in SYNTHESISED_TABLES and (tables is None or name in tables)
     }
 
-    for table_name, table_def in data_derived_tables.items():
-        if progress:
-            progress.update_description(f"Transforming {table_name}")
-        # Check if the source table exists
-        matching_files = list(Path(temp_dir).glob(f"{table_name}_*.parquet"))
-        if not matching_files:
-            # Skip this table if no source files exist
-            continue
-        # Build the SELECT clause with proper column selections
-        select_parts = []
-        join_clauses = []
-        join_aliases = {}
-
-        # Track which alias to use for each crosswalk
-        alias_counter = {"b": ord("b")}
-
-        for col in table_def.columns:
-            if col in table_def.crosswalk_ids:
-                # This column comes from a crosswalk
-                crosswalk_name = _get_crosswalk_name(col)
-                alias = _get_or_create_alias(join_aliases, crosswalk_name, alias_counter)
-                select_parts.append(f"{alias}.{col}")
-            else:
-                # This column comes from the source data
-                select_parts.append(f"a.{col}")
-
-        select_clause = ", ".join(select_parts)
-
-        # Build JOIN clauses based on crosswalk_ids
-        for id_col, join_type in table_def.crosswalk_ids.items():
-            crosswalk_name = _get_crosswalk_name(id_col)
-            alias = _get_or_create_alias(join_aliases, crosswalk_name, alias_counter)
-
-            # For source data, we need to determine the original column name
-            orig_col = f"a.{id_col}"
-
-            if join_type.upper() == "INNER":
-                join_clauses.append(
-                    f"INNER JOIN {crosswalk_name} AS {alias}\n"
-                    f"  ON {orig_col} = {alias}.orig_{id_col} AND a.samplenum = {alias}.samplenum"
-                )
-            else:  # LEFT
-                join_clauses.append(
-                    f"LEFT JOIN {crosswalk_name} AS {alias}\n"
-                    f"  ON {orig_col} = {alias}.orig_{id_col} AND a.samplenum = {alias}.samplenum"
+    slice_ranges = _patid_slice_ranges(con, buckets)
+
+    # Skip tables with no source files; start the biggest tables first so the
+    # longest assemblies are not left running alone at the end
+    pending = [
+        table_def
+        for table_name, table_def in data_derived_tables.items()
+        if list(temp_dir.glob(f"{table_name}_*.parquet"))
+    ]
+    pending.sort(key=lambda table_def: _source_bytes(temp_dir, table_def.name), reverse=True)
+
+    assembly_engine.prepare(con, temp_dir)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        for table_def in pending:
+            plans = _table_plans(table_def, temp_dir, slice_ranges)
+            futures = [pool.submit(assembly_engine.assemble, con, plan) for plan in plans]
+            running[table_def.name] = (plans, futures)
+
+        # Finalise each table as soon as all of its slices are done
+        while running:
+            finished = [
+                name for name, (_, futures) in running.items()
+                if all(future.done() for future in futures)
+            ]
+            if not finished:
+                wait(
+                    [future for _, futures in running.values() for future in futures],
+                    return_when=FIRST_COMPLETED,
                 )
-
-        # Build FROM clause with glob pattern
-        glob_pattern = str(temp_dir / f"{table_name}_*.parquet")
-        from_clause = f"read_parquet('{glob_pattern}') AS a"
-
-        # Build ORDER BY clause
-        order_parts = []
-        for sort_key in table_def.sort_keys:
-            if sort_key in table_def.crosswalk_ids:
-                # Sort key comes from a crosswalk
-                crosswalk_name = _get_crosswalk_name(sort_key)
-                alias = join_aliases.get(crosswalk_name, "")
-                if alias:
-                    order_parts.append(f"{alias}.{sort_key}")
-                else:
-                    order_parts.append(f"{sort_key}")
-            else:
-                # Sort key comes from source data
-                order_parts.append(f"a.{sort_key}")
-
-        order_by_clause = ", ".join(order_parts)
-
-        # Build final SQL
-        sql = f"""
-        CREATE OR REPLACE TABLE {table_name} AS
-        SELECT {select_clause}
-        FROM {from_clause}
-        {chr(10).join(join_clauses)}
-        ORDER BY {order_by_clause}
-        """
-
-        con.execute(sql)
-        if progress:
-            progress.advance()
+                continue
+            for table_name in finished:
+                plans, futures = running.pop(table_name)
+                relations = [future.result() for future in futures]
+                if progress:
+                    progress.update_description(f"Transforming {table_name}")
+                _store_table(con, table_name, plans, relations, assembly_engine)
+                if progress:
+                    progress.advance()
 
     # Synthesise provider and facility tables (always done, progress handled above)
     synthesise_tables(con)
@@ -195,6 +245,188 @@ def assemble_tables(con: duckdb.DuckDBPyConnection, temp_dir: Path | str, progre
         progress.advance()
 
 
+def assemble_table(
+    con: duckdb.DuckDBPyConnection,
+    temp_dir: Path | str,
+    table_name: str,
+    assembly_engine: DuckDBEngine | PolarsEngine,
+    buckets: int = 1,
+    pool: Executor | None = None,
+) -> None:
+    """Assemble one data-derived table, as a step of assemble_tables().
+
+    Needs only the table's own ingested files and the crosswalks named in its
+    crosswalk_ids, so a scheduler can run it as soon as those exist.
+
+    Args:
+        con: DuckDB connection
+        temp_dir: Directory containing ingested parquet files
+        table_name: Name of the table to assemble
+        assembly_engine: Engine from get_engine(), already prepared
+        buckets: Number of PatID-range buckets per subsample slice, each
+            rescanning the slice's files (default: 1)
+        pool: Executor that runs the table's slices (None = run them in turn)
+    """
+    temp_dir = Path(temp_dir)
+    plans = _table_plans(TABLES[table_name], temp_dir, _patid_slice_ranges(con, buckets))
+    if pool is None:
+        relations = [assembly_engine.assemble(con, plan) for plan in plans]
+    else:
+        futures = [pool.submit(assembly_engine.assemble, con, plan) for plan in plans]
+        relations = [future.result() for future in futures]
+    _store_table(con, table_name, plans, relations, assembly_engine)
+
+
+def _patid_slice_ranges(
+    con: duckdb.DuckDBPyConnection, buckets: int
+) -> list[tuple[int, int | None, int | None]]:
+    """Split the new PatID space into per-subsample (and per-bucket) ranges.
+
+    Args:
+        con: DuckDB connection holding patid_crosswalk
+        buckets: Number of contiguous PatID ranges per subsample
+
+    Returns:
+        List of (samplenum, first PatID, last PatID) in PatID order. The PatID
+        bounds are None when buckets is 1, as the samplenum alone selects the slice.
+    """
+    if buckets <= 1:
+        rows = con.execute(
+            "SELECT DISTINCT samplenum FROM patid_crosswalk ORDER BY samplenum"
+        ).fetchall()
+        return [(row[0], None, None) for row in rows]
+
+    return con.execute(f"""
+        SELECT samplenum, MIN(PatID), MAX(PatID)
+        FROM (
+            SELECT
+                samplenum,
+                PatID,
+                NTILE({buckets}) OVER (PARTITION BY samplenum ORDER BY PatID) AS bucket
+            FROM patid_crosswalk
+        )
+        GROUP BY samplenum, bucket
+        ORDER BY samplenum, bucket
+    """).fetchall()
+
+
+def _table_plans(
+    table_def: TableDef,
+    temp_dir: Path,
+    slice_ranges: list[tuple[int, int | None, int | None]],
+) -> list[AssemblyPlan]:
+    """Split the assembly of one table into independent slice plans.
+
+    PatID-major tables get one slice per subsample (or per PatID bucket),
+    written to a working table; any other table is a single slice written
+    straight to its output.
+
+    Args:
+        table_def: Definition of the table to assemble
+        temp_dir: Directory containing ingested parquet files
+        slice_ranges: (samplenum, first PatID, last PatID) ranges in PatID order
+
+    Returns:
+        List of assembly plans in output order
+    """
+    if not (_is_patid_major(table_def) and slice_ranges):
+        return [build_plan(table_def, temp_dir)]
+    plans = []
+    for index, (samplenum, first, last) in enumerate(slice_ranges):
+        patid_range = (first, last) if first is not None else None
+        plans.append(
+            build_plan(
+                table_def,
+                temp_dir,
+                target=f"_{table_def.name}_slice_{index}",
+                samplenum=samplenum,
+                patid_range=patid_range,
+                presorted_file=_presorted_file(table_def, temp_dir, samplenum),
+            )
+        )
+    return plans
+
+
+def _presorted_file(table_def: TableDef, temp_dir: Path, samplenum: int) -> Path | None:
+    """Return a subsample's ingested file if ingest recorded it as sorted.
+
+    Ingest records the sort order of each file in its parquet metadata. A
+    file sorted by the table's sort keys on original IDs is also sorted by
+    the new IDs, because the crosswalks number IDs in original-ID order
+    within each subsample.
+
+    Args:
+        table_def: Definition of the table being assembled
+        temp_dir: Directory containing ingested parquet files
+        samplenum: Subsample number
+
+    Returns:
+        Path to the sorted file, or None if it is missing or not known-sorted
+    """
+    path = temp_dir / f"{table_def.name}_{samplenum}.parquet"
+    if not path.exists():
+        return None
+    metadata = pq.read_metadata(path).metadata or {}
+    sorted_by = metadata.get(SORTED_BY_METADATA_KEY.encode(), b"").decode()
+    return path if sorted_by == ",".join(table_def.sort_keys) else None
+
+
+def _store_table(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    plans: list[AssemblyPlan],
+    relations: list[str],
+    assembly_engine: DuckDBEngine | PolarsEngine,
+) -> None:
+    """Store assembled slices as the output table and release the working copies.
+
+    Args:
+        con: DuckDB connection
+        table_name: Name of the output table
+        plans: Plans that produced the slices, in output order
+        relations: SQL relations holding the slices, in output order
+        assembly_engine: Engine that ran the plans
+    """
+    if relations == [table_name]:
+        return
+    _concatenate_slices(con, table_name, relations)
+    for plan in plans:
+        assembly_engine.release(con, plan)
+
+
+def _concatenate_slices(
+    con: duckdb.DuckDBPyConnection, table_name: str, relations: list[str]
+) -> None:
+    """Append assembled slices to the output table in order.
+
+    Args:
+        con: DuckDB connection
+        table_name: Name of the output table
+        relations: SQL relations holding the slices, in output order
+    """
+    con.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM {relations[0]}")
+    for relation in relations[1:]:
+        con.execute(f"INSERT INTO {table_name} SELECT * FROM {relation}")
+
+
+def _source_bytes(temp_dir: Path, table_name: str) -> int:
+    """Return the total size of a table's ingested parquet files in bytes."""
+    return sum(path.stat().st_size for path in temp_dir.glob(f"{table_name}_*.parquet"))
+
+
+def _is_patid_major(table_def: TableDef) -> bool:
+    """Return True if a table is sorted by crosswalked PatID first.
+
+    Such tables can be assembled per subsample, because the PatID crosswalk
+    assigns new IDs in samplenum-major order.
+    """
+    return (
+        bool(table_def.sort_keys)
+        and table_def.sort_keys[0] == "PatID"
+        and table_def.crosswalk_ids.get("PatID") == "inner"
+    )
+
+
 def synthesise_tables(con: duckdb.DuckDBPyConnection) -> None:
     """Synthesise Provider and Facility tables from crosswalks.
 
@@ -213,67 +445,40 @@ def synthesise_tables(con: duckdb.DuckDBPyConnection) -> None:
     Args:
         con: DuckDB connection
     """
-    # Provider table
-    con.execute("""
-        CREATE OR REPLACE TABLE provider AS
-        SELECT
-            ProviderID,
-            '99' AS Specialty,
-            '2' AS Specialty_CodeType
-        FROM providerid_crosswalk
-        WHERE orig_ProviderID IS NOT NULL
-        ORDER BY ProviderID
-    """)
-
-    # Facility table
-    con.execute("""
-        CREATE OR REPLACE TABLE facility AS
-        SELECT
-            FacilityID,
-            '' AS Facility_Location
-        FROM facilityid_crosswalk
-        WHERE orig_FacilityID IS NOT NULL
-        ORDER BY FacilityID
-    """)
-
-
-def _get_crosswalk_name(id_column: str) -> str:
-    """Map an ID column name to its corresponding crosswalk name.
-
-    Args:
-        id_column: Column name (e.g., "PatID", "EncounterID")
+    for table_name in SYNTHESISED_TABLES:
+        synthesise_table(con, table_name)
 
-    Returns:
-        Crosswalk table name (e.g., "patid_crosswalk", "encounterid_crosswalk")
 
-    Raises:
-        ValueError: If no crosswalk is defined for the given column
-    """
-    mapping = {cw.id_column: cw.crosswalk_name for cw in CROSSWALKS.values()}
-    crosswalk_name = mapping.get(id_column)
-    if crosswalk_name is None:
-        raise ValueError(f"no crosswalk defined for column: {id_column}")
-    return crosswalk_name
-
-
-def _get_or_create_alias(
-    join_aliases: dict[str, str], crosswalk_name: str, alias_counter: dict[str, int]
-) -> str:
-    """Get or create an alias for a crosswalk in JOIN clauses.
+def synthesise_table(con: duckdb.DuckDBPyConnection, table_name: str) -> None:
+    """Synthesise one of the crosswalk-derived tables (provider or facility).
 
     Args:
-        join_aliases: Dictionary mapping crosswalk names to aliases
-        crosswalk_name: Name of the crosswalk table
-        alias_counter: Counter for generating new aliases
+        con: DuckDB connection
+        table_name: Name of the table in SYNTHESISED_TABLES
 
-    Returns:
-        Single-character alias (b, c, d, etc.)
+    Raises:
+        ValueError: If the table is not synthesised from a crosswalk
     """
-    if crosswalk_name not in join_aliases:
-        # Create new alias
-        next_ord = alias_counter["b"]
-        alias = chr(next_ord)
-        join_aliases[crosswalk_name] = alias
-        alias_counter["b"] = next_ord + 1
-
-    return join_aliases[crosswalk_name]
+    if table_name == "provider":
+        con.execute("""
+            CREATE OR REPLACE TABLE provider AS
+            SELECT
+                ProviderID,
+                '99' AS Specialty,
+                '2' AS Specialty_CodeType
+            FROM providerid_crosswalk
+            WHERE orig_ProviderID IS NOT NULL
+            ORDER BY ProviderID
+        """)
+    elif table_name == "facility":
+        con.execute("""
+            CREATE OR REPLACE TABLE facility AS
+            SELECT
+                FacilityID,
+                '' AS Facility_Location
+            FROM facilityid_crosswalk
+            WHERE orig_FacilityID IS NOT NULL
+            ORDER BY FacilityID
+        """)
+    else:
+        raise ValueError(f"not a synthesised table: {table_name}")
@@ -0,0 +1,251 @@
+"""Streaming writer for SAS transport (XPORT) version 8 files.
+
+The file is written from Arrow record batches one batch at a time, so a
+table never has to be held in memory. SAS reads it with the %XPT2LOC
+macro; pyreadstat.read_xport reads it too. Version 8 rather than 5 is
+written because SCDM variable names such as Discharge_Disposition are
+longer than version 5's 8 characters.
+"""
+
+import datetime
+import platform
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Header records, each padded to 80 bytes with blanks
+_LIBRARY_HEADER = "HEADER RECORD*******LIBV8   HEADER RECORD!!!!!!!000000000000000000000000000000"
+_MEMBER_HEADER = "HEADER RECORD*******MEMBV8  HEADER RECORD!!!!!!!000000000000000001600000000140"
+_DESCRIPTOR_HEADER = "HEADER RECORD*******DSCPTV8 HEADER RECORD!!!!!!!000000000000000000000000000000"
+_NAMESTR_HEADER = "HEADER RECORD*******NAMSTV8 HEADER RECORD!!!!!!!000000{count:04d}00000000000000000000"
+_OBSERVATION_HEADER = "HEADER RECORD*******OBSV8   HEADER RECORD!!!!!!!{rows:>15}"
+
+_RECORD_BYTES = 80
+_MAX_NAME_LENGTH = 32
+
+# Days and seconds from the SAS epoch, 1960-01-01, to the Unix epoch
+_EPOCH_DAYS = 3653
+_EPOCH_SECONDS = _EPOCH_DAYS * 86_400
+
+# IBM floating point encoding of SAS's standard missing value "."
+_MISSING = 0x2E << 56
+
+
+@dataclass(frozen=True)
+class XportVariable:
+    """One variable of an XPORT dataset."""
+
+    name: str
+    # Numeric variables are 8-byte IBM floating point; others are blank-padded text
+    numeric: bool
+    # Bytes per value
+    length: int
+    # SAS display format, e.g. "DATE" for dates, or "" for none
+    format: str = ""
+    format_length: int = 0
+
+
+def xport_variables(schema: pa.Schema, char_lengths: dict[str, int]) -> list[XportVariable]:
+    """Describe the columns of an Arrow schema as XPORT variables.
+
+    Numbers and booleans become numeric variables, dates numeric variables
+    with the DATE9. format and timestamps with DATETIME19.; strings become
+    character variables of the given length.
+
+    Args:
+        schema: Schema of the record batches to write
+        char_lengths: Length of each string column in bytes
+
+    Returns:
+        Variables in schema order
+
+    Raises:
+        ValueError: If a name is too long or a column's type has no SAS equivalent
+    """
+    variables = []
+    for field in schema:
+        if len(field.name) > _MAX_NAME_LENGTH:
+            raise ValueError(f"SAS variable names are at most {_MAX_NAME_LENGTH} characters: {field.name}")
+        if pa.types.is_date(field.type):
+            variables.append(XportVariable(field.name, True, 8, "DATE", 9))
+        elif pa.types.is_timestamp(field.type):
+            variables.append(XportVariable(field.name, True, 8, "DATETIME", 19))
+        elif (
+            pa.types.is_integer(field.type)
+            or pa.types.is_floating(field.type)
+            or pa.types.is_decimal(field.type)
+            or pa.types.is_boolean(field.type)
+        ):
+            variables.append(XportVariable(field.name, True, 8))
+        elif (
+            pa.types.is_string(field.type)
+            or pa.types.is_large_string(field.type)
+            or pa.types.is_string_view(field.type)
+        ):
+            variables.append(XportVariable(field.name, False, char_lengths[field.name]))
+        else:
+            raise ValueError(f"No SAS type for column {field.name} of type {field.type}")
+    return variables
+
+
+def write_xport(
+    path: Path | str,
+    dataset_name: str,
+    variables: list[XportVariable],
+    batch_sources: Iterable[Iterable[pa.RecordBatch]],
+) -> int:
+    """Write record batches from each source in turn as one XPORT dataset.
+
+    The observation count in the header is filled in once the last batch
+    is written, so the batches can be streamed without counting them first.
+
+    Args:
+        path: File to write
+        dataset_name: SAS dataset name, at most 32 characters
+        variables: Variables of the dataset, from xport_variables()
+        batch_sources: Iterables of record batches with the variables' columns
+
+    Returns:
+        Number of observations written
+
+    Raises:
+        ValueError: If the dataset name is too long or a text value is longer
+            than its variable
+    """
+    if len(dataset_name) > _MAX_NAME_LENGTH:
+        raise ValueError(f"SAS dataset names are at most {_MAX_NAME_LENGTH} characters: {dataset_name}")
+    positions = np.cumsum([0] + [variable.length for variable in variables])
+    namestrs = b"".join(
+        _namestr(number, variable, position)
+        for number, (variable, position) in enumerate(zip(variables, positions), start=1)
+    )
+    stamp = datetime.datetime.now().strftime("%d%b%y:%H:%M:%S").upper()
+    system = platform.system()[:8]
+
+    header = [
+        _record(_LIBRARY_HEADER),
+        _record(f"{'SAS':<8}{'SAS':<8}{'SASLIB':<8}{'9.4':<8}{system:<8}{'':<24}{stamp}"),
+        _record(stamp),
+        _record(_MEMBER_HEADER),
+        _record(_DESCRIPTOR_HEADER),
+        _record(f"{'SAS':<8}{dataset_name:<32}{'SASDATA':<8}{'9.4':<8}{system:<8}{stamp}"),
+        _record(stamp),
+        _record(_NAMESTR_HEADER.format(count=len(variables))),
+        _pad(namestrs),
+    ]
+    rows = 0
+    with open(path, "wb") as target:
+        target.write(b"".join(header))
+        observation_header = target.tell()
+        target.write(_record(_OBSERVATION_HEADER.format(rows=0)))
+        for batches in batch_sources:
+            for batch in batches:
+                target.write(_encode_batch(batch, variables, positions))
+                rows += batch.num_rows
+        data_bytes = rows * int(positions[-1])
+        target.write(b" " * (-data_bytes % _RECORD_BYTES))
+        target.seek(observation_header)
+        target.write(_record(_OBSERVATION_HEADER.format(rows=rows)))
+    return rows
+
+
+def _record(text: str) -> bytes:
+    """One 80-byte header record."""
+    return text.ljust(_RECORD_BYTES).encode("ascii")
+
+
+def _pad(data: bytes) -> bytes:
+    """Pad data with blanks to a whole number of 80-byte records."""
+    return data + b" " * (-len(data) % _RECORD_BYTES)
+
+
+def _namestr(number: int, variable: XportVariable, position: int) -> bytes:
+    """The 140-byte description of one variable."""
+    return b"".join([
+        int(2 - variable.numeric).to_bytes(2, "big"),  # 1 = numeric, 2 = character
+        bytes(2),
+        variable.length.to_bytes(2, "big"),
+        number.to_bytes(2, "big"),
+        variable.name[:8].ljust(8).encode("ascii"),
+        b" " * 40,  # label
+        variable.format.ljust(8).encode("ascii"),
+        variable.format_length.to_bytes(2, "big"),
+        bytes(2),  # format decimals
+        int(variable.numeric).to_bytes(2, "big"),  # justification: right for numbers
+        bytes(2),
+        b" " * 8,  # informat
+        bytes(4),
+        int(position).to_bytes(4, "big"),
+        variable.name.ljust(_MAX_NAME_LENGTH).encode("ascii"),
+        bytes(2),  # long label length
+        bytes(18),
+    ])
+
+
+def _encode_batch(batch: pa.RecordBatch, variables: list[XportVariable], positions: np.ndarray) -> bytes:
+    """Encode a record batch as fixed-length observations."""
+    rows = batch.num_rows
+    observations = np.full((rows, int(positions[-1])), ord(" "), dtype=np.uint8)
+    for variable, position in zip(variables, positions):
+        column = batch.column(variable.name)
+        if variable.numeric:
+            values = _ibm_floats(_sas_numbers(column)).astype(">u8").view(np.uint8).reshape(rows, 8)
+            observations[:, position:position + 8] = values
+        else:
+            _place_text(observations, column, variable, position)
+    return observations.tobytes()
+
+
+def _sas_numbers(column: pa.Array) -> np.ndarray:
+    """A numeric column as float64 SAS values, NaN for missing; dates count from 1960."""
+    if pa.types.is_date(column.type):
+        column = pc.add(pc.cast(pc.cast(column, pa.date32()), pa.int32()), _EPOCH_DAYS)
+    elif pa.types.is_timestamp(column.type):
+        seconds = pc.cast(pc.cast(column, pa.timestamp("s")), pa.int64())
+        column = pc.add(seconds, _EPOCH_SECONDS)
+    return pc.cast(column, pa.float64()).to_numpy(zero_copy_only=False)
+
+
+def _ibm_floats(values: np.ndarray) -> np.ndarray:
+    """Convert IEEE doubles to IBM System/360 doubles, SAS's transport encoding.
+
+    An IEEE double is a 53-bit mantissa times a power of 2; an IBM double is
+    a 56-bit fraction times a power of 16. Shifting the mantissa left by the
+    IEEE exponent modulo 4 turns the power of 2 into a power of 16 without
+    losing any bits, so the conversion is exact.
+    """
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.uint64)
+    exponent = ((bits >> np.uint64(52)) & np.uint64(0x7FF)).astype(np.int64) - 1023
+    shift = exponent % 4
+    ibm_exponent = (exponent - shift) // 4 + 65
+    if np.any((ibm_exponent > 127) & ~np.isnan(values)):
+        raise ValueError("Value too large for SAS transport files")
+    mantissa = (bits & np.uint64(0xFFFFFFFFFFFFF)) | np.uint64(1 << 52)
+    ibm = (
+        (bits & np.uint64(1 << 63))
+        | (np.clip(ibm_exponent, 0, 127).astype(np.uint64) << np.uint64(56))
+        | (mantissa << shift.astype(np.uint64))
+    )
+    # Zeros and numbers too small for IBM doubles are zero; NaN is missing
+    ibm[(values == 0) | (ibm_exponent < 0)] = 0
+    ibm[np.isnan(values)] = _MISSING
+    return ibm
+
+
+def _place_text(observations: np.ndarray, column: pa.Array, variable: XportVariable, position: int) -> None:
+    """Copy a string column's UTF-8 bytes into its blank-filled field of every observation."""
+    text = pc.cast(pc.fill_null(column, ""), pa.large_string())
+    if isinstance(text, pa.ChunkedArray):
+        text = text.combine_chunks()
+    offsets = np.frombuffer(text.buffers()[1], dtype=np.int64)[text.offset:text.offset + len(text) + 1]
+    data = np.frombuffer(text.buffers()[2] or b"", dtype=np.uint8)[offsets[0]:offsets[-1]]
+    lengths = np.diff(offsets)
+    if len(lengths) and lengths.max() > variable.length:
+        raise ValueError(f"Value of {variable.name} longer than its {variable.length} bytes")
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    columns = np.arange(len(data)) - np.repeat(offsets[:-1] - offsets[0], lengths) + position
+    observations[rows, columns] = data
@@ -1,11 +1,20 @@
 """Tests for CLI entry point and orchestration."""
 
+import datetime
+import gzip
+import json
 import tempfile
 from pathlib import Path
 
+import duckdb
+import polars as pl
+import pyreadstat
+import pytest
 from typer.testing import CliRunner
 
+from scdm_prepare import export
 from scdm_prepare.cli import app
+from scdm_prepare.schema import TABLES
 
 
 runner = CliRunner()
@@ -337,3 +346,661 @@ class TestE2ESmoke:
 
             # Verify temp was cleaned up
             assert not (output_path / "_temp").exists()
+
+
+class TestSelectiveBuild:
+    """Tests for --tables."""
+
+    def test_diagnosis_only_build(self, sample_parquet_dir):
+        """A diagnosis-only build needs only its own inputs and exports only diagnosis."""
+        with tempfile.TemporaryDirectory() as input_dir:
+            # Copy only the sources in the diagnosis closure
+            for table_name in ("demographic", "encounter", "provider", "diagnosis"):
+                for path in Path(sample_parquet_dir).glob(f"{table_name}_*.parquet"):
+                    (Path(input_dir) / path.name).write_bytes(path.read_bytes())
+
+            with tempfile.TemporaryDirectory() as output_dir:
+                result = runner.invoke(
+                    app,
+                    [
+                        "--input", input_dir,
+                        "--output", output_dir,
+                        "--format", "parquet",
+                        "--file-ext", ".parquet",
+                        "--tables", "diagnosis",
+                    ],
+                )
+                assert result.exit_code == 0, result.output
+                assert "Inputs: demographic, encounter, diagnosis, provider" in result.output
+
+                outputs = sorted(path.name for path in Path(output_dir).iterdir())
+                assert outputs == ["diagnosis.parquet", "manifest.json"]
+
+    def test_unknown_table_rejected(self, sample_parquet_dir):
+        """An unknown table name exits with an error before any work is done."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir),
+                    "--output", output_dir,
+                    "--format", "parquet",
+                    "--file-ext", ".parquet",
+                    "--tables", "diagnosis,claims",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "Unknown tables: claims" in result.output
+
+
+class TestAppendBuild:
+    """Tests for --append-to."""
+
+    @pytest.mark.parametrize("fmt", ["parquet", "csv", "json"])
+    def test_append_matches_full_rebuild(self, sample_parquet_dir, fmt):
+        """Building 1-2 then appending 3 gives the same files as building 1-3."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet"]
+        with tempfile.TemporaryDirectory() as full_dir:
+            with tempfile.TemporaryDirectory() as appended_dir:
+                result = runner.invoke(app, common + ["--output", full_dir, "--format", fmt])
+                assert result.exit_code == 0, result.output
+
+                result = runner.invoke(
+                    app, common + ["--output", appended_dir, "--format", fmt, "--last", "2"]
+                )
+                assert result.exit_code == 0, result.output
+                result = runner.invoke(app, common + ["--append-to", appended_dir, "--first", "3"])
+                assert result.exit_code == 0, result.output
+
+                for table_name in TABLES:
+                    name = f"{table_name}.{fmt}"
+                    if fmt == "parquet":
+                        full = pl.read_parquet(Path(full_dir) / name)
+                        appended = pl.read_parquet(Path(appended_dir) / name)
+                        assert appended.equals(full), table_name
+                    else:
+                        full_bytes = (Path(full_dir) / name).read_bytes()
+                        assert (Path(appended_dir) / name).read_bytes() == full_bytes, table_name
+
+                full_manifest = json.loads((Path(full_dir) / "manifest.json").read_text())
+                appended_manifest = json.loads((Path(appended_dir) / "manifest.json").read_text())
+                assert appended_manifest == full_manifest
+                assert not (Path(appended_dir) / "_temp").exists()
+
+    def test_failed_append_leaves_build_unchanged(self, sample_parquet_dir, monkeypatch):
+        """An append that fails part-way changes nothing, so rerunning it gives a full rebuild."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet"]
+        stage = export._append_format
+
+        def fail_on_procedure(con, table_name, *args):
+            if table_name == "procedure":
+                raise RuntimeError("disk full")
+            return stage(con, table_name, *args)
+
+        with tempfile.TemporaryDirectory() as full_dir:
+            with tempfile.TemporaryDirectory() as appended_dir:
+                result = runner.invoke(app, common + ["--output", full_dir, "--format", "parquet,csv"])
+                assert result.exit_code == 0, result.output
+                result = runner.invoke(
+                    app, common + ["--output", appended_dir, "--format", "parquet,csv", "--last", "2"]
+                )
+                assert result.exit_code == 0, result.output
+
+                def build_files() -> dict[str, bytes]:
+                    return {
+                        path.name: path.read_bytes() for path in Path(appended_dir).iterdir() if path.is_file()
+                    }
+
+                before = build_files()
+                with monkeypatch.context() as patch:
+                    patch.setattr(export, "_append_format", fail_on_procedure)
+                    result = runner.invoke(app, common + ["--append-to", appended_dir, "--first", "3"])
+                assert result.exit_code == 1
+                assert "disk full" in result.output
+                assert build_files() == before
+
+                result = runner.invoke(app, common + ["--append-to", appended_dir, "--first", "3"])
+                assert result.exit_code == 0, result.output
+                for table_name in TABLES:
+                    name = f"{table_name}.csv"
+                    assert (Path(appended_dir) / name).read_bytes() == (Path(full_dir) / name).read_bytes()
+                full_manifest = json.loads((Path(full_dir) / "manifest.json").read_text())
+                assert json.loads((Path(appended_dir) / "manifest.json").read_text()) == full_manifest
+
+    def test_append_rejects_earlier_subsamples(self, sample_parquet_dir):
+        """Appending subsamples that do not come after the build's subsamples fails."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet"]
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app, common + ["--output", output_dir, "--format", "parquet", "--first", "2"]
+            )
+            assert result.exit_code == 0, result.output
+
+            result = runner.invoke(app, common + ["--append-to", output_dir, "--last", "1"])
+            assert result.exit_code == 1
+            assert "must all be after 3" in result.output
+
+    def test_append_requires_manifest(self, sample_parquet_dir):
+        """A directory without a build manifest cannot be appended to."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--append-to", output_dir],
+            )
+            assert result.exit_code == 1
+            assert "No build manifest found" in result.output
+
+
+class TestSampleFraction:
+    """Tests for --sample-fraction."""
+
+    def test_sampled_build_is_deterministic_and_recorded(self, sample_parquet_dir):
+        """Two sampled builds are identical, smaller than a full build, and record the fraction."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--format", "csv"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            for name, extra in [("full", []), ("a", ["--sample-fraction", "0.5"]), ("b", ["--sample-fraction", "0.5"])]:
+                result = runner.invoke(app, common + ["--output", str(tmpdir / name)] + extra)
+                assert result.exit_code == 0, result.output
+
+            full_manifest = json.loads((tmpdir / "full" / "manifest.json").read_text())
+            manifest = json.loads((tmpdir / "a" / "manifest.json").read_text())
+            assert manifest["sample_fraction"] == 0.5
+            assert "sample_fraction" not in full_manifest
+            assert manifest["crosswalks"]["patid"]["max_id"] < full_manifest["crosswalks"]["patid"]["max_id"]
+            for table_name in TABLES:
+                name = f"{table_name}.csv"
+                assert (tmpdir / "a" / name).read_bytes() == (tmpdir / "b" / name).read_bytes(), table_name
+
+    def test_append_keeps_the_sample(self, sample_parquet_dir):
+        """Appending to a sampled build samples the new subsamples the same way."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet"]
+        with tempfile.TemporaryDirectory() as full_dir:
+            with tempfile.TemporaryDirectory() as appended_dir:
+                sampled = ["--format", "parquet", "--sample-fraction", "0.5"]
+                result = runner.invoke(app, common + sampled + ["--output", full_dir])
+                assert result.exit_code == 0, result.output
+                result = runner.invoke(app, common + sampled + ["--output", appended_dir, "--last", "2"])
+                assert result.exit_code == 0, result.output
+                result = runner.invoke(app, common + ["--append-to", appended_dir, "--first", "3"])
+                assert result.exit_code == 0, result.output
+
+                for table_name in TABLES:
+                    name = f"{table_name}.parquet"
+                    full = pl.read_parquet(Path(full_dir) / name)
+                    assert pl.read_parquet(Path(appended_dir) / name).equals(full), table_name
+
+                result = runner.invoke(
+                    app, common + ["--append-to", appended_dir, "--first", "3", "--sample-fraction", "0.2"]
+                )
+                assert result.exit_code == 1
+                assert "different filters" in result.output
+
+    @pytest.mark.parametrize("fraction", ["0", "1.5"])
+    def test_out_of_range_fraction_rejected(self, sample_parquet_dir, fraction):
+        """Fractions outside (0, 1] are rejected."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "parquet", "--sample-fraction", fraction,
+                ],
+            )
+            assert result.exit_code == 1
+            assert "--sample-fraction must be" in result.output
+
+
+class TestDateWindow:
+    """Tests for --start-date/--end-date."""
+
+    def test_window_matches_filtered_full_build(self, sample_parquet_dir):
+        """Claims outside the window are dropped and enrollment spans clipped."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--format", "parquet"]
+        start, end = datetime.date(2020, 3, 1), datetime.date(2021, 6, 30)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            result = runner.invoke(app, common + ["--output", str(tmpdir / "full")])
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(
+                app,
+                common + [
+                    "--output", str(tmpdir / "window"),
+                    "--start-date", start.isoformat(), "--end-date", end.isoformat(),
+                ],
+            )
+            assert result.exit_code == 0, result.output
+
+            full = pl.read_parquet(tmpdir / "full" / "dispensing.parquet")
+            window = pl.read_parquet(tmpdir / "window" / "dispensing.parquet")
+            assert window.equals(full.filter(pl.col("RxDate").is_between(start, end)))
+
+            full = pl.read_parquet(tmpdir / "full" / "enrollment.parquet")
+            window = pl.read_parquet(tmpdir / "window" / "enrollment.parquet")
+            assert window.height == full.filter(pl.col("Enr_Start").is_between(start, end)).height
+            assert window["Enr_Start"].min() >= start and window["Enr_End"].max() <= end
+
+            manifest = json.loads((tmpdir / "window" / "manifest.json").read_text())
+            assert manifest["date_window"] == {"start": "2020-03-01", "end": "2021-06-30"}
+
+
+class TestExportThroughput:
+    """Tests for --export-workers and the per-table throughput report."""
+
+    def test_throughput_reported_per_table(self, sample_parquet_dir):
+        """Each exported table gets a throughput line."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "csv",
+                    "--workers", "4", "--export-workers", "2",
+                ],
+            )
+            assert result.exit_code == 0, result.output
+            for table_name in TABLES:
+                assert f"Exported {table_name}: " in result.output
+
+
+class TestPartFiles:
+    """Tests for --part-rows and --part-size."""
+
+    def test_parts_match_single_file_build(self, sample_parquet_dir):
+        """Concatenated parts equal the single-file outputs; the manifest lists them."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--format", "parquet"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            result = runner.invoke(app, common + ["--output", str(tmpdir / "single")])
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(
+                app, common + ["--output", str(tmpdir / "parts"), "--part-rows", "7", "--workers", "2"]
+            )
+            assert result.exit_code == 0, result.output
+
+            manifest = json.loads((tmpdir / "parts" / "manifest.json").read_text())
+            assert manifest["layout"] == {"part_rows": 7}
+            for table_name in TABLES:
+                parts = manifest["tables"][table_name]["parts"]
+                assert sum(part["rows"] for part in parts) == manifest["tables"][table_name]["rows"]
+                combined = pl.concat(
+                    [pl.read_parquet(tmpdir / "parts" / table_name / part["file"]) for part in parts]
+                )
+                assert combined.equals(pl.read_parquet(tmpdir / "single" / f"{table_name}.parquet")), table_name
+
+    def test_append_continues_parts(self, sample_parquet_dir):
+        """Appending to a split build adds parts and matches a full split build."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet"]
+        split = ["--format", "csv", "--part-rows", "10"]
+        with tempfile.TemporaryDirectory() as full_dir:
+            with tempfile.TemporaryDirectory() as appended_dir:
+                result = runner.invoke(app, common + split + ["--output", full_dir])
+                assert result.exit_code == 0, result.output
+                result = runner.invoke(app, common + split + ["--output", appended_dir, "--last", "2"])
+                assert result.exit_code == 0, result.output
+                result = runner.invoke(app, common + ["--append-to", appended_dir, "--first", "3"])
+                assert result.exit_code == 0, result.output
+
+                for table_name in TABLES:
+                    full = pl.concat(
+                        [pl.read_csv(path) for path in sorted((Path(full_dir) / table_name).glob("part-*.csv"))]
+                    )
+                    appended = pl.concat(
+                        [pl.read_csv(path) for path in sorted((Path(appended_dir) / table_name).glob("part-*.csv"))]
+                    )
+                    assert appended.equals(full), table_name
+
+    def test_invalid_part_size_rejected(self, sample_parquet_dir):
+        """Unparseable sizes are rejected."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "csv", "--part-size", "lots",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "Invalid size" in result.output
+
+
+class TestPartitionBySamplenum:
+    """Tests for --partition-by samplenum."""
+
+    def _read_partitions(self, table_dir: Path) -> pl.DataFrame:
+        """Read a hive-partitioned table in partition order."""
+        paths = sorted(table_dir.glob("samplenum=*/part.parquet"), key=lambda p: int(p.parent.name.split("=")[1]))
+        return pl.concat([pl.read_parquet(path) for path in paths])
+
+    def test_partitions_match_single_file_build(self, sample_parquet_dir):
+        """The partitions, in order, hold the single-file build's rows."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--format", "parquet"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            result = runner.invoke(app, common + ["--output", str(tmpdir / "single")])
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(
+                app, common + ["--output", str(tmpdir / "hive"), "--partition-by", "samplenum", "--workers", "3"]
+            )
+            assert result.exit_code == 0, result.output
+
+            assert sorted(path.name for path in (tmpdir / "hive" / "diagnosis").iterdir()) == [
+                "samplenum=1", "samplenum=2", "samplenum=3",
+            ]
+            for table_name in TABLES:
+                single = pl.read_parquet(tmpdir / "single" / f"{table_name}.parquet")
+                assert self._read_partitions(tmpdir / "hive" / table_name).equals(single), table_name
+
+    def test_append_and_targets_add_partitions(self, sample_parquet_dir):
+        """Appends add new partitions; --ranges targets are partitioned like separate builds."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--format", "parquet"]
+        hive = ["--partition-by", "samplenum", "--keep-partition-column"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            for name, extra in [
+                ("full", []),
+                ("appended", ["--last", "2"]),
+                ("separate", ["--first", "2"]),
+                ("batch", ["--ranges", "2-3"]),
+            ]:
+                result = runner.invoke(app, common + hive + ["--output", str(tmpdir / name)] + extra)
+                assert result.exit_code == 0, result.output
+            result = runner.invoke(
+                app, ["--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                      "--append-to", str(tmpdir / "appended"), "--first", "3"]
+            )
+            assert result.exit_code == 0, result.output
+
+            for table_name in TABLES:
+                full = self._read_partitions(tmpdir / "full" / table_name)
+                assert self._read_partitions(tmpdir / "appended" / table_name).equals(full), table_name
+                separate = self._read_partitions(tmpdir / "separate" / table_name)
+                target = self._read_partitions(tmpdir / "batch" / "2-3" / table_name)
+                assert target.equals(separate), table_name
+                assert set(separate["samplenum"]) <= {2, 3}
+
+
+class TestPartitionByYear:
+    """Tests for --partition-by year."""
+
+    def test_years_match_single_file_build(self, sample_parquet_dir):
+        """Each year partition holds that year's rows of the single-file build, in order."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--format", "parquet"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            result = runner.invoke(app, common + ["--output", str(tmpdir / "single")])
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(
+                app, common + ["--output", str(tmpdir / "hive"), "--partition-by", "year", "--last", "2"]
+            )
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(
+                app, ["--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                      "--append-to", str(tmpdir / "hive"), "--first", "3"]
+            )
+            assert result.exit_code == 0, result.output
+
+            manifest = json.loads((tmpdir / "hive" / "manifest.json").read_text())
+            assert manifest["layout"] == {"partition_by": "year"}
+            for table_name in TABLES:
+                single = pl.read_parquet(tmpdir / "single" / f"{table_name}.parquet")
+                date_columns = TABLES[table_name].date_columns
+                if len(date_columns) != 1:
+                    hive = pl.read_parquet(tmpdir / "hive" / f"{table_name}.parquet")
+                    assert hive.equals(single), table_name
+                    continue
+                years = single[date_columns[0]].dt.year()
+                for year_dir in (tmpdir / "hive" / table_name).iterdir():
+                    value = year_dir.name.split("=")[1]
+                    expected = single.filter(
+                        years.is_null() if value == "__HIVE_DEFAULT_PARTITION__" else years == int(value)
+                    )
+                    partition = pl.concat(pl.read_parquet(path) for path in sorted(year_dir.glob("part-*.parquet")))
+                    assert partition.equals(expected), (table_name, value)
+                assert sum(part["rows"] for part in manifest["tables"][table_name]["parts"]) == single.height
+
+
+class TestParquetOptions:
+    """Tests for the parquet writer options."""
+
+    def test_options_override_presets(self, sample_parquet_dir):
+        """--dictionary-size-limit 0 applies to every table, including those with presets."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "parquet",
+                    "--dictionary-size-limit", "0", "--compression-level", "19",
+                ],
+            )
+            assert result.exit_code == 0, result.output
+            for table_name in ("demographic", "diagnosis"):
+                path = Path(output_dir) / f"{table_name}.parquet"
+                encodings = duckdb.sql(
+                    f"SELECT DISTINCT encodings FROM parquet_metadata('{path}')"
+                ).fetchall()
+                assert encodings == [("PLAIN",)], table_name
+
+    def test_bloom_filter_fpp_must_be_a_ratio(self, sample_parquet_dir):
+        """--bloom-filter-fpp outside (0, 1) is rejected."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "parquet", "--bloom-filter-fpp", "1.5",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "--bloom-filter-fpp must be between 0 and 1" in result.output
+
+
+class TestCompression:
+    """Tests for --compression."""
+
+    def test_gzip_build_and_append(self, sample_parquet_dir):
+        """A gzip build appended to decompresses to the uncompressed full build."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            result = runner.invoke(app, common + ["--output", str(tmpdir / "plain"), "--format", "csv"])
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(
+                app,
+                common + ["--output", str(tmpdir / "gz"), "--format", "csv", "--compression", "gzip", "--last", "2"],
+            )
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(app, common + ["--append-to", str(tmpdir / "gz"), "--first", "3"])
+            assert result.exit_code == 0, result.output
+
+            manifest = json.loads((tmpdir / "gz" / "manifest.json").read_text())
+            assert manifest["layout"] == {"compression": "gzip"}
+            for table_name in TABLES:
+                compressed = (tmpdir / "gz" / f"{table_name}.csv.gz").read_bytes()
+                assert gzip.decompress(compressed) == (tmpdir / "plain" / f"{table_name}.csv").read_bytes()
+
+    def test_parquet_rejects_compression(self, sample_parquet_dir):
+        """Parquet files are always zstd inside, so --compression is an error."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "parquet", "--compression", "zstd",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "--compression applies to text, json and arrow output" in result.output
+
+
+class TestMultipleFormats:
+    """Tests for --format with several formats."""
+
+    def test_one_build_matches_separate_builds(self, sample_parquet_dir):
+        """parquet,txt from one build equals a parquet build and a txt build, also after an append."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            for name, extra in [("both", ["--format", "parquet,txt", "--last", "2"]),
+                                ("parquet", ["--format", "parquet"]),
+                                ("txt", ["--format", "txt"])]:
+                result = runner.invoke(app, common + ["--output", str(tmpdir / name)] + extra)
+                assert result.exit_code == 0, result.output
+            result = runner.invoke(app, common + ["--append-to", str(tmpdir / "both"), "--first", "3"])
+            assert result.exit_code == 0, result.output
+
+            assert json.loads((tmpdir / "both" / "manifest.json").read_text())["format"] == "parquet,txt"
+            for table_name in TABLES:
+                both = pl.read_parquet(tmpdir / "both" / f"{table_name}.parquet")
+                assert both.equals(pl.read_parquet(tmpdir / "parquet" / f"{table_name}.parquet")), table_name
+                text = (tmpdir / "both" / f"{table_name}.txt").read_bytes()
+                assert text == (tmpdir / "txt" / f"{table_name}.txt").read_bytes(), table_name
+
+    def test_unknown_format(self, sample_parquet_dir):
+        """An unknown format in the list is an error naming the choices."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "parquet,xml",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "Unknown format xml; choose from parquet, csv, txt, json" in result.output
+
+
+class TestArrowFormat:
+    """Tests for --format arrow."""
+
+    def test_arrow_matches_parquet(self, sample_parquet_dir):
+        """LZ4 Arrow IPC files hold the same tables as the parquet files of the same build."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "parquet,arrow", "--compression", "lz4",
+                ],
+            )
+            assert result.exit_code == 0, result.output
+            for table_name in TABLES:
+                arrow = pl.read_ipc(Path(output_dir) / f"{table_name}.arrow")
+                assert arrow.equals(pl.read_parquet(Path(output_dir) / f"{table_name}.parquet")), table_name
+
+    def test_codec_must_suit_every_format(self, sample_parquet_dir):
+        """lz4 compresses Arrow record batches only, so it cannot apply to csv."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "csv,arrow", "--compression", "lz4",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "--compression lz4 does not apply to csv output" in result.output
+
+
+class TestDuckdbFormat:
+    """Tests for --format duckdb."""
+
+    def test_database_matches_parquet_after_append(self, sample_parquet_dir):
+        """A database built for 1-2 and appended 3 holds the tables and crosswalks of a 1-3 build."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            result = runner.invoke(app, common + ["--output", str(tmpdir / "full"), "--format", "parquet,duckdb"])
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(
+                app, common + ["--output", str(tmpdir / "appended"), "--format", "duckdb", "--last", "2"]
+            )
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(app, common + ["--append-to", str(tmpdir / "appended"), "--first", "3"])
+            assert result.exit_code == 0, result.output
+
+            full = duckdb.connect(str(tmpdir / "full" / "scdm.duckdb"), read_only=True)
+            appended = duckdb.connect(str(tmpdir / "appended" / "scdm.duckdb"), read_only=True)
+            try:
+                for table_name in TABLES:
+                    expected = pl.read_parquet(tmpdir / "full" / f"{table_name}.parquet")
+                    for con in (full, appended):
+                        assert con.execute(f"SELECT * FROM {table_name}").pl().equals(expected), table_name
+                crosswalk = "SELECT * FROM encounterid_crosswalk ORDER BY EncounterID"
+                assert appended.execute(crosswalk).pl().equals(full.execute(crosswalk).pl())
+                views = "SELECT view_name FROM duckdb_views() WHERE NOT internal ORDER BY 1"
+                assert appended.execute(views).fetchall() == [("encounter_diagnosis",), ("encounter_procedure",)]
+            finally:
+                full.close()
+                appended.close()
+
+    def test_rejects_file_layouts(self, sample_parquet_dir):
+        """A database is one file, so splitting it into parts is an error."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "duckdb", "--part-rows", "10",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "do not apply to duckdb output" in result.output
+
+
+class TestXptFormat:
+    """Tests for --format xpt."""
+
+    def test_xpt_matches_parquet(self, sample_parquet_dir):
+        """SAS transport files hold the parquet tables as SAS sees them: numbers as doubles, blanks for NULL text."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "parquet,xpt",
+                ],
+            )
+            assert result.exit_code == 0, result.output
+            for table_name in TABLES:
+                expected = pl.read_parquet(Path(output_dir) / f"{table_name}.parquet").with_columns(
+                    pl.col(pl.Int64, pl.Int32).cast(pl.Float64), pl.col(pl.String).fill_null("")
+                )
+                xpt, metadata = pyreadstat.read_xport(
+                    str(Path(output_dir) / f"{table_name}.xpt"), output_format="polars"
+                )
+                assert metadata.table_name == table_name
+                assert xpt.equals(expected), table_name
+
+
+class TestPostgresFormat:
+    """Tests for --format postgres that need no database."""
+
+    def test_requires_dsn(self, sample_parquet_dir, monkeypatch):
+        """The database to load must be named by --postgres-dsn or SCDM_POSTGRES_DSN."""
+        monkeypatch.delenv("SCDM_POSTGRES_DSN", raising=False)
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "parquet,postgres",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "--format postgres needs --postgres-dsn" in result.output
+
+    def test_rejects_ranges(self, sample_parquet_dir, monkeypatch):
+        """Range targets would all load the same tables."""
+        monkeypatch.setenv("SCDM_POSTGRES_DSN", "postgresql://localhost/scdm")
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "postgres", "--ranges", "1-2",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "--format postgres cannot be combined with --ranges" in result.output
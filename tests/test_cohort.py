@@ -0,0 +1,115 @@
+"""Tests for cohort builds from a patient list."""
+
+import tempfile
+from pathlib import Path
+
+import polars as pl
+import pytest
+from typer.testing import CliRunner
+
+from scdm_prepare.cli import app
+from scdm_prepare.cohort import read_patients, resolve_new_patids
+from scdm_prepare.schema import TABLES
+
+
+runner = CliRunner()
+
+
+class TestReadPatients:
+    """Tests for read_patients()."""
+
+    def test_original_ids(self):
+        """A samplenum,PatID file gives (samplenum, PatID) pairs without duplicates."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "patients.csv"
+            path.write_text("samplenum,PatID\n2,A01\n1,B07\n2,A01\n")
+
+            patients = read_patients(path)
+
+            assert patients.to_dicts() == [
+                {"samplenum": 2, "PatID": "A01"},
+                {"samplenum": 1, "PatID": "B07"},
+            ]
+
+    def test_new_ids(self):
+        """A PatID-only file gives integer new PatIDs."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "patients.csv"
+            path.write_text("PatID\n12\n3\n")
+
+            assert read_patients(path)["PatID"].to_list() == [12, 3]
+
+    @pytest.mark.parametrize("content", ["ID\n1\n", "PatID\nA01\n"])
+    def test_bad_files_raise(self, content):
+        """Unknown columns or non-integer new PatIDs raise ValueError."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "patients.csv"
+            path.write_text(content)
+            with pytest.raises(ValueError, match="Patients file"):
+                read_patients(path)
+
+
+class TestResolveNewPatids:
+    """Tests for resolve_new_patids()."""
+
+    def test_matches_crosswalk_numbering(self, sample_parquet_dir):
+        """New PatIDs resolve to the pairs numbered in (samplenum, PatID) order."""
+        pairs = []
+        for samplenum in [1, 2, 3]:
+            demographic = pl.read_parquet(sample_parquet_dir / f"demographic_{samplenum}.parquet")
+            pairs += [(samplenum, str(p)) for p in demographic["PatID"].drop_nulls().unique().sort()]
+
+        resolved = resolve_new_patids(
+            sample_parquet_dir, [1, 2, 3], pl.Series([1, 17, len(pairs)]), file_ext=".parquet"
+        )
+
+        assert list(resolved.iter_rows()) == [pairs[0], pairs[16], pairs[-1]]
+
+
+class TestCohortBuild:
+    """Cohort builds hold a full build's records for the listed patients."""
+
+    def test_cohort_matches_filtered_full_build(self, sample_parquet_dir):
+        """New-ID and original-ID patient lists both give the full build's rows for those patients."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--format", "parquet"]
+        new_patids = [2, 20, 33]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            (tmpdir / "new.csv").write_text("PatID\n" + "\n".join(map(str, new_patids)) + "\n")
+            original = resolve_new_patids(
+                sample_parquet_dir, [1, 2, 3], pl.Series(new_patids), file_ext=".parquet"
+            )
+            original.write_csv(tmpdir / "original.csv")
+
+            result = runner.invoke(app, common + ["--output", str(tmpdir / "full")])
+            assert result.exit_code == 0, result.output
+            for name in ["new", "original"]:
+                result = runner.invoke(
+                    app, common + ["--output", str(tmpdir / name), "--patients", str(tmpdir / f"{name}.csv")]
+                )
+                assert result.exit_code == 0, result.output
+
+            for table_name in TABLES:
+                full = pl.read_parquet(tmpdir / "full" / f"{table_name}.parquet")
+                if "PatID" in full.columns:
+                    full = full.filter(pl.col("PatID").is_in(new_patids))
+                    assert full.height > 0, table_name
+                for name in ["new", "original"]:
+                    cohort = pl.read_parquet(tmpdir / name / f"{table_name}.parquet")
+                    assert cohort.equals(full), (name, table_name)
+
+    def test_new_ids_rejected_with_ranges(self, sample_parquet_dir):
+        """New PatIDs are only meaningful for one whole build."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "patients.csv"
+            path.write_text("PatID\n1\n")
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", tmpdir, "--format", "parquet",
+                    "--ranges", "1-2", "--patients", str(path),
+                ],
+            )
+            assert result.exit_code == 1
+            assert "cannot be combined with --ranges" in result.output
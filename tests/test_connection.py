@@ -0,0 +1,133 @@
+"""Tests for DuckDB connection setup and out-of-core builds."""
+
+import datetime
+import tempfile
+from pathlib import Path
+
+import polars as pl
+from typer.testing import CliRunner
+
+from scdm_prepare import cli
+from scdm_prepare.cli import app
+from scdm_prepare.connection import open_connection
+from scdm_prepare.schema import TABLES
+
+
+runner = CliRunner()
+
+DATE_COLUMNS = {
+    "Birth_Date", "Enr_Start", "Enr_End", "ADate", "DDate",
+    "RxDate", "PostalCode_Date", "DeathDt",
+}
+
+
+def _write_scaled_fixtures(input_dir: Path, subsamples: int, patients: int, rows_per_patient: int) -> None:
+    """Write synthetic parquet sources with many rows per patient.
+
+    Person-level tables (demographic, death) get one row per patient; the
+    claims-like tables get ``rows_per_patient`` rows per patient, written in
+    an order that is not sorted by PatID so assembly has real sorting to do.
+
+    Args:
+        input_dir: Directory to write parquet files to
+        subsamples: Number of subsamples (numbered from 1)
+        patients: Patients per subsample
+        rows_per_patient: Rows per patient in the claims-like tables
+    """
+    for samplenum in range(1, subsamples + 1):
+        for table_name, table_def in TABLES.items():
+            per_patient = table_name in ("demographic", "death", "provider", "facility")
+            n = patients if per_patient else patients * rows_per_patient
+            idx = pl.int_range(0, n, eager=True)
+            exprs = []
+            for col in table_def.columns:
+                if col == "PatID":
+                    exprs.append(((idx * 7919) % patients).cast(pl.Utf8).str.zfill(8).alias(col))
+                elif col in ("EncounterID", "ProviderID", "FacilityID"):
+                    exprs.append((idx % 997).cast(pl.Utf8).alias(col))
+                elif col in DATE_COLUMNS:
+                    exprs.append(
+                        (pl.lit(datetime.date(2008, 1, 1)) + pl.duration(days=idx % 1000)).alias(col)
+                    )
+                else:
+                    exprs.append((idx % 13).cast(pl.Utf8).alias(col))
+            df = pl.select(exprs)
+            df.write_parquet(str(input_dir / f"{table_name}_{samplenum}.parquet"))
+
+
+class TestOpenConnection:
+    """Tests for open_connection()."""
+
+    def test_default_is_in_memory(self):
+        """No arguments opens an in-memory database."""
+        con = open_connection()
+        try:
+            path = con.execute("SELECT path FROM duckdb_databases() WHERE database_name = current_database()").fetchone()[0]
+            assert path is None
+        finally:
+            con.close()
+
+    def test_file_backed_database_and_spill_dir(self):
+        """db_path, spill_dir and memory_limit are applied to the connection."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            db_path = tmpdir / "work" / "scdm.duckdb"
+            spill_dir = tmpdir / "spill"
+
+            con = open_connection(db_path, spill_dir, "256MB")
+            try:
+                con.execute("CREATE TABLE t AS SELECT 1 AS x")
+                temp_directory = con.execute("SELECT current_setting('temp_directory')").fetchone()[0]
+                memory_limit = con.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+            finally:
+                con.close()
+
+            assert db_path.exists()
+            assert spill_dir.is_dir()
+            assert Path(temp_directory) == spill_dir
+            assert memory_limit.endswith("MiB")
+
+
+class TestOutOfCoreBuild:
+    """Reduced-scale check of the out-of-core memory guarantee."""
+
+    def test_build_completes_within_memory_limit(self, monkeypatch):
+        """A build larger than the memory limit spills to the spill directory and completes.
+
+        The same build with no room to spill runs out of memory, which shows
+        the build needs the spill directory without watching it at run time.
+        """
+        with tempfile.TemporaryDirectory() as input_dir:
+            with tempfile.TemporaryDirectory() as output_dir:
+                _write_scaled_fixtures(Path(input_dir), subsamples=2, patients=10000, rows_per_patient=10)
+                output_path = Path(output_dir)
+                args = [
+                    "--input", input_dir,
+                    "--output", output_dir,
+                    "--format", "parquet",
+                    "--file-ext", ".parquet",
+                    "--db-path", str(output_path / "work.duckdb"),
+                    "--spill-dir", str(output_path / "spill"),
+                    "--memory-limit", "64MB",
+                ]
+
+                def open_without_spill(*args, **kwargs):
+                    con = open_connection(*args, **kwargs)
+                    con.execute("SET max_temp_directory_size = '0B'")
+                    return con
+
+                with monkeypatch.context() as patch:
+                    patch.setattr(cli, "open_connection", open_without_spill)
+                    result = runner.invoke(app, args)
+                assert result.exit_code == 1
+                assert "Out of Memory" in result.output
+
+                result = runner.invoke(app, args)
+                assert result.exit_code == 0, result.output
+
+                diagnosis = pl.read_parquet(str(output_path / "diagnosis.parquet"))
+                assert len(diagnosis) == 2 * 10000 * 10
+                assert diagnosis["PatID"].is_sorted()
+
+                # Working database is scratch space and is removed on success
+                assert not (output_path / "work.duckdb").exists()
@@ -0,0 +1,107 @@
+"""Tests for the DuckDB and Polars assembly engines."""
+
+import tempfile
+from pathlib import Path
+
+import duckdb
+import polars as pl
+import pytest
+
+from scdm_prepare.engines import DuckDBEngine, PolarsEngine, build_plan, get_engine
+from scdm_prepare.ingest import ingest_all
+from scdm_prepare.schema import TABLES
+from scdm_prepare.transform import assemble_tables, build_crosswalks
+
+
+def _assemble_all(temp_dir: Path, engine: str, buckets: int = 1) -> dict[str, pl.DataFrame]:
+    """Build crosswalks and assemble every table with one engine.
+
+    Args:
+        temp_dir: Directory containing ingested parquet files
+        engine: Assembly engine name
+        buckets: Number of PatID-range buckets per subsample slice
+
+    Returns:
+        Mapping of table name to assembled table
+    """
+    con = duckdb.connect(":memory:")
+    try:
+        build_crosswalks(con, temp_dir)
+        assemble_tables(con, temp_dir, buckets=buckets, engine=engine)
+        return {name: con.sql(f"SELECT * FROM {name}").pl() for name in TABLES}
+    finally:
+        con.close()
+
+
+class TestBuildPlan:
+    """Tests for build_plan()."""
+
+    def test_plan_follows_table_def(self):
+        """Columns, joins and sort keys come from the TableDef."""
+        table_def = TABLES["diagnosis"]
+        plan = build_plan(table_def, "/tmp/work")
+
+        assert plan.target == "diagnosis"
+        assert plan.columns == table_def.columns
+        assert plan.sort_keys == table_def.sort_keys
+        assert [(join.id_column, join.how) for join in plan.joins] == [
+            (id_col, how) for id_col, how in table_def.crosswalk_ids.items()
+        ]
+        assert plan.source == str(Path("/tmp/work") / "diagnosis_*.parquet")
+        assert not plan.presorted
+
+    def test_presorted_slice_reads_single_file(self):
+        """A presorted slice reads its own file and is marked presorted."""
+        source = Path("/tmp/work/diagnosis_2.parquet")
+        plan = build_plan(
+            TABLES["diagnosis"], "/tmp/work", target="_diagnosis_slice_1",
+            samplenum=2, presorted_file=source,
+        )
+
+        assert plan.target == "_diagnosis_slice_1"
+        assert plan.samplenum == 2
+        assert plan.source == str(source)
+        assert plan.presorted
+
+    def test_duckdb_compiles_to_sql(self):
+        """The DuckDB engine compiles a slice plan to filtered, ordered SQL."""
+        plan = build_plan(TABLES["diagnosis"], "/tmp/work", samplenum=3, patid_range=(10, 20))
+        sql = DuckDBEngine().compile(plan)
+
+        assert "a.samplenum = 3" in sql
+        assert "BETWEEN 10 AND 20" in sql
+        assert "ORDER BY b.PatID, a.ADate" in sql
+
+
+class TestGetEngine:
+    """Tests for get_engine()."""
+
+    def test_known_engines(self):
+        """Engines are created by name."""
+        assert isinstance(get_engine("duckdb"), DuckDBEngine)
+        assert isinstance(get_engine("polars"), PolarsEngine)
+
+    def test_unknown_engine_raises(self):
+        """Unknown engine names raise ValueError."""
+        with pytest.raises(ValueError, match="Unsupported engine"):
+            get_engine("spark")
+
+
+class TestPolarsEngine:
+    """The Polars engine assembles the same tables as the DuckDB engine."""
+
+    @pytest.mark.parametrize("buckets", [1, 2])
+    def test_polars_matches_duckdb(self, sample_parquet_dir, buckets):
+        """Every table has the same rows in the same order under both engines."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            ingest_all(sample_parquet_dir, [1, 2, 3], output_dir, file_ext=".parquet")
+            temp_dir = Path(output_dir) / "_temp"
+            expected = _assemble_all(temp_dir, "duckdb", buckets)
+            result = _assemble_all(temp_dir, "polars", buckets)
+
+            # Slice files are removed once copied into DuckDB
+            assert list((temp_dir / "_polars").glob("_*.parquet")) == []
+
+        for table_name in TABLES:
+            assert result[table_name].columns == expected[table_name].columns, table_name
+            assert result[table_name].rows() == expected[table_name].rows(), table_name
@@ -1,15 +1,32 @@
 """Tests for SCDM table export functionality."""
 
 import datetime
+import gzip
 import json
+import os
 import tempfile
 from pathlib import Path
 
 import duckdb
 import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyreadstat
 import pytest
 
-from scdm_prepare.export import export_all, export_table
+from scdm_prepare import export
+from scdm_prepare.export import (
+    ExportStats,
+    Layout,
+    append_table,
+    commit_appends,
+    export_all,
+    export_table,
+    samplenum_partitions,
+    split_formats,
+    year_partitions,
+)
+from scdm_prepare.schema import SORTED_BY_METADATA_KEY, ParquetSettings
 
 
 @pytest.fixture
@@ -20,6 +37,18 @@ def duckdb_con():
     con.close()
 
 
+@pytest.fixture
+def death_con(duckdb_con):
+    """A 10-row death table in PatID order."""
+    duckdb_con.execute("""
+        CREATE TABLE death AS
+        SELECT range AS PatID, DATE '2010-01-01' + range::INT AS DeathDt,
+               'N' AS DtImpute, 'S' AS Source, 'E' AS Confidence
+        FROM range(10)
+    """)
+    return duckdb_con
+
+
 class TestExportParquet:
     """Tests for parquet export (AC7.1, AC7.4)."""
 
@@ -118,6 +147,21 @@ class TestExportParquet:
             assert result_df["name"][1] is None
             assert result_df["amount"][1] is None
 
+    def test_parquet_declares_scdm_sort_keys(self, duckdb_con):
+        """SCDM tables declare their sort keys in the parquet key-value metadata."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            duckdb_con.execute("CREATE TABLE diagnosis AS SELECT 1 AS PatID, DATE '2009-01-01' AS ADate")
+            duckdb_con.execute("CREATE TABLE other AS SELECT 1 AS x")
+
+            export_table(duckdb_con, "diagnosis", tmpdir, "parquet")
+            export_table(duckdb_con, "other", tmpdir, "parquet")
+
+            diagnosis_meta = pq.read_metadata(str(tmpdir / "diagnosis.parquet")).metadata
+            other_meta = pq.read_metadata(str(tmpdir / "other.parquet")).metadata or {}
+            assert diagnosis_meta[SORTED_BY_METADATA_KEY.encode()] == b"PatID,ADate"
+            assert SORTED_BY_METADATA_KEY.encode() not in other_meta
+
 
 class TestExportCSV:
     """Tests for CSV export (AC7.2, AC7.4)."""
@@ -632,3 +676,684 @@ class TestExportIntegration:
             assert len(parquet_df) == 10000
             assert len(csv_df) == 10000
             assert len(json_df) == 10000
+
+
+class TestParallelExport:
+    """Tests for concurrent export_all() and its throughput report."""
+
+    def test_concurrent_exports_largest_first(self, duckdb_con):
+        """Several workers export every table; stats come back largest first."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            sizes = {"small": 10, "large": 5000, "medium": 500}
+            for table_name, rows in sizes.items():
+                duckdb_con.execute(f"CREATE TABLE {table_name} AS SELECT range AS id FROM range({rows})")
+
+            stats = export_all(duckdb_con, list(sizes), tmpdir, "csv", workers=3)
+
+            assert [s.table_name for s in stats] == ["large", "medium", "small"]
+            for entry in stats:
+                assert entry.rows == sizes[entry.table_name]
+                assert entry.bytes == (tmpdir / f"{entry.table_name}.csv").stat().st_size
+                exported = pl.read_csv(tmpdir / f"{entry.table_name}.csv")
+                assert exported["id"].to_list() == list(range(sizes[entry.table_name]))
+
+    def test_stats_summary(self):
+        """Throughput is derived from rows, bytes and seconds."""
+        stats = ExportStats("diagnosis", rows=2_000_000, bytes=50_000_000, seconds=4.0)
+
+        assert stats.rows_per_second == 500_000
+        assert stats.megabytes_per_second == 12.5
+        assert stats.summary() == (
+            "diagnosis: 2,000,000 rows, 50.0 MB in 4.0s (500,000 rows/s, 12.5 MB/s)"
+        )
+
+
+class TestSplitLayout:
+    """Tests for exporting tables as size-bounded part files."""
+
+    @pytest.mark.parametrize("fmt", ["parquet", "csv", "json"])
+    def test_parts_keep_order_and_record_key_ranges(self, death_con, fmt):
+        """Parts hold consecutive rows, in order, with their first and last keys."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            parts = export_table(death_con, "death", tmpdir, fmt, layout=Layout(part_rows=4, workers=2))
+
+            assert [part["file"] for part in parts] == [
+                f"part-0000{i}.{fmt}" for i in range(3)
+            ]
+            assert [part["rows"] for part in parts] == [4, 4, 2]
+            assert [(part["first"], part["last"]) for part in parts] == [([0], [3]), ([4], [7]), ([8], [9])]
+            assert not (tmpdir / f"death.{fmt}").exists()
+
+            read = {"parquet": pl.read_parquet, "csv": pl.read_csv, "json": pl.read_ndjson}[fmt]
+            combined = pl.concat([read(tmpdir / "death" / part["file"]) for part in parts])
+            assert combined["PatID"].to_list() == list(range(10))
+
+    def test_part_bytes_bounds_size(self, death_con):
+        """A byte bound splits the table into parts of about that size."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            parts = export_table(death_con, "death", tmpdir, "csv", layout=Layout(part_bytes=150))
+
+            assert len(parts) > 1
+            assert sum(part["rows"] for part in parts) == 10
+            assert all(part["bytes"] <= 165 for part in parts)
+
+    def test_append_adds_parts(self, death_con):
+        """Appending writes the new rows as further parts, leaving earlier ones alone."""
+        layout = Layout(part_rows=4)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            export_table(death_con, "death", tmpdir, "parquet", layout=layout)
+            death_con.execute("UPDATE death SET PatID = PatID + 10")
+
+            parts = append_table(death_con, "death", tmpdir, "parquet", layout=layout)
+            commit_appends(death_con, tmpdir, "parquet", ["death"], layout=layout)
+
+            assert [part["file"] for part in parts] == ["part-00003.parquet", "part-00004.parquet", "part-00005.parquet"]
+            combined = pl.read_parquet(sorted((tmpdir / "death").glob("part-*.parquet")))
+            assert combined["PatID"].to_list() == list(range(20))
+
+
+class TestSamplenumPartitions:
+    """Tests for hive partitions by subsample."""
+
+    @pytest.fixture
+    def partitioned_con(self, duckdb_con):
+        """A death table of 6 patients, 2 in subsample 1 and 4 in subsample 3."""
+        duckdb_con.execute("""
+            CREATE TABLE patid_crosswalk AS
+            SELECT * FROM (VALUES ('a', 1, 1), ('b', 1, 2), ('c', 3, 3), ('d', 3, 4), ('e', 3, 5), ('f', 3, 6))
+                AS t(orig_PatID, samplenum, PatID)
+        """)
+        duckdb_con.execute("""
+            CREATE TABLE death AS
+            SELECT PatID, NULL::DATE AS DeathDt, 'N' AS DtImpute, 'S' AS Source, 'E' AS Confidence
+            FROM patid_crosswalk ORDER BY PatID
+        """)
+        return duckdb_con
+
+    def test_partitions_follow_crosswalk_blocks(self, partitioned_con):
+        """Each subsample's rows are its block of new PatIDs."""
+        assert samplenum_partitions(partitioned_con, "death") == [(1, "PatID", 1, 2), (3, "PatID", 3, 6)]
+
+    @pytest.mark.parametrize("keep", [False, True])
+    def test_hive_layout(self, partitioned_con, keep):
+        """Each subsample gets samplenum=N/part.parquet; the column is kept on request."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            layout = Layout(partition_by="samplenum", keep_partition_column=keep, workers=2)
+            parts = export_table(partitioned_con, "death", tmpdir, "parquet", layout=layout)
+
+            assert [(part["file"], part["rows"], part["samplenum"]) for part in parts] == [
+                ("samplenum=1/part.parquet", 2, 1),
+                ("samplenum=3/part.parquet", 4, 3),
+            ]
+            third = pl.read_parquet(tmpdir / "death" / "samplenum=3" / "part.parquet")
+            assert third["PatID"].to_list() == [3, 4, 5, 6]
+            assert ("samplenum" in third.columns) == keep
+
+            pruned = pl.scan_parquet(tmpdir / "death" / "**" / "*.parquet", hive_partitioning=True)
+            assert pruned.filter(pl.col("samplenum") == 1).collect()["PatID"].to_list() == [1, 2]
+
+    def test_split_partitions_in_parallel(self, duckdb_con):
+        """Partitions split into parts and written by several workers keep every row once."""
+        duckdb_con.execute("""
+            CREATE TABLE patid_crosswalk AS
+            SELECT 'p' || i AS orig_PatID, i // 50_000 + 1 AS samplenum, i + 1 AS PatID
+            FROM range(200_000) t(i)
+        """)
+        duckdb_con.execute("""
+            CREATE TABLE death AS
+            SELECT PatID, NULL::DATE AS DeathDt, 'N' AS DtImpute, 'S' AS Source, 'E' AS Confidence
+            FROM patid_crosswalk ORDER BY PatID
+        """)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            layout = Layout(partition_by="samplenum", part_rows=3000, workers=8)
+            parts = export_table(duckdb_con, "death", tmpdir, "parquet", layout=layout)
+
+            assert sum(part["rows"] for part in parts) == 200_000
+            assert {part["samplenum"] for part in parts} == {1, 2, 3, 4}
+            assert all(part["rows"] <= 3000 for part in parts)
+            written = pl.read_parquet(tmpdir / "death" / "**" / "*.parquet")
+            assert sorted(written["PatID"].to_list()) == list(range(1, 200_001))
+
+
+class TestYearPartitions:
+    """Tests for hive partitions by service year."""
+
+    @pytest.fixture
+    def dated_con(self, duckdb_con):
+        """A dispensing table sorted by PatID whose dates span 2008-2010 and one NULL."""
+        duckdb_con.execute("""
+            CREATE TABLE dispensing AS
+            SELECT * FROM (VALUES
+                (1, 1, DATE '2009-03-01', 'X'), (1, 1, DATE '2010-01-05', 'X'),
+                (2, 1, DATE '2008-07-14', 'X'), (2, 1, DATE '2009-11-30', 'X'),
+                (3, 1, NULL, 'X'), (4, 1, DATE '2009-01-01', 'X')
+            ) AS t(PatID, ProviderID, RxDate, Rx)
+        """)
+        return duckdb_con
+
+    def test_years_in_order_with_nulls_last(self, dated_con):
+        """Each year present gets a condition; undated rows come last."""
+        assert year_partitions(dated_con, "dispensing") == [
+            (2008, "year(RxDate) = 2008"),
+            (2009, "year(RxDate) = 2009"),
+            (2010, "year(RxDate) = 2010"),
+            (None, "RxDate IS NULL"),
+        ]
+
+    def test_partitions_keep_patient_order(self, dated_con):
+        """Each year=YYYY directory holds that year's rows, still sorted by PatID."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            layout = Layout(partition_by="year", keep_partition_column=True, workers=2)
+            parts = export_table(dated_con, "dispensing", tmpdir, "parquet", layout=layout)
+
+            assert [(part["file"], part["rows"], part["year"]) for part in parts] == [
+                ("year=2008/part-00000.parquet", 1, 2008),
+                ("year=2009/part-00000.parquet", 3, 2009),
+                ("year=2010/part-00000.parquet", 1, 2010),
+                ("year=__HIVE_DEFAULT_PARTITION__/part-00000.parquet", 1, None),
+            ]
+            in_2009 = pl.read_parquet(tmpdir / "dispensing" / "year=2009" / "part-00000.parquet")
+            assert in_2009["PatID"].to_list() == [1, 2, 4]
+            assert in_2009["year"].to_list() == [2009, 2009, 2009]
+
+            hive = pl.scan_parquet(tmpdir / "dispensing" / "**" / "*.parquet", hive_partitioning=True)
+            assert hive.filter(pl.col("year").is_null()).collect()["PatID"].to_list() == [3]
+
+    def test_append_adds_parts_to_each_year(self, dated_con):
+        """Appended rows become the next part file of the years they fall in."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            layout = Layout(partition_by="year")
+            export_table(dated_con, "dispensing", tmpdir, "parquet", layout=layout)
+            dated_con.execute("DELETE FROM dispensing")
+            dated_con.execute(
+                "INSERT INTO dispensing VALUES (5, 1, DATE '2009-05-05', 'X'), (5, 1, DATE '2011-02-02', 'X')"
+            )
+            parts = append_table(dated_con, "dispensing", tmpdir, "parquet", layout=layout)
+            commit_appends(dated_con, tmpdir, "parquet", ["dispensing"], layout=layout)
+
+            assert [part["file"] for part in parts] == ["year=2009/part-00001.parquet", "year=2011/part-00000.parquet"]
+            in_2009 = pl.read_parquet(sorted((tmpdir / "dispensing" / "year=2009").glob("*.parquet")))
+            assert in_2009["PatID"].to_list() == [1, 2, 4, 5]
+
+    def test_undated_tables_are_not_partitioned(self, duckdb_con):
+        """Tables without a single service date keep the single-file layout."""
+        duckdb_con.execute("CREATE TABLE provider AS SELECT 1 AS ProviderID, 'S' AS Specialty, 'C' AS Specialty_CodeType")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            parts = export_table(duckdb_con, "provider", tmpdir, "parquet", layout=Layout(partition_by="year"))
+            assert parts is None
+            assert (tmpdir / "provider.parquet").exists()
+
+
+class TestParquetSettings:
+    """Tests for the parquet writer presets and their overrides."""
+
+    @pytest.fixture
+    def dispensing_con(self, duckdb_con):
+        """A 300,000-row dispensing table with 500 distinct Rx codes."""
+        duckdb_con.execute("""
+            CREATE TABLE dispensing AS
+            SELECT range // 10 AS PatID, 1 AS ProviderID, DATE '2009-01-01' AS RxDate,
+                   (range % 500)::VARCHAR AS Rx, 'ND' AS Rx_CodeType, 30 AS RxSup, 60 AS RxAmt
+            FROM range(300000)
+        """)
+        return duckdb_con
+
+    def _row_groups(self, con, path):
+        return con.execute(f"SELECT MAX(row_group_id) + 1 FROM parquet_metadata('{path}')").fetchone()[0]
+
+    def test_table_preset_applies(self, dispensing_con):
+        """Claims tables are written with their preset row group size."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            export_table(dispensing_con, "dispensing", tmpdir, "parquet")
+            assert self._row_groups(dispensing_con, Path(tmpdir) / "dispensing.parquet") == 2
+
+    def test_layout_overrides_preset(self, dispensing_con):
+        """Layout settings replace the preset; no dictionaries means no bloom filters."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "dispensing.parquet"
+            parquet = ParquetSettings(row_group_size=50_000, compression_level=19, dictionary_size_limit=0)
+            export_table(dispensing_con, "dispensing", tmpdir, "parquet", layout=Layout(parquet=parquet))
+            assert self._row_groups(dispensing_con, path) == 6
+            encodings = dispensing_con.execute(f"""
+                SELECT DISTINCT encodings, bloom_filter_offset IS NULL
+                FROM parquet_metadata('{path}') WHERE path_in_schema = 'Rx'
+            """).fetchall()
+            assert encodings == [("PLAIN", True)]
+            assert pl.read_parquet(path).height == 300_000
+
+    def test_dictionary_columns_get_bloom_filters(self, dispensing_con):
+        """A dictionary-encoded code column can be probed by its bloom filter."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "dispensing.parquet"
+            export_table(dispensing_con, "dispensing", tmpdir, "parquet")
+            probes = dispensing_con.execute(
+                f"SELECT bloom_filter_excludes FROM parquet_bloom_probe('{path}', 'Rx', 'missing')"
+            ).fetchall()
+            assert probes == [(True,), (True,)]
+
+    def test_bloom_filters_cover_patid_and_codes_only(self, duckdb_con):
+        """PatID and code columns get bloom filters; unique EncounterIDs and page indexes do not.
+
+        Ten rows per patient keep a row group's PatIDs within the dictionary limit.
+        """
+        duckdb_con.execute("""
+            CREATE TABLE procedure AS
+            SELECT range // 10 AS PatID, range AS EncounterID, DATE '2010-01-01' AS ADate, 1 AS ProviderID,
+                   'IP' AS EncType, 'PX' || (range % 5000) AS PX, '09' AS PX_CodeType, NULL::VARCHAR AS OrigPX
+            FROM range(300000)
+        """)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "procedure.parquet"
+            export_table(duckdb_con, "procedure", tmpdir, "parquet")
+            filtered = duckdb_con.execute(f"""
+                SELECT path_in_schema, bool_and(bloom_filter_offset IS NOT NULL)
+                FROM parquet_metadata('{path}')
+                WHERE path_in_schema IN ('PatID', 'EncounterID', 'PX')
+                GROUP BY path_in_schema ORDER BY path_in_schema
+            """).fetchall()
+            assert filtered == [("EncounterID", False), ("PX", True), ("PatID", True)]
+            column = pq.ParquetFile(path).metadata.row_group(0).column(0)
+            assert not column.has_column_index
+
+
+class TestCompressedText:
+    """Tests for gzip and zstd compressed csv and NDJSON output."""
+
+    @pytest.fixture(autouse=True)
+    def small_blocks(self, monkeypatch):
+        """Compress in blocks of 3 rows."""
+        monkeypatch.setattr(export, "_COMPRESSION_BLOCK_ROWS", 3)
+
+    def test_gzip_blocks_read_as_one_file(self, death_con):
+        """Blocks are gzip members that decompress to the uncompressed csv."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            export_table(death_con, "death", tmpdir / "plain", "csv")
+            export_table(
+                death_con, "death", tmpdir / "gz", "csv", layout=Layout(compression="gzip", workers=2)
+            )
+            compressed = tmpdir / "gz" / "death.csv.gz"
+            assert gzip.decompress(compressed.read_bytes()) == (tmpdir / "plain" / "death.csv").read_bytes()
+            assert compressed.read_bytes().count(b"\x1f\x8b\x08") == 4
+            assert sorted(path.name for path in (tmpdir / "gz").iterdir()) == ["death.csv.gz"]
+
+    def test_zstd_json_and_append(self, death_con):
+        """A zstd NDJSON file takes appended rows as further frames."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            layout = Layout(compression="zstd")
+            export_table(death_con, "death", tmpdir, "json", layout=layout)
+            death_con.execute("UPDATE death SET PatID = PatID + 10")
+            append_table(death_con, "death", tmpdir, "json", layout=layout)
+            commit_appends(death_con, tmpdir, "json", ["death"], layout=layout)
+
+            path = tmpdir / "death.json.zst"
+            patids = death_con.execute(f"SELECT PatID FROM read_json('{path}')").fetchall()
+            assert [patid for (patid,) in patids] == list(range(20))
+
+    def test_compressed_parts(self, death_con):
+        """Part files carry the compression suffix and the header only once each."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            parts = export_table(
+                death_con, "death", tmpdir, "csv", layout=Layout(part_rows=5, compression="gzip")
+            )
+            assert [part["file"] for part in parts] == ["part-00000.csv.gz", "part-00001.csv.gz"]
+            first = pl.read_csv(tmpdir / "death" / "part-00000.csv.gz")
+            assert first["PatID"].to_list() == [0, 1, 2, 3, 4]
+
+
+class TestMultiFormat:
+    """Tests for exporting one table in several formats at once."""
+
+    def test_split_formats(self):
+        """Formats are split on commas, in order, without repeats; unknown ones raise."""
+        assert split_formats("parquet, txt,parquet") == ["parquet", "txt"]
+        with pytest.raises(ValueError, match="Unsupported format"):
+            split_formats("parquet,xml")
+
+    def test_files_match_single_format_exports(self, death_con):
+        """Each format's file is the same as exporting that format alone."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            assert export_table(death_con, "death", tmpdir / "all", "parquet,csv,txt,json") is None
+            for fmt in ("parquet", "csv", "txt", "json"):
+                export_table(death_con, "death", tmpdir / fmt, fmt)
+                name = f"death.{fmt}"
+                if fmt == "parquet":
+                    assert pl.read_parquet(tmpdir / "all" / name).equals(pl.read_parquet(tmpdir / fmt / name))
+                else:
+                    assert (tmpdir / "all" / name).read_bytes() == (tmpdir / fmt / name).read_bytes()
+            assert (tmpdir / "txt" / "death.txt").read_text().splitlines()[:2] == [
+                "PatID\tDeathDt\tDtImpute\tSource\tConfidence",
+                "0\t2010-01-01\tN\tS\tE",
+            ]
+
+    def test_append_is_staged_until_committed(self, death_con):
+        """Appended files are written aside, and replace the build's files only on commit."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            export_table(death_con, "death", tmpdir, "parquet,csv")
+            before = {fmt: (tmpdir / f"death.{fmt}").read_bytes() for fmt in ("parquet", "csv")}
+            death_con.execute("UPDATE death SET PatID = PatID + 10")
+
+            append_table(death_con, "death", tmpdir, "parquet,csv")
+            assert {fmt: (tmpdir / f"death.{fmt}").read_bytes() for fmt in ("parquet", "csv")} == before
+            staging_dir = tmpdir / export.APPEND_STAGING_DIR
+            assert sorted(path.name for path in staging_dir.iterdir()) == ["death.csv", "death.parquet"]
+
+            commit_appends(death_con, tmpdir, "parquet,csv", ["death"])
+            assert not staging_dir.exists()
+            assert pl.read_parquet(tmpdir / "death.parquet")["PatID"].to_list() == list(range(20))
+            assert pl.read_csv(tmpdir / "death.csv")["PatID"].to_list() == list(range(20))
+            metadata = pq.read_metadata(str(tmpdir / "death.parquet")).metadata
+            assert metadata[SORTED_BY_METADATA_KEY.encode()] == b"PatID"
+
+    def test_parts_are_tagged_with_their_format(self, death_con):
+        """A split layout writes every format's parts into the table directory."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            layout = Layout(part_rows=5)
+            parts = export_table(death_con, "death", tmpdir, "parquet,txt", layout=layout)
+            assert [(part["file"], part["format"]) for part in parts] == [
+                ("part-00000.parquet", "parquet"),
+                ("part-00001.parquet", "parquet"),
+                ("part-00000.txt", "txt"),
+                ("part-00001.txt", "txt"),
+            ]
+            death_con.execute("UPDATE death SET PatID = PatID + 10")
+            appended = append_table(death_con, "death", tmpdir, "parquet,txt", layout=layout)
+            commit_appends(death_con, tmpdir, "parquet,txt", ["death"], layout=layout)
+            assert [part["file"] for part in appended] == [
+                "part-00002.parquet", "part-00003.parquet", "part-00002.txt", "part-00003.txt",
+            ]
+            assert len(list((tmpdir / "death").iterdir())) == 8
+
+
+class TestArrowExport:
+    """Tests for Arrow IPC output."""
+
+    def test_memory_mapped_read_is_zero_copy(self, death_con):
+        """An uncompressed file is read in place, with the sort keys in its schema."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            export_table(death_con, "death", tmpdir, "arrow")
+            allocated = pa.total_allocated_bytes()
+            with pa.memory_map(str(Path(tmpdir) / "death.arrow")) as source:
+                table = pa.ipc.open_file(source).read_all()
+                assert pa.total_allocated_bytes() == allocated
+                assert table.schema.metadata == {SORTED_BY_METADATA_KEY.encode(): b"PatID"}
+                assert table.column("PatID").to_pylist() == list(range(10))
+
+    @pytest.mark.parametrize("compression", ["lz4", "zstd"])
+    def test_compressed_batches_and_append(self, death_con, compression):
+        """Compressed files keep the .arrow name; appends rewrite them with the new rows last."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            layout = Layout(compression=compression)
+            export_table(death_con, "death", tmpdir, "arrow", layout=layout)
+            death_con.execute("UPDATE death SET PatID = PatID + 10")
+            append_table(death_con, "death", tmpdir, "arrow", layout=layout)
+            commit_appends(death_con, tmpdir, "arrow", ["death"], layout=layout)
+
+            assert [path.name for path in tmpdir.iterdir() if path.is_file()] == ["death.arrow"]
+            appended = pl.read_ipc(tmpdir / "death.arrow")
+            assert appended["PatID"].to_list() == list(range(20))
+
+
+class TestDatabaseExport:
+    """Tests for the duckdb format."""
+
+    @pytest.fixture
+    def claims_con(self, duckdb_con):
+        """Four encounters of two patients, with a diagnosis each and one without an encounter."""
+        duckdb_con.execute("""
+            CREATE TABLE encounter AS
+            SELECT range // 2 + 1 AS PatID, range + 1 AS EncounterID,
+                   DATE '2010-01-01' + range::INT AS ADate, DATE '2010-01-02' + range::INT AS DDate,
+                   'IP' AS EncType, 7 AS FacilityID, 'H' AS Discharge_Disposition,
+                   'HO' AS Discharge_Status, '001' AS DRG, 'M' AS DRG_Type, 'E' AS Admitting_Source
+            FROM range(4)
+        """)
+        duckdb_con.execute("""
+            CREATE TABLE diagnosis AS
+            SELECT PatID, EncounterID, ADate, 3 AS ProviderID, EncType, 'I10' AS DX,
+                   '10' AS Dx_Codetype, 'I10' AS OrigDX, 'P' AS PDX, 'N' AS PAdmit
+            FROM encounter
+            UNION ALL
+            SELECT 2, NULL, DATE '2011-01-01', 3, 'AV', 'E11', '10', 'E11', 'S', 'N'
+        """)
+        duckdb_con.execute("""
+            CREATE TABLE patid_crosswalk AS
+            SELECT 'P' || range AS orig_PatID, 1 AS samplenum, range + 1 AS PatID FROM range(2)
+        """)
+        return duckdb_con
+
+    def test_tables_indexes_and_views(self, claims_con):
+        """The tables, crosswalk, indexes and join view are in one file that opens on its own."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for table_name in ("encounter", "diagnosis"):
+                assert export_table(claims_con, table_name, tmpdir, "duckdb") is None
+            export.finish_database(claims_con, tmpdir, {"patid_crosswalk": "patid_crosswalk"})
+
+            assert [path.name for path in Path(tmpdir).iterdir()] == [export.DATABASE_FILE]
+            con = duckdb.connect(str(Path(tmpdir) / export.DATABASE_FILE), read_only=True)
+            try:
+                indexes = con.execute(
+                    "SELECT table_name, expressions FROM duckdb_indexes() ORDER BY ALL"
+                ).fetchall()
+                assert indexes == [
+                    ("diagnosis", "[EncounterID]"),
+                    ("diagnosis", "[PatID]"),
+                    ("encounter", "[EncounterID]"),
+                    ("encounter", "[PatID]"),
+                    ("patid_crosswalk", "[PatID]"),
+                ]
+                joined = con.execute(
+                    "SELECT DX, EncounterID, DDate, FacilityID FROM encounter_diagnosis ORDER BY ADate"
+                ).fetchall()
+                assert len(joined) == 5
+                assert joined[0] == ("I10", 1, datetime.date(2010, 1, 2), 7)
+                assert joined[-1] == ("E11", None, None, None)
+                assert con.execute("SELECT COUNT(*) FROM patid_crosswalk").fetchone()[0] == 2
+                assert "encounter_procedure" not in {
+                    row[0] for row in con.execute("SELECT view_name FROM duckdb_views()").fetchall()
+                }
+            finally:
+                con.close()
+
+    def test_append_inserts_rows(self, claims_con):
+        """An append adds the rows to the indexed table and the crosswalk."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with pytest.raises(ValueError, match="No existing output"):
+                append_table(claims_con, "encounter", tmpdir, "duckdb")
+
+            export_table(claims_con, "encounter", tmpdir, "parquet,duckdb")
+            export.finish_database(claims_con, tmpdir, {"patid_crosswalk": "patid_crosswalk"})
+            claims_con.execute("UPDATE encounter SET PatID = PatID + 2, EncounterID = EncounterID + 4")
+            claims_con.execute("UPDATE patid_crosswalk SET PatID = PatID + 2, samplenum = 2")
+            append_table(claims_con, "encounter", tmpdir, "duckdb")
+            export.finish_database(claims_con, tmpdir, {"patid_crosswalk": "patid_crosswalk"}, append=True)
+            commit_appends(claims_con, tmpdir, "duckdb", ["encounter"])
+
+            con = duckdb.connect(str(Path(tmpdir) / export.DATABASE_FILE), read_only=True)
+            try:
+                encounter_ids = con.execute("SELECT EncounterID FROM encounter").fetchall()
+                assert [row[0] for row in encounter_ids] == list(range(1, 9))
+                assert con.execute("SELECT PatID FROM encounter WHERE EncounterID = 7").fetchone() == (4,)
+                assert con.execute("SELECT MAX(PatID) FROM patid_crosswalk").fetchone() == (4,)
+            finally:
+                con.close()
+
+
+class TestXportExport:
+    """Tests for SAS transport output."""
+
+    def test_lengths_follow_longest_value_and_append(self, duckdb_con):
+        """Character lengths are the longest value's (1 if none), and grow when an append needs it."""
+        duckdb_con.execute("""
+            CREATE TABLE dispensing AS
+            SELECT range AS PatID, 3 AS ProviderID, DATE '2010-01-01' + range::INT AS RxDate,
+                   'ABC' || range AS Rx, NULL::VARCHAR AS Rx_CodeType, 30 AS RxSup, 1.5 AS RxAmt
+            FROM range(4)
+        """)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "dispensing.xpt"
+            export_table(duckdb_con, "dispensing", tmpdir, "xpt")
+            _, metadata = pyreadstat.read_xport(str(path), metadataonly=True, output_format="polars")
+            assert metadata.variable_storage_width == {
+                "PatID": 8, "ProviderID": 8, "RxDate": 8, "Rx": 4, "Rx_CodeType": 1, "RxSup": 8, "RxAmt": 8,
+            }
+
+            duckdb_con.execute("UPDATE dispensing SET PatID = PatID + 4, Rx = 'LONGER' || PatID")
+            append_table(duckdb_con, "dispensing", tmpdir, "xpt")
+            commit_appends(duckdb_con, tmpdir, "xpt", ["dispensing"])
+            df, metadata = pyreadstat.read_xport(str(path), output_format="polars")
+            assert metadata.variable_storage_width["Rx"] == 7
+            assert df["PatID"].to_list() == list(range(8))
+            assert df["Rx"].to_list() == ["ABC0", "ABC1", "ABC2", "ABC3", "LONGER0", "LONGER1", "LONGER2", "LONGER3"]
+            assert df["RxDate"][4] == datetime.date(2010, 1, 1)
+
+
+class TestPostgresFormat:
+    """Tests for the postgres format that need no database."""
+
+    def test_requires_dsn(self, duckdb_con):
+        """Without a connection string there is nothing to load into."""
+        duckdb_con.execute("CREATE TABLE death AS SELECT 1 AS PatID")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with pytest.raises(ValueError, match="postgres_dsn"):
+                export_table(duckdb_con, "death", tmpdir, "postgres")
+
+    @pytest.fixture
+    def recorded(self, duckdb_con, monkeypatch):
+        """Stand an in-memory DuckDB database in for PostgreSQL and record postgres_execute() calls."""
+
+        class Recorder:
+            def __init__(self):
+                self.executed = []
+
+            def execute(self, sql, *args):
+                if sql.startswith("CALL postgres_execute"):
+                    self.executed.append(sql)
+                    return None
+                return duckdb_con.execute(sql, *args)
+
+            def cursor(self):
+                return duckdb_con.cursor()
+
+        def attach(con, dsn):
+            duckdb_con.execute("ATTACH IF NOT EXISTS ':memory:' AS pg")
+            return "pg"
+
+        monkeypatch.setattr(export, "_attach_postgres", attach)
+        return Recorder()
+
+    @pytest.fixture
+    def layout(self):
+        return Layout(workers=3, postgres_dsn="host=localhost")
+
+    def test_load_quotes_index_columns(self, duckdb_con, recorded, layout):
+        """The mixed-case ID columns are quoted in the PostgreSQL CREATE INDEX statements."""
+        duckdb_con.execute("CREATE TABLE procedure AS SELECT range AS PatID, range AS EncounterID FROM range(10)")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            export_table(recorded, "procedure", tmpdir, "postgres", layout=layout)
+        assert recorded.executed == [
+            """CALL postgres_execute('pg', 'CREATE INDEX procedure_patid ON "procedure" ("PatID")')""",
+            """CALL postgres_execute('pg', 'CREATE INDEX procedure_encounterid ON "procedure" ("EncounterID")')""",
+            """CALL postgres_execute('pg', 'ANALYZE "procedure"')""",
+        ]
+
+    def test_runs_load_every_row_once(self, duckdb_con, recorded, layout):
+        """The key ranges of the parallel runs cover every row, NULL keys included, exactly once."""
+        duckdb_con.execute("""
+            CREATE TABLE procedure AS
+            SELECT CASE WHEN range % 7 = 0 THEN NULL ELSE range // 3 END AS PatID, range AS EncounterID
+            FROM range(1000)
+        """)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            export_table(recorded, "procedure", tmpdir, "postgres", layout=layout)
+        loaded = duckdb_con.execute("SELECT * FROM pg.procedure EXCEPT ALL SELECT * FROM procedure").fetchall()
+        assert loaded == []
+        assert duckdb_con.execute("SELECT COUNT(*) FROM pg.procedure").fetchone()[0] == 1000
+
+    def test_key_runs_split_on_first_sort_key(self, duckdb_con):
+        """Runs are ranges of the first sort key plus one for NULL keys."""
+        duckdb_con.execute("CREATE TABLE provider AS SELECT range AS ProviderID FROM range(101)")
+        assert export._key_runs(duckdb_con, "provider", "provider", 2) == [
+            "ProviderID < 50",
+            "ProviderID >= 50",
+            "ProviderID IS NULL",
+        ]
+        assert export._key_runs(duckdb_con, "provider", "provider", 1) == ["TRUE"]
+
+    def test_append_loads_staged_table(self, duckdb_con, recorded, layout):
+        """An append loads the _staged table and leaves the indexed table alone."""
+        duckdb_con.execute("CREATE TABLE procedure AS SELECT range AS PatID, range AS EncounterID FROM range(10)")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            append_table(recorded, "procedure", tmpdir, "postgres", layout=layout)
+        assert recorded.executed == []
+        tables = duckdb_con.execute("SELECT table_name FROM duckdb_tables() WHERE database_name = 'pg'").fetchall()
+        assert tables == [("procedure_staged",)]
+
+    def test_commit_moves_staged_rows_in_one_call(self, recorded, layout):
+        """Every staged table is inserted and dropped in a single postgres_execute() call."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            commit_appends(recorded, tmpdir, "postgres", ["procedure", "death"], layout=layout)
+        assert recorded.executed == [
+            "CALL postgres_execute('pg', "
+            "'INSERT INTO \"procedure\" SELECT * FROM \"procedure_staged\"; DROP TABLE \"procedure_staged\"; "
+            "INSERT INTO \"death\" SELECT * FROM \"death_staged\"; DROP TABLE \"death_staged\"')"
+        ]
+
+
+@pytest.mark.skipif(
+    "SCDM_TEST_POSTGRES_DSN" not in os.environ,
+    reason="set SCDM_TEST_POSTGRES_DSN to a throwaway PostgreSQL database to run",
+)
+class TestPostgresLoad:
+    """Tests for the postgres format, against the database at SCDM_TEST_POSTGRES_DSN."""
+
+    @pytest.fixture
+    def layout(self):
+        return Layout(workers=3, postgres_dsn=os.environ["SCDM_TEST_POSTGRES_DSN"])
+
+    def test_parallel_load_indexes_and_append(self, duckdb_con, layout):
+        """Rows load over several connections, the ID columns are indexed, and appends add rows."""
+        duckdb_con.execute("""
+            CREATE TABLE procedure AS
+            SELECT range // 3 AS PatID, range AS EncounterID, DATE '2010-01-01' + range::INT AS ADate,
+                   1 AS ProviderID, 'IP' AS EncType, 'PX' || range AS PX, '09' AS PX_CodeType,
+                   NULL::VARCHAR AS OrigPX
+            FROM range(10000)
+        """)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # A second export replaces the table rather than adding to it
+            export_table(duckdb_con, "procedure", tmpdir, "postgres", layout=layout)
+            export_table(duckdb_con, "procedure", tmpdir, "postgres", layout=layout)
+            duckdb_con.execute("UPDATE procedure SET EncounterID = EncounterID + 10000")
+            append_table(duckdb_con, "procedure", tmpdir, "postgres", layout=layout)
+            commit_appends(duckdb_con, tmpdir, "postgres", ["procedure"], layout=layout)
+
+        check = duckdb.connect()
+        try:
+            check.execute(f"ATTACH '{layout.postgres_dsn}' AS pg (TYPE postgres)")
+            loaded = check.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT EncounterID), MAX(EncounterID) FROM pg.procedure"
+            ).fetchone()
+            assert loaded == (20000, 20000, 19999)
+            indexes = check.execute(
+                "SELECT indexname FROM postgres_query('pg', "
+                "'SELECT indexname FROM pg_indexes WHERE tablename = ''procedure'' ORDER BY 1')"
+            ).fetchall()
+            assert indexes == [("procedure_encounterid",), ("procedure_patid",)]
+        finally:
+            check.execute("CALL postgres_execute('pg', 'DROP TABLE IF EXISTS procedure')")
+            check.close()
@@ -1,11 +1,22 @@
+import datetime
 import tempfile
 from pathlib import Path
 
 import polars as pl
+import pyarrow.parquet as pq
 import pytest
 
-from scdm_prepare.ingest import discover_subsamples, ingest_all, ingest_table, source_file_path
-from scdm_prepare.schema import TABLES
+from scdm_prepare import ingest
+from scdm_prepare.ingest import (
+    _row_runs,
+    discover_subsamples,
+    ingest_all,
+    ingest_table,
+    sample_patients,
+    source_file_path,
+    within_dates,
+)
+from scdm_prepare.schema import SORTED_BY_METADATA_KEY, TABLES
 
 
 class TestSourceFilePath:
@@ -97,6 +108,23 @@ class TestDiscoverSubsamplesSuccess:
             result = discover_subsamples(tmpdir, file_ext=".parquet")
             assert result == [2, 3, 4, 5]
 
+    def test_only_required_tables_validated(self):
+        """With tables, only those table types must exist for each subsample."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+
+            for samplenum in [1, 2]:
+                for table_name in ("demographic", "dispensing"):
+                    (tmpdir / f"{table_name}_{samplenum}.parquet").touch()
+
+            result = discover_subsamples(
+                tmpdir, file_ext=".parquet", tables=["demographic", "dispensing"]
+            )
+            assert result == [1, 2]
+
+            with pytest.raises(ValueError, match="Missing files"):
+                discover_subsamples(tmpdir, file_ext=".parquet")
+
 
 class TestDiscoverSubsamplesFailure:
     """AC1.4, AC1.5: Error handling tests."""
@@ -325,6 +353,193 @@ class TestIngestTable:
                 assert "Source file not found" in str(exc_info.value)
 
 
+class TestSortednessMetadata:
+    """Tests for recording source sort order during ingest."""
+
+    def _ingest_diagnosis(self, input_dir: Path, output_dir: Path, patids: list, adates: list) -> dict:
+        """Ingest a one-subsample diagnosis file and return its parquet metadata."""
+        import datetime
+
+        n = len(patids)
+        data = {col: ["x"] * n for col in TABLES["diagnosis"].columns}
+        data["PatID"] = patids
+        data["ADate"] = [datetime.date(2009, 1, day) if day else None for day in adates]
+        pl.DataFrame(data).write_parquet(str(input_dir / "diagnosis_1.parquet"))
+
+        ingest_table(input_dir, "diagnosis", [1], output_dir, file_ext=".parquet")
+
+        output_path = output_dir / "_temp" / "diagnosis_1.parquet"
+        return pq.read_metadata(str(output_path)).metadata or {}
+
+    def test_sorted_source_records_sort_keys(self):
+        """A source already sorted by the table's sort keys is recorded as sorted."""
+        with tempfile.TemporaryDirectory() as input_dir:
+            with tempfile.TemporaryDirectory() as output_dir:
+                metadata = self._ingest_diagnosis(
+                    Path(input_dir), Path(output_dir),
+                    ["A", "A", "A", "B", "C"], [1, 5, None, 2, 2],
+                )
+                assert metadata[SORTED_BY_METADATA_KEY.encode()] == b"PatID,ADate"
+
+    def test_unsorted_source_not_recorded(self):
+        """A source out of order on a secondary sort key is not recorded as sorted."""
+        with tempfile.TemporaryDirectory() as input_dir:
+            with tempfile.TemporaryDirectory() as output_dir:
+                metadata = self._ingest_diagnosis(
+                    Path(input_dir), Path(output_dir),
+                    ["A", "A", "B", "C"], [5, 1, 2, 2],
+                )
+                assert SORTED_BY_METADATA_KEY.encode() not in metadata
+
+
+class TestSampleFraction:
+    """Tests for hash-selected patient samples at ingest."""
+
+    def test_sample_is_deterministic_and_about_the_fraction(self):
+        """The same PatIDs are chosen every time, in roughly the requested share."""
+        patids = pl.Series([f"P{i}" for i in range(10000)])
+        first = sample_patients(patids, 1, 0.1)
+        assert first.equals(sample_patients(patids, 1, 0.1))
+        assert 800 < first.sum() < 1200
+        # Every patient chosen at 10% is also chosen at 50%
+        assert not (first & ~sample_patients(patids, 1, 0.5)).any()
+
+    def test_sample_ignores_patid_type(self):
+        """A PatID stored as a float, an integer or padded text is the same patient."""
+        patids = list(range(1000))
+        as_ints = sample_patients(pl.Series(patids), 1, 0.5)
+        assert as_ints.any() and not as_ints.all()
+        assert as_ints.equals(sample_patients(pl.Series([float(p) for p in patids]), 1, 0.5))
+        assert as_ints.equals(sample_patients(pl.Series([f" {p} " for p in patids]), 1, 0.5))
+
+    def test_every_table_keeps_the_same_patients(self, sample_parquet_dir):
+        """Each table keeps exactly the rows of the sampled patients."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            ingest_all(sample_parquet_dir, [1, 2], output_dir, file_ext=".parquet", sample_fraction=0.5)
+
+            for table_name in TABLES:
+                for samplenum in [1, 2]:
+                    name = f"{table_name}_{samplenum}.parquet"
+                    source = pl.read_parquet(sample_parquet_dir / name)
+                    sampled = pl.read_parquet(Path(output_dir) / "_temp" / name).drop("samplenum")
+                    if "PatID" in source.columns:
+                        source = source.filter(sample_patients(source["PatID"], samplenum, 0.5))
+                    assert sampled.equals(source), name
+
+
+    def test_unsampled_sas_rows_are_never_decoded(self, monkeypatch):
+        """Only PatID and the date are read for every row; whole rows for sampled patients only."""
+        pytest.importorskip("pandas")
+        source = pl.DataFrame(
+            {
+                "PatID": [float(i // 4) for i in range(400)],
+                "ADate": [datetime.date(2010, 1, 1)] * 400,
+                "PX": [f"PX{i}" for i in range(400)],
+            }
+        )
+        reads = []
+
+        def read_sas7bdat(path, usecols=None, row_offset=0, row_limit=0):
+            reads.append((usecols, row_offset, row_limit))
+            rows = source.slice(row_offset, row_limit or None)
+            return rows.select(usecols or rows.columns).to_pandas(), None
+
+        monkeypatch.setattr(ingest.pyreadstat, "read_sas7bdat", read_sas7bdat)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_dir = Path(tmpdir) / "input"
+            input_dir.mkdir()
+            (input_dir / "procedure_1.sas7bdat").touch()
+            ingest_table(input_dir, "procedure", [1], tmpdir, chunk_size=1, sample_fraction=0.25)
+            kept = pl.read_parquet(Path(tmpdir) / "_temp" / "procedure_1.parquet")
+
+        sampled = sample_patients(source["PatID"], 1, 0.25)
+        assert kept["PX"].to_list() == source.filter(sampled)["PX"].to_list()
+        assert reads[0] == (["PatID", "ADate"], 0, 0)
+        decoded = [row for _, offset, limit in reads[1:] for row in range(offset, offset + limit)]
+        assert decoded == sampled.arg_true().to_list()
+
+
+class TestPatientIngest:
+    """Tests for ingesting a patient list."""
+
+    def test_only_listed_patients_kept_with_full_ids(self, sample_parquet_dir):
+        """Rows of other patients are dropped; crosswalk source IDs are kept in full."""
+        source = pl.read_parquet(sample_parquet_dir / "demographic_1.parquet")
+        patid = source["PatID"].drop_nulls()[1]
+        patients = pl.DataFrame({"samplenum": [1], "PatID": [str(patid)]})
+        with tempfile.TemporaryDirectory() as output_dir:
+            temp_dir = Path(output_dir) / "_temp"
+            for table_name in ["demographic", "provider"]:
+                ingest_table(
+                    sample_parquet_dir, table_name, [1], output_dir, ".parquet", patients=patients
+                )
+
+            kept = pl.read_parquet(temp_dir / "demographic_1.parquet")
+            assert kept.height == 1
+            assert kept.drop("samplenum").equals(source.filter(pl.col("PatID") == patid))
+            ids = pl.read_parquet(temp_dir / "ids" / "demographic_1.parquet")
+            assert ids["PatID"].equals(source["PatID"])
+            # Tables without PatID are ingested whole
+            provider = pl.read_parquet(temp_dir / "provider_1.parquet")
+            assert provider.height == pl.read_parquet(sample_parquet_dir / "provider_1.parquet").height
+
+    def test_later_ingest_clears_full_ids(self, sample_parquet_dir):
+        """A build without a patient list does not number IDs from an earlier one's files."""
+        patients = pl.DataFrame({"samplenum": [2], "PatID": ["0"]})
+        with tempfile.TemporaryDirectory() as output_dir:
+            temp_dir = Path(output_dir) / "_temp"
+            ingest_table(sample_parquet_dir, "demographic", [1, 2], output_dir, ".parquet", patients=patients)
+            assert (temp_dir / "ids" / "demographic_2.parquet").exists()
+
+            ingest_table(sample_parquet_dir, "demographic", [1], output_dir, ".parquet")
+            assert list((temp_dir / "ids").glob("demographic_*.parquet")) == []
+
+    def test_row_runs_merge_small_gaps(self):
+        """Matches closer than the gap share one run."""
+        mask = pl.Series([False, True, True, False, True, False, False, False, False, True])
+        assert _row_runs(mask, 2) == [(1, 5), (9, 10)]
+        assert _row_runs(mask, 10) == [(1, 10)]
+        assert _row_runs(pl.Series([False, False]), 2) == []
+
+
+class TestWithinDates:
+    """Tests for the --start-date/--end-date window."""
+
+    START = datetime.date(2009, 1, 1)
+    END = datetime.date(2009, 12, 31)
+
+    def test_event_dates_outside_window_dropped(self):
+        """Rows dated outside the window, or undated, are dropped."""
+        df = pl.DataFrame(
+            {
+                "PatID": ["A", "A", "B", "C"],
+                "RxDate": [datetime.date(2008, 6, 1), datetime.date(2009, 6, 1), None, self.END],
+            }
+        )
+        kept = within_dates(df, "dispensing", self.START, self.END)
+        assert kept["PatID"].to_list() == ["A", "C"]
+
+    def test_enrollment_spans_clipped(self):
+        """Spans overlapping the window are clipped to it; the rest are dropped."""
+        df = pl.DataFrame(
+            {
+                "PatID": ["A", "B", "C"],
+                "Enr_Start": [datetime.date(2008, 1, 1), datetime.date(2009, 3, 1), datetime.date(2010, 2, 1)],
+                "Enr_End": [datetime.date(2010, 6, 30), datetime.date(2009, 4, 30), datetime.date(2010, 3, 1)],
+            }
+        ).lazy()
+        clipped = within_dates(df, "enrollment", self.START, self.END).collect()
+        assert clipped.rows() == [
+            ("A", self.START, self.END),
+            ("B", datetime.date(2009, 3, 1), datetime.date(2009, 4, 30)),
+        ]
+
+    def test_tables_without_dates_unchanged(self):
+        """Tables with no declared date columns keep every row."""
+        df = pl.DataFrame({"PatID": ["A"], "Birth_Date": [datetime.date(1930, 1, 1)]})
+        assert within_dates(df, "demographic", self.START, self.END).equals(df)
+
+
 class TestIntegrationFullPipeline:
     """Integration tests for full discovery + ingestion pipeline."""
 
@@ -0,0 +1,97 @@
+"""Tests for build manifests."""
+
+import datetime
+import tempfile
+
+import duckdb
+import pytest
+
+from scdm_prepare.manifest import (
+    build_filters,
+    build_manifest,
+    id_offsets,
+    manifest_filters,
+    read_manifest,
+    write_manifest,
+)
+
+
+@pytest.fixture
+def built_con():
+    """DuckDB connection with one assembled table and its PatID crosswalk."""
+    con = duckdb.connect(":memory:")
+    con.execute("""
+        CREATE TABLE patid_crosswalk AS
+        SELECT * FROM (VALUES ('A', 3, 11), ('B', 3, 12)) AS t(orig_PatID, samplenum, PatID)
+    """)
+    con.execute("CREATE TABLE death AS SELECT PatID FROM patid_crosswalk")
+    yield con
+    con.close()
+
+
+class TestBuildManifest:
+    """Tests for build_manifest()."""
+
+    def test_new_build(self, built_con):
+        """A new build records its format, subsamples, row counts and ID maxima."""
+        manifest = build_manifest(built_con, "parquet", [3], ["death"], ["patid"])
+
+        assert manifest == {
+            "format": "parquet",
+            "subsamples": [3],
+            "tables": {"death": {"rows": 2}},
+            "crosswalks": {"patid": {"max_id": 12}},
+        }
+
+    def test_append_accumulates(self, built_con):
+        """An appended build adds to the earlier build's rows and subsamples."""
+        previous = {
+            "format": "parquet",
+            "subsamples": [1, 2],
+            "tables": {"death": {"rows": 5}},
+            "crosswalks": {"patid": {"max_id": 10}},
+        }
+        manifest = build_manifest(built_con, "parquet", [3], ["death"], ["patid"], previous)
+
+        assert manifest["subsamples"] == [1, 2, 3]
+        assert manifest["tables"] == {"death": {"rows": 7}}
+        assert id_offsets(manifest) == {"patid": 12}
+
+    def test_empty_crosswalk_keeps_previous_maximum(self, built_con):
+        """A crosswalk with no new IDs keeps the earlier maximum."""
+        built_con.execute("DELETE FROM patid_crosswalk")
+        previous = {"subsamples": [1], "tables": {}, "crosswalks": {"patid": {"max_id": 10}}}
+        manifest = build_manifest(built_con, "csv", [2], [], ["patid"], previous)
+
+        assert id_offsets(manifest) == {"patid": 10}
+
+
+class TestBuildFilters:
+    """Tests for build_filters() and manifest_filters()."""
+
+    def test_filters_recorded_and_read_back(self, built_con):
+        """Filters in use are recorded in the manifest; unused ones are omitted."""
+        filters = build_filters(0.1, datetime.date(2009, 1, 1), None)
+        manifest = build_manifest(built_con, "parquet", [3], ["death"], ["patid"], filters=filters)
+
+        assert manifest["sample_fraction"] == 0.1
+        assert manifest["date_window"] == {"start": "2009-01-01", "end": None}
+        assert manifest_filters(manifest) == filters
+        assert build_filters() == {}
+
+
+class TestManifestFile:
+    """Tests for write_manifest() and read_manifest()."""
+
+    def test_roundtrip(self, built_con):
+        """A written manifest reads back unchanged."""
+        manifest = build_manifest(built_con, "json", [3], ["death"], ["patid"])
+        with tempfile.TemporaryDirectory() as output_dir:
+            write_manifest(output_dir, manifest)
+            assert read_manifest(output_dir) == manifest
+
+    def test_missing_manifest_raises(self):
+        """Reading a directory without a manifest raises ValueError."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            with pytest.raises(ValueError, match="No build manifest found"):
+                read_manifest(output_dir)
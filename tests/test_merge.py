@@ -0,0 +1,131 @@
+"""Tests for sharded builds and the merge step."""
+
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import polars as pl
+import pytest
+from typer.testing import CliRunner
+
+from scdm_prepare.cli import app
+from scdm_prepare.manifest import write_manifest
+from scdm_prepare.merge import read_shards, shard_offsets
+from scdm_prepare.schema import TABLES
+
+
+runner = CliRunner()
+
+
+def _write_shard_manifest(shard_dir: Path, subsamples: list[int], max_ids: dict[str, int]) -> None:
+    """Write a minimal parquet-build manifest for a shard directory."""
+    write_manifest(
+        shard_dir,
+        {
+            "format": "parquet",
+            "subsamples": subsamples,
+            "tables": {"death": {"rows": 1}},
+            "crosswalks": {key: {"max_id": max_id} for key, max_id in max_ids.items()},
+        },
+    )
+
+
+class TestShardOffsets:
+    """Tests for read_shards() and shard_offsets()."""
+
+    def test_offsets_are_prefix_sums_in_subsample_order(self):
+        """Shards are ordered by subsample and offset by the earlier shards' maxima."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dirs = [Path(tmpdir) / name for name in ("c", "a", "b")]
+            for shard_dir in dirs:
+                shard_dir.mkdir()
+            _write_shard_manifest(dirs[0], [5, 6], {"patid": 7})
+            _write_shard_manifest(dirs[1], [1, 2], {"patid": 10})
+            _write_shard_manifest(dirs[2], [3, 4], {"patid": 20})
+
+            shards = read_shards(dirs)
+
+            assert [shard_dir.name for shard_dir, _ in shards] == ["a", "b", "c"]
+            assert shard_offsets(shards) == [{}, {"patid": 10}, {"patid": 30}]
+
+    def test_overlapping_shards_rejected(self):
+        """Shards sharing a subsample cannot be merged."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dirs = [Path(tmpdir) / name for name in ("a", "b")]
+            for shard_dir in dirs:
+                shard_dir.mkdir()
+            _write_shard_manifest(dirs[0], [1, 2], {"patid": 10})
+            _write_shard_manifest(dirs[1], [2, 3], {"patid": 10})
+
+            with pytest.raises(ValueError, match="Shards overlap"):
+                read_shards(dirs)
+
+
+class TestShardedBuild:
+    """Shards built in separate processes merge to a single-host build."""
+
+    @pytest.mark.parametrize("fmt", ["parquet", "csv"])
+    def test_merge_matches_single_host_build(self, sample_parquet_dir, fmt):
+        """Merging shards 1 and 2-3 gives the same outputs as building 1-3."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            full_dir = tmpdir / "full"
+            merged_dir = tmpdir / "merged"
+            shard_dirs = [tmpdir / "shard_a", tmpdir / "shard_b"]
+
+            result = runner.invoke(app, common + ["--output", str(full_dir), "--format", fmt])
+            assert result.exit_code == 0, result.output
+
+            # Run both shards at once, each in its own process
+            shard_ranges = [["--last", "1"], ["--first", "2"]]
+            processes = [
+                subprocess.Popen(
+                    [sys.executable, "-c", "from scdm_prepare.cli import app; app()"]
+                    + common
+                    + ["--output", str(shard_dir), "--shard"]
+                    + shard_range,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                )
+                for shard_dir, shard_range in zip(shard_dirs, shard_ranges)
+            ]
+            for process in processes:
+                output, _ = process.communicate(timeout=120)
+                assert process.returncode == 0, output
+
+            merge_args = []
+            for shard_dir in reversed(shard_dirs):
+                merge_args += ["--merge", str(shard_dir)]
+            result = runner.invoke(
+                app, merge_args + ["--output", str(merged_dir), "--format", fmt]
+            )
+            assert result.exit_code == 0, result.output
+
+            for table_name in TABLES:
+                name = f"{table_name}.{fmt}"
+                if fmt == "parquet":
+                    merged = pl.read_parquet(merged_dir / name)
+                    assert merged.equals(pl.read_parquet(full_dir / name)), table_name
+                else:
+                    assert (merged_dir / name).read_bytes() == (full_dir / name).read_bytes(), table_name
+
+            merged_manifest = json.loads((merged_dir / "manifest.json").read_text())
+            full_manifest = json.loads((full_dir / "manifest.json").read_text())
+            assert merged_manifest == full_manifest
+
+    def test_shard_rejects_other_formats(self, sample_parquet_dir):
+        """Shards are always parquet."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--shard", "--format", "csv",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "always parquet" in result.output
@@ -0,0 +1,214 @@
+"""Tests for the pipeline DAG and its scheduler."""
+
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import duckdb
+import polars as pl
+import pytest
+
+from scdm_prepare.export import export_all
+from scdm_prepare.ingest import ingest_all
+from scdm_prepare.pipeline import Node, build_pipeline, run_dag, table_closure
+from scdm_prepare.schema import TABLES
+from scdm_prepare.transform import assemble_tables, build_crosswalks
+
+
+class TestRunDag:
+    """Tests for run_dag()."""
+
+    def test_dependencies_run_first(self):
+        """A node starts only after all of its dependencies have finished."""
+        order = []
+        nodes = [
+            Node("export", lambda: order.append("export"), ("assemble",)),
+            Node("assemble", lambda: order.append("assemble"), ("ingest_a", "ingest_b")),
+            Node("ingest_a", lambda: order.append("ingest_a")),
+            Node("ingest_b", lambda: order.append("ingest_b")),
+        ]
+        run_dag(nodes, workers=2)
+
+        assert order[-2:] == ["assemble", "export"]
+        assert sorted(order[:2]) == ["ingest_a", "ingest_b"]
+
+    def test_ready_nodes_do_not_wait_for_unrelated_nodes(self):
+        """A node runs while an unrelated, earlier-started node is still running."""
+        released = threading.Event()
+        results = []
+
+        def slow():
+            results.append(released.wait(timeout=10))
+
+        nodes = [
+            Node("slow", slow),
+            Node("fast", lambda: None),
+            Node("after_fast", released.set, ("fast",)),
+        ]
+        run_dag(nodes, workers=2)
+
+        assert results == [True]
+
+    def test_heavier_node_starts_first_among_equals(self):
+        """With one worker, ready nodes of equal priority run heaviest first."""
+        order = []
+        nodes = [
+            Node(name, lambda n=name: order.append(n), weight=weight)
+            for name, weight in [("small", 1), ("large", 100), ("medium", 10)]
+        ]
+        run_dag(nodes, workers=1)
+
+        assert order == ["large", "medium", "small"]
+
+    def test_group_limit_caps_concurrency(self):
+        """No more nodes of a limited group run at once than its limit."""
+        lock = threading.Lock()
+        running = {"export": 0, "other": 0}
+        peak = {"export": 0, "other": 0}
+
+        def step(group):
+            with lock:
+                running[group] += 1
+                peak[group] = max(peak[group], running[group])
+            time.sleep(0.05)
+            with lock:
+                running[group] -= 1
+
+        nodes = [
+            Node(f"{group}_{i}", lambda g=group: step(g), group=group)
+            for group in ("export", "other")
+            for i in range(3)
+        ]
+        run_dag(nodes, workers=4, limits={"export": 1})
+
+        assert peak["export"] == 1
+        assert peak["other"] > 1
+
+    def test_critical_path_starts_first(self):
+        """With one worker, the node with the most dependents runs first."""
+        order = []
+        nodes = [
+            Node("leaf", lambda: order.append("leaf")),
+            Node("root", lambda: order.append("root")),
+            Node("child_1", lambda: order.append("child_1"), ("root",)),
+            Node("child_2", lambda: order.append("child_2"), ("child_1",)),
+        ]
+        run_dag(nodes, workers=1)
+
+        assert order[0] == "root"
+
+    def test_failure_stops_dependents(self):
+        """An error is raised and nodes depending on the failed node never run."""
+        ran = []
+
+        def fail():
+            raise RuntimeError("boom")
+
+        nodes = [
+            Node("fail", fail),
+            Node("dependent", lambda: ran.append("dependent"), ("fail",)),
+        ]
+        with pytest.raises(RuntimeError, match="boom"):
+            run_dag(nodes, workers=2)
+        assert ran == []
+
+    def test_unknown_dependency_raises(self):
+        """Depending on a node that does not exist raises ValueError."""
+        with pytest.raises(ValueError, match="unknown node"):
+            run_dag([Node("a", lambda: None, ("missing",))])
+
+    def test_cycle_raises(self):
+        """A dependency cycle raises ValueError."""
+        nodes = [
+            Node("a", lambda: None, ("b",)),
+            Node("b", lambda: None, ("a",)),
+        ]
+        with pytest.raises(ValueError, match="cycle"):
+            run_dag(nodes)
+
+
+class TestTableClosure:
+    """Tests for table_closure()."""
+
+    def test_diagnosis_closure(self):
+        """Diagnosis needs the sources of its PatID, EncounterID and ProviderID crosswalks."""
+        inputs, crosswalks = table_closure(["diagnosis"])
+
+        assert inputs == ["demographic", "encounter", "diagnosis", "provider"]
+        assert crosswalks == ["patid", "encounterid", "providerid"]
+
+    def test_dispensing_and_demographic_closure(self):
+        """Dispensing keeps ProviderID as-is, so it needs only the PatID crosswalk."""
+        inputs, crosswalks = table_closure(["dispensing", "demographic"])
+
+        assert inputs == ["demographic", "dispensing"]
+        assert crosswalks == ["patid"]
+
+    def test_synthesised_table_closure(self):
+        """Facility needs only its crosswalk's source."""
+        assert table_closure(["facility"]) == (["facility"], ["facilityid"])
+
+    def test_unknown_table_raises(self):
+        """Unknown table names raise ValueError."""
+        with pytest.raises(ValueError, match="Unknown tables: claims"):
+            table_closure(["claims"])
+
+
+class TestBuildPipeline:
+    """Tests for build_pipeline()."""
+
+    def test_node_dependencies(self):
+        """Each node waits only for the inputs it actually reads."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            con = duckdb.connect(":memory:")
+            nodes = build_pipeline(con, output_dir, [1], output_dir, "parquet")
+            con.close()
+
+        depends_on = {node.name: set(node.depends_on) for node in nodes}
+        # ingest, assemble and export per table, plus one node per crosswalk
+        assert len(nodes) == 3 * len(TABLES) + 4
+        assert depends_on["crosswalk:patid"] == {"ingest:demographic"}
+        assert depends_on["assemble:death"] == {"ingest:death", "crosswalk:patid"}
+        assert depends_on["assemble:diagnosis"] == {
+            "ingest:diagnosis", "crosswalk:patid", "crosswalk:encounterid", "crosswalk:providerid",
+        }
+        assert depends_on["assemble:provider"] == {"crosswalk:providerid"}
+        assert depends_on["export:diagnosis"] == {"assemble:diagnosis"}
+
+    def test_selected_tables_prune_nodes(self):
+        """Only the selected tables and their closure get nodes."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            con = duckdb.connect(":memory:")
+            nodes = build_pipeline(con, output_dir, [1], output_dir, "parquet", tables=["death"])
+            con.close()
+
+        assert sorted(node.name for node in nodes) == [
+            "assemble:death", "crosswalk:patid", "export:death",
+            "ingest:death", "ingest:demographic",
+        ]
+
+    @pytest.mark.parametrize("engine", ["duckdb", "polars"])
+    def test_dag_matches_staged_build(self, sample_parquet_dir, engine):
+        """Running the DAG concurrently gives the same outputs as stage-by-stage."""
+        with tempfile.TemporaryDirectory() as staged_dir:
+            with tempfile.TemporaryDirectory() as dag_dir:
+                ingest_all(sample_parquet_dir, [1, 2, 3], staged_dir, file_ext=".parquet")
+                con = duckdb.connect(":memory:")
+                build_crosswalks(con, Path(staged_dir) / "_temp")
+                assemble_tables(con, Path(staged_dir) / "_temp")
+                export_all(con, list(TABLES), staged_dir, "parquet")
+                con.close()
+
+                con = duckdb.connect(":memory:")
+                nodes = build_pipeline(
+                    con, sample_parquet_dir, [1, 2, 3], dag_dir, "parquet",
+                    file_ext=".parquet", engine=engine,
+                )
+                run_dag(nodes, workers=4)
+                con.close()
+
+                for table_name in TABLES:
+                    staged = pl.read_parquet(Path(staged_dir) / f"{table_name}.parquet")
+                    dag = pl.read_parquet(Path(dag_dir) / f"{table_name}.parquet")
+                    assert dag.rows() == staged.rows(), table_name
@@ -1,5 +1,5 @@
 import pytest
-from scdm_prepare.schema import TABLES
+from scdm_prepare.schema import TABLES, ParquetSettings
 
 
 class TestSchemaDefinitions:
@@ -75,3 +75,14 @@ class TestSchemaDefinitions:
                     f"Table {table.name} column {col_name} has invalid join type "
                     f"'{join_type}'. Must be 'inner' or 'left'."
                 )
+
+
+class TestParquetSettings:
+    def test_override_replaces_only_set_fields(self):
+        """Settings that the override leaves as None keep the preset's value."""
+        preset = ParquetSettings(row_group_size=245_760, compression_level=3)
+        merged = preset.override(ParquetSettings(compression_level=19, bloom_filter_fpp=0.001))
+        assert merged == ParquetSettings(
+            row_group_size=245_760, compression_level=19, bloom_filter_fpp=0.001
+        )
+        assert preset.override(None) is preset
@@ -0,0 +1,107 @@
+"""Tests for building several subsample-range targets from one ingest."""
+
+import json
+import tempfile
+from pathlib import Path
+
+import duckdb
+import polars as pl
+import pytest
+from typer.testing import CliRunner
+
+from scdm_prepare.cli import app
+from scdm_prepare.schema import CROSSWALKS, TABLES
+from scdm_prepare.targets import parse_ranges
+
+
+runner = CliRunner()
+
+
+class TestParseRanges:
+    """Tests for parse_ranges()."""
+
+    def test_ranges_and_single_subsamples(self):
+        """Ranges and single numbers parse in order, without duplicates."""
+        assert parse_ranges("1-5, 1-10,7,1-5") == [(1, 5), (1, 10), (7, 7)]
+
+    @pytest.mark.parametrize("spec", ["1-", "a-3", "5-1", ""])
+    def test_invalid_ranges_raise(self, spec):
+        """Malformed or backwards ranges raise ValueError."""
+        with pytest.raises(ValueError, match="Invalid subsample range"):
+            parse_ranges(spec)
+
+
+class TestRangeTargets:
+    """Each --ranges target matches a separate build of that range."""
+
+    @pytest.mark.parametrize("fmt", ["parquet", "csv"])
+    def test_targets_match_separate_builds(self, sample_parquet_dir, fmt):
+        """Targets 1-1, 1-3 and 2-3 from one ingest equal three separate builds."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--format", fmt]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            result = runner.invoke(
+                app, common + ["--output", str(tmpdir / "batch"), "--ranges", "1-1,1-3,2-3"]
+            )
+            assert result.exit_code == 0, result.output
+            assert not (tmpdir / "batch" / "_temp").exists()
+
+            for first, last in [(1, 1), (1, 3), (2, 3)]:
+                separate_dir = tmpdir / f"separate_{first}_{last}"
+                result = runner.invoke(
+                    app,
+                    common + ["--output", str(separate_dir), "--first", str(first), "--last", str(last)],
+                )
+                assert result.exit_code == 0, result.output
+
+                target_dir = tmpdir / "batch" / f"{first}-{last}"
+                for table_name in TABLES:
+                    name = f"{table_name}.{fmt}"
+                    if fmt == "parquet":
+                        target = pl.read_parquet(target_dir / name)
+                        assert target.equals(pl.read_parquet(separate_dir / name)), (first, last, table_name)
+                    else:
+                        assert (target_dir / name).read_bytes() == (separate_dir / name).read_bytes(), (
+                            first, last, table_name,
+                        )
+
+                target_manifest = json.loads((target_dir / "manifest.json").read_text())
+                separate_manifest = json.loads((separate_dir / "manifest.json").read_text())
+                assert target_manifest == separate_manifest
+
+    def test_database_target_matches_separate_build(self, sample_parquet_dir):
+        """A duckdb target holds the tables and shifted crosswalks of a build of its range."""
+        common = ["--input", str(sample_parquet_dir), "--file-ext", ".parquet", "--format", "duckdb"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            result = runner.invoke(app, common + ["--output", str(tmpdir / "batch"), "--ranges", "2-3"])
+            assert result.exit_code == 0, result.output
+            result = runner.invoke(
+                app, common + ["--output", str(tmpdir / "separate"), "--first", "2", "--last", "3"]
+            )
+            assert result.exit_code == 0, result.output
+
+            target = duckdb.connect(str(tmpdir / "batch" / "2-3" / "scdm.duckdb"), read_only=True)
+            separate = duckdb.connect(str(tmpdir / "separate" / "scdm.duckdb"), read_only=True)
+            try:
+                names = list(TABLES) + [cw.crosswalk_name for cw in CROSSWALKS.values()]
+                for name in names:
+                    query = f"SELECT * FROM {name}"
+                    assert target.execute(query).pl().equals(separate.execute(query).pl()), name
+            finally:
+                target.close()
+                separate.close()
+
+    def test_ranges_exclude_first_and_last(self, sample_parquet_dir):
+        """--ranges cannot be combined with --first/--last."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = runner.invoke(
+                app,
+                [
+                    "--input", str(sample_parquet_dir), "--file-ext", ".parquet",
+                    "--output", output_dir, "--format", "parquet",
+                    "--ranges", "1-2", "--first", "1",
+                ],
+            )
+            assert result.exit_code == 1
+            assert "--ranges cannot be combined" in result.output
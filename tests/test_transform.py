@@ -1,3 +1,4 @@
+import datetime
 import tempfile
 from pathlib import Path
 
@@ -5,6 +6,7 @@ import duckdb
 import polars as pl
 import pytest
 
+from scdm_prepare.ingest import ingest_all, ingest_table
 from scdm_prepare.schema import TABLES
 from scdm_prepare.transform import assemble_tables, build_crosswalks, get_crosswalk, synthesise_tables
 
@@ -1526,3 +1528,175 @@ class TestTableSortOrder:
                 )
 
             con.close()
+
+
+def _write_multi_subsample_claims(tmpdir_path: Path, subsamples: list[int]) -> None:
+    """Write demographic and diagnosis sources with several rows per patient.
+
+    Diagnosis rows are written in a scrambled order with repeated PatIDs and
+    dates, so the assembled table depends on the sort rather than on input order.
+
+    Args:
+        tmpdir_path: Directory to write parquet files to
+        subsamples: Subsample numbers to write
+    """
+    patients = ["P05", "P01", "P04", "P02", "P03"]
+    for samplenum in subsamples:
+        pl.DataFrame(
+            {
+                "PatID": patients,
+                "Birth_Date": [None] * 5,
+                "Sex": ["M", "F", "M", "F", "M"],
+                "Hispanic": ["N"] * 5,
+                "Race": ["W"] * 5,
+                "PostalCode": ["12345"] * 5,
+                "PostalCode_Date": [None] * 5,
+                "ImputedRace": ["N"] * 5,
+                "ImputedHispanic": ["N"] * 5,
+                "samplenum": [samplenum] * 5,
+            }
+        ).write_parquet(str(tmpdir_path / f"demographic_{samplenum}.parquet"))
+
+        n = 40
+        pl.DataFrame(
+            {
+                "PatID": [patients[(i * 3) % 5] for i in range(n)],
+                "EncounterID": [f"E{i % 7}" for i in range(n)],
+                "ADate": [datetime.date(2009, 1 + (i * 5) % 12, 1) for i in range(n)],
+                "ProviderID": ["Pr1"] * n,
+                "EncType": ["IP"] * n,
+                "DX": [f"DX{samplenum}{i:02d}" for i in range(n)],
+                "Dx_Codetype": ["09"] * n,
+                "OrigDX": [f"DX{samplenum}{i:02d}" for i in range(n)],
+                "PDX": ["P"] * n,
+                "PAdmit": ["N"] * n,
+                "samplenum": [samplenum] * n,
+            }
+        ).write_parquet(str(tmpdir_path / f"diagnosis_{samplenum}.parquet"))
+
+
+class TestSliceAssembly:
+    """Tests for per-subsample slice assembly of PatID-major tables."""
+
+    @pytest.mark.parametrize("workers,buckets", [(1, 1), (3, 1), (1, 2), (3, 4)])
+    def test_slices_match_global_sort(self, workers, buckets):
+        """Per-subsample (and per-bucket) slices concatenate to the same result as a global ORDER BY."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            _write_multi_subsample_claims(tmpdir_path, [1, 2, 3])
+            _create_minimal_fixtures(tmpdir_path)
+
+            con = duckdb.connect(":memory:")
+            build_crosswalks(con, tmpdir_path)
+            assemble_tables(con, tmpdir_path, workers=workers, buckets=buckets)
+
+            result = con.sql("SELECT * FROM diagnosis").pl()
+            expected = con.sql(f"""
+                SELECT b.PatID, c.EncounterID, a.ADate, d.ProviderID, a.EncType,
+                       a.DX, a.Dx_Codetype, a.OrigDX, a.PDX, a.PAdmit
+                FROM read_parquet('{tmpdir_path}/diagnosis_*.parquet') AS a
+                INNER JOIN patid_crosswalk AS b
+                  ON a.PatID = b.orig_PatID AND a.samplenum = b.samplenum
+                LEFT JOIN encounterid_crosswalk AS c
+                  ON a.EncounterID = c.orig_EncounterID AND a.samplenum = c.samplenum
+                LEFT JOIN providerid_crosswalk AS d
+                  ON a.ProviderID = d.orig_ProviderID AND a.samplenum = d.samplenum
+                ORDER BY b.PatID, a.ADate
+            """).pl()
+
+            assert len(result) == 120
+            assert result.select("PatID", "ADate").equals(expected.select("PatID", "ADate"))
+            assert result.sort(result.columns).equals(expected.sort(expected.columns))
+
+            # Working slice tables are dropped after assembly
+            leftovers = con.sql(
+                "SELECT table_name FROM duckdb_tables() WHERE table_name LIKE '\\_%' ESCAPE '\\'"
+            ).fetchall()
+            assert leftovers == []
+
+            con.close()
+
+
+class TestConcurrentAssembly:
+    """Tests for concurrent assembly of independent tables."""
+
+    def test_concurrent_tables_match_sequential(self, sample_parquet_dir):
+        """Assembling tables concurrently produces the same tables as one worker."""
+        results = {}
+        with tempfile.TemporaryDirectory() as output_dir:
+            ingest_all(sample_parquet_dir, [1, 2, 3], output_dir, file_ext=".parquet")
+            temp_dir = Path(output_dir) / "_temp"
+            for workers in (1, 4):
+                con = duckdb.connect(":memory:")
+                build_crosswalks(con, temp_dir)
+                assemble_tables(con, temp_dir, workers=workers)
+                results[workers] = {
+                    table_name: con.sql(f"SELECT * FROM {table_name}").pl()
+                    for table_name in TABLES
+                }
+                con.close()
+
+        for table_name in TABLES:
+            assert results[4][table_name].equals(results[1][table_name]), table_name
+
+    def test_progress_reports_every_table(self, sample_parquet_dir):
+        """Every table is reported to the progress tracker exactly once."""
+
+        class RecordingTracker:
+            def __init__(self):
+                self.descriptions = []
+                self.advanced = 0
+
+            def update_description(self, description):
+                self.descriptions.append(description)
+
+            def advance(self, amount=1):
+                self.advanced += amount
+
+        tracker = RecordingTracker()
+        with tempfile.TemporaryDirectory() as output_dir:
+            ingest_all(sample_parquet_dir, [1, 2, 3], output_dir, file_ext=".parquet")
+            temp_dir = Path(output_dir) / "_temp"
+            con = duckdb.connect(":memory:")
+            build_crosswalks(con, temp_dir)
+            assemble_tables(con, temp_dir, progress=tracker, workers=3)
+            con.close()
+
+        assert tracker.advanced == len(TABLES)
+        assert sorted(tracker.descriptions) == sorted(f"Transforming {name}" for name in TABLES)
+
+
+class TestPresortedAssembly:
+    """Tests for assembly of sources that ingest recorded as sorted."""
+
+    @pytest.mark.parametrize("engine", ["duckdb", "polars"])
+    def test_presorted_sources_assemble_in_sort_order(self, engine):
+        """Known-sorted sources produce the same table as sorting on the keys."""
+        with tempfile.TemporaryDirectory() as input_dir:
+            with tempfile.TemporaryDirectory() as output_dir:
+                input_path = Path(input_dir)
+                _write_multi_subsample_claims(input_path, [1, 2])
+                # Store diagnosis sorted, as SAS does; subsample 2 stays scrambled
+                sorted_path = input_path / "diagnosis_1.parquet"
+                pl.read_parquet(str(sorted_path)).sort("PatID", "ADate").write_parquet(str(sorted_path))
+
+                ingest_table(input_path, "demographic", [1, 2], output_dir, file_ext=".parquet")
+                ingest_table(input_path, "diagnosis", [1, 2], output_dir, file_ext=".parquet")
+                temp_dir = Path(output_dir) / "_temp"
+                _create_minimal_fixtures(temp_dir)
+
+                con = duckdb.connect(":memory:")
+                build_crosswalks(con, temp_dir)
+                assemble_tables(con, temp_dir, engine=engine)
+
+                result = con.sql("SELECT * FROM diagnosis").pl()
+                assert len(result) == 80
+                assert result.select("PatID", "ADate").equals(
+                    result.select("PatID", "ADate").sort("PatID", "ADate")
+                )
+                # Stable within ties: subsample 1 keeps its stored row order
+                first_slice = result.filter(pl.col("DX").str.starts_with("DX1"))
+                expected_dx = pl.read_parquet(str(sorted_path))["DX"].to_list()
+                assert first_slice["DX"].to_list() == expected_dx
+
+                con.close()
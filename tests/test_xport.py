@@ -0,0 +1,78 @@
+import datetime
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyreadstat
+import pytest
+
+from scdm_prepare.xport import XportVariable, _ibm_floats, write_xport, xport_variables
+
+
+class TestIbmFloats:
+    """Tests for the IEEE to IBM double conversion."""
+
+    def test_known_encodings(self):
+        """Values encode as in published IBM System/360 tables; NaN is SAS's missing value."""
+        values = np.array([1.0, -1.0, 0.5, 100.0, 18263.0, 0.0, -0.0, np.nan])
+        assert [hex(value) for value in _ibm_floats(values)] == [
+            "0x4110000000000000",
+            "0xc110000000000000",
+            "0x4080000000000000",
+            "0x4264000000000000",
+            "0x4447570000000000",
+            "0x0",
+            "0x0",
+            "0x2e00000000000000",
+        ]
+
+    def test_overflow(self):
+        """IBM doubles top out near 7.2e75."""
+        with pytest.raises(ValueError, match="too large"):
+            _ibm_floats(np.array([1e100]))
+
+
+class TestWriteXport:
+    """Tests for write_xport()."""
+
+    def test_round_trip_through_pyreadstat(self):
+        """Numbers, dates, timestamps and text read back, with the observation count filled in."""
+        table = pa.table({
+            "PatID": pa.array([1, None, -3], pa.int64()),
+            "Discharge_Disposition": ["A", None, "é"],
+            "ADate": [datetime.date(2010, 1, 1), None, datetime.date(1900, 5, 5)],
+            "RxAmt": [0.5, 123456.789, None],
+            "Stamp": pa.array([datetime.datetime(2020, 1, 1, 1, 2, 3)] * 3, pa.timestamp("us")),
+        })
+        variables = xport_variables(table.schema, {"Discharge_Disposition": 2})
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "encounter.xpt"
+            assert write_xport(path, "encounter", variables, [table.to_batches(max_chunksize=2)]) == 3
+            assert path.stat().st_size % 80 == 0
+
+            df, metadata = pyreadstat.read_xport(str(path), output_format="polars")
+            assert metadata.table_name == "encounter"
+            assert metadata.number_rows == 3
+            assert metadata.variable_storage_width["Discharge_Disposition"] == 2
+            assert metadata.original_variable_types["ADate"] == "DATE9"
+            assert df["PatID"].to_list() == [1.0, None, -3.0]
+            assert df["Discharge_Disposition"].to_list() == ["A", "", "é"]
+            assert df["ADate"].to_list() == [datetime.date(2010, 1, 1), None, datetime.date(1900, 5, 5)]
+            assert df["RxAmt"].to_list() == [0.5, 123456.789, None]
+            assert df["Stamp"].to_list() == [datetime.datetime(2020, 1, 1, 1, 2, 3)] * 3
+
+    def test_value_longer_than_variable(self):
+        """Text is never silently truncated."""
+        table = pa.table({"DX": ["I10", "E11.9"]})
+        variables = [XportVariable("DX", False, 3)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with pytest.raises(ValueError, match="longer than its 3 bytes"):
+                write_xport(Path(tmpdir) / "diagnosis.xpt", "diagnosis", variables, [table.to_batches()])
+
+    def test_unsupported_type(self):
+        """Columns without a SAS equivalent are rejected."""
+        schema = pl.DataFrame({"codes": [["a"]]}).to_arrow().schema
+        with pytest.raises(ValueError, match="No SAS type for column codes"):
+            xport_variables(schema, {})